@@ -8,7 +8,8 @@ from mitsfs.dex.series import Series, munge_series, sanitize_series
 from mitsfs.dex.titles import Title, sanitize_title, check_for_leading_article
 from mitsfs.dex.authors import Author, sanitize_author
 from mitsfs.dex.books import Book
-from mitsfs.util import utils, exceptions, selecters, tex, ui
+from mitsfs.dex import export
+from mitsfs.util import utils, exceptions, selecters, ui
 
 
 title = None
@@ -147,7 +148,7 @@ def main_menu(line):
         titles = []
         while not titles:
             name = ui.read('Enter a title: ',
-                           complete=library.catalog.titles.complete).upper()
+                           complete=library.completion.complete_title).upper()
             if not name:
                 continue
 
@@ -225,7 +226,7 @@ def main_menu(line):
             if titles:
                 blank = ' (blank to finish)'
             name = ui.read(f'Enter a title{blank}: ',
-                           complete=library.catalog.titles.complete).upper()
+                           complete=library.completion.complete_title).upper()
             if not name:
                 continue
 
@@ -539,7 +540,7 @@ def book_menu(line):
 
         new_title = sanitize_title(
             ui.read('Enter a new title: ', preload=old_title,
-                    complete=library.catalog.titles.complete)).upper()
+                    complete=library.completion.complete_title)).upper()
         if not title:
             book_header()
             print("Title can't be blank")
@@ -547,7 +548,7 @@ def book_menu(line):
 
         new_alt = sanitize_title(
             ui.read('Enter a new sort title (if any): ', preload=old_alt,
-                    complete=library.catalog.titles.complete)).upper() \
+                    complete=library.completion.complete_title)).upper() \
             or None
 
         title.update_title(old_title, new_title, new_alt)
@@ -602,7 +603,7 @@ def advanced_edit(line):
         titles = []
         while True:
             name = ui.read('Enter a title (blank to finish): ',
-                           complete=library.catalog.titles.complete).upper()
+                           complete=library.completion.complete_title).upper()
             if not name:
                 break
 
@@ -784,63 +785,20 @@ def export_menu(line):
         no_book_header()
         print('Export to Text')
         path = selecters.select_safe_filename(preload='dexPlainText.txt')
-        fp = open(path, 'w')
-
-        print("Fetching...")
-        titles = library.catalog.titles.book_titles()
-        print('Sorting...')
-        titles.sort(key=lambda x: x.sortkey())
-        print('Writing...')
-        for title in titles:
-            try:
-                fp.write(str(title) + "\n")
-            except exceptions.InvalidShelfcode:
-                print(f'BAD SHELFCODE: {title.titles}')
-                continue
-            except Exception:
-                print(f'Problematic: {title.titles}')
-                continue
 
-        fp.close()
+        snapshot = library.snapshot
+        snapshot.refresh()
+        export.export(snapshot, [export.TextWriter(path)], progress=print)
         print(f'Exported the text dex to {path}')
 
     def export_dex(line):
         no_book_header()
         print('Export to Dex')
         path = selecters.select_safe_filename(preload='pinkdex.tex')
-        fp = open(path, 'w')
-
-        fp.write(tex.tex_header('Pinkdex'))
-        print("Fetching...")
-        titles = library.catalog.titles.book_titles()
-        print('Sorting...')
-        titles.sort(key=lambda x: x.sortkey())
-        print('Writing...')
-
-        letter = None
-
-        for title in titles:
-            newletter = None
-            if (len(getattr(title, 'placeauthor')) > 0):
-                newletter = getattr(title, 'placeauthor').upper()[0]
-
-            if letter != newletter:
-                if letter is not None:
-                    fp.write(r'\NextLetter' + "\n")
-                letter = newletter
-                print(letter)
-                sys.stdout.flush()
-            try:
-                fp.write('\\Book{%s}{%s}{%s}\n' % (
-                    tex.texquote(title.authortxt),
-                    tex.texquote(tex.nicetitle(title)),
-                    tex.texquote(str(title.codes).replace(':', r'\:'))))
-            except Exception:
-                print(f'Problematic: {title.titles}')
-                continue
 
-        fp.write(tex.tex_footer())
-        fp.close()
+        snapshot = library.snapshot
+        snapshot.refresh()
+        export.export(snapshot, [export.TexWriter(path)], progress=print)
         print('done.')
 
     def export_shelf(line):
@@ -851,28 +809,31 @@ def export_menu(line):
         file_code = re.sub('/', '_', shelfcode.code)
         path = selecters.select_safe_filename(
             preload=f'pinkdex_{file_code}.tex')
-        fp = open(path, 'w')
 
-        print("Fetching...")
-        titles = library.catalog.titles.book_titles(shelfcode=shelfcode)
-        print('Sorting...')
-        titles.sort(key=lambda x: x.shelfkey(shelfcode.code))
-        print('Writing...')
-        
-        fp.write(tex.tex_header('Shelfdex', shelfcode.code))
-
-        for title in titles:
-            count = int(title.codes[shelfcode.code])
-
-            fp.write('\\Book{%s}{%s}{%s} %% %s' % (
-                tex.texquote(title.authortxt),
-                tex.texquote(tex.nicetitle(title)),
-                count, str(title)))
-            fp.write("\n")
-        fp.write(tex.tex_footer())
-        fp.close()
+        library.catalog.export(
+            [export.ShelfWriter(path, shelfcode)], progress=print)
         print('done.')
 
+    def export_all(line):
+        no_book_header()
+        print('Export Everything')
+        path = f'{settings.EXPORT_DIRECTORY}/dex_{utils.timestamp()}'
+        os.makedirs(path)
+
+        writers = [
+            export.TextWriter(f'{path}/dexPlainText.txt'),
+            export.TexWriter(f'{path}/pinkdex.tex'),
+            ]
+        for shelfcode in library.shelfcodes.values():
+            file_code = re.sub('/', '_', shelfcode.code)
+            writers.append(export.ShelfWriter(
+                f'{path}/pinkdex_{file_code}.tex', shelfcode))
+
+        snapshot = library.snapshot
+        snapshot.refresh()
+        export.export(snapshot, writers, progress=print)
+        print(f'Exported everything to {path}')
+
     no_book_header()
 
     recursive_menu([
@@ -880,6 +841,7 @@ def export_menu(line):
         ('T', 'Export Text Dex', export_text),
         ('D', 'Export Full Dex', export_dex),
         ('S', 'Export Shelfcode', export_shelf),
+        ('A', 'Export Everything', export_all),
         ('Q', 'Back to Main Menu', None),
         ], title='Edit Book')
 
@@ -7,10 +7,11 @@ import datetime
 from mitsfs.circulation import members
 from mitsfs.circulation.transactions import get_transactions, \
     Transaction, CashTransaction
-from mitsfs.circulation.checkouts import Checkouts
+from mitsfs.circulation.vgg import VGGReport
 
 from mitsfs import library
 from mitsfs.core import settings
+from mitsfs.dex import filters
 from mitsfs.util import ui, selecters
 
 __release__ = '1.1'
@@ -68,16 +69,17 @@ def member_header(member, title='Member Menu'):
     # membership status. We get the left justification here by calculating
     # length of the fields and padding the rest. Don't forget to strip
     # out any ansi terminal colors!
+    summary = member.summary()
     name_len = ui.len_color_str(member)
-    membership_head = 'Membership: ' + (member.membership.description 
-                                        if member.membership else 'None')
+    membership_head = 'Membership: ' + (summary.membership_description
+                                        if summary.membership else 'None')
     membership_head_len = len(membership_head)
     keyholder = f' ({member.key_initials})' if member.key_initials else ''
     spaces = ' ' * max(1, width - name_len -
                        membership_head_len - len(keyholder))
     print(f'{member}{keyholder}{spaces}{membership_head}')
 
-    books_out = len(member.checkout_history.out)
+    books_out = len(summary.out)
     match books_out:
         case 0:
             books_out = "No books out"
@@ -89,9 +91,9 @@ def member_header(member, title='Member Menu'):
     # second row contains the financial balance, books out and member expiry
     # We center the books out by calculating the length of the spacing in the
     # middle, then putting the books in that
-    balance = ui.money_str(member.balance)
+    balance = ui.money_str(summary.balance)
     balance_len = len('Balance: ') + ui.len_color_str(balance)
-    expiration= member.membership.expiry if member.membership else ''
+    expiration = summary.membership.expiry if summary.membership else ''
     expiry_len = ui.len_color_str(expiration)
     spaces = max(1, width - balance_len - expiry_len)
     print(f'Balance: {balance}{books_out:^{spaces}}{expiration}')
@@ -122,7 +124,8 @@ def main_menu(line):
         Select a user to work with in the user menus
         '''
         global member
-        member = ui.specify_member(library.members, line)
+        member = ui.specify_member(
+            library.members, line, library.completion.complete_name)
         if member:
             member_menu(line)
         no_member_header()
@@ -141,8 +144,7 @@ def main_menu(line):
                 titlecomplete=library.catalog.titles.complete_checkedout,
                 # TODO: this isn't currently working for books that are
                 # withdrawn while checked out
-                title_predicate=lambda title: title.checkedout,
-                book_predicate=lambda book: book.out
+                book_filter=filters.OUT,
                 )
 
             if not book:
@@ -281,26 +283,15 @@ def member_menu(line):
 
             # Only select from circulating books unless we're using nonstandard
             if advanced or member.pseudo:
-                def title_predicate(title):
-                    return any(book for book in title.books if not book.out)
-
-                def book_predicate(book):
-                    return not book.out
+                book_filter = filters.IN
             else:
-                def title_predicate(title):
-                    return any(
-                        book for book in title.books
-                        if (not book.out and book.circulating))
-
-                def book_predicate(book):
-                    return not book.out and book.circulating
+                book_filter = filters.IN & filters.CIRCULATING
 
             print("Check out books for member", str(member))
             print()
             book = ui.specify_book(
                 library,
-                title_predicate=title_predicate,
-                book_predicate=book_predicate,
+                book_filter=book_filter,
             )
 
             if not book:
@@ -422,7 +413,7 @@ def member_menu(line):
             ('L', 'Declare Book Lost', lost),
             ('V', 'View Member', viewmem),
             ('E', 'Edit Member and Membership', editmem)]
-        if member.balance < 0:
+        if member.summary().balance < 0:
             menu.append(('P', 'Pay Outstanding Fines', pay_fines))
         menu.append(('F', 'Financial Transaction', financial))
         menu.append(('Q', 'Unselect Member', unselect))    
@@ -643,7 +634,8 @@ def starchamber(line):
 
     def merge(line):
         print('User entry that is merging with this one')
-        other = ui.specify_member(library.members, line)
+        other = ui.specify_member(
+            library.members, line, library.completion.complete_name)
         if other is None:
             return
         if other.id == member.id:
@@ -925,14 +917,18 @@ def admin(line):
         List all the overdue books
         '''
         no_member_header()
-        checkouts = Checkouts(library.db)
-        overdue_books = checkouts.vgg()
-        for email, name, overdue in overdue_books:
-            print(name, '<' + email + '>')
-            for stamp, code, title in overdue:
-                print('', stamp, code, title)
-        if not overdue_books:
+        report = VGGReport(library.db)
+        for report_line in report.lines():
+            print(report_line)
+        if not report:
             print("No books are overdue. Well done!")
+            return
+        if ui.readyes(
+                'Write reminder emails? [' + ui.Color.yN + '] '):
+            path = selecters.select_safe_filename(preload='vgg.mbox')
+            print(f'Wrote {report.write_mbox(path)} reminders to {path}')
+        print(', '.join(
+            f'{name} {seconds:.2f}s' for (name, seconds) in report.timings))
 
     no_member_header()
     menu = [
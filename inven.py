@@ -1,13 +1,11 @@
 import os
 import sys
-import math
-from collections import defaultdict
 
 from mitsfs import library
 from mitsfs.core import settings
-from mitsfs.dex.inventory import Inventories
+from mitsfs.dex import export, filters
+from mitsfs.dex.inventory import Inventories, SectionScan
 from mitsfs.util import selecters, ui
-from mitsfs.util import tex
 
 shelfcode = None
 
@@ -56,14 +54,10 @@ def shelfcode_header(header='Shelfcode Menu'):
     print(f'{header:-^{width}}')
 
     # first row contains Shelfcode and progress
-    total = 0
-    complete = 0
-    
-    for section in library.inventory.sections.get(shelfcode):
-        total += 1
-        if section.complete:
-            complete += 1
-    
+    progress = library.inventory.progress()
+    complete, total, missing = progress.shelfcodes.get(
+        shelfcode.code, (0, 0, 0))
+
     summary = f'{complete}/{total}'
     if total == complete:
         summary = ui.Color.good(summary)
@@ -76,7 +70,6 @@ def shelfcode_header(header='Shelfcode Menu'):
     print(f'{name}{spaces}{summary}')
 
     # second row contains the number of missing books
-    missing = len(library.inventory.get_missing_books(shelfcode))
     second_line = f'{missing} missing'
     spaces = ' ' * max(1, width - len(second_line))
     print(f'{spaces}{second_line}')
@@ -125,51 +118,17 @@ def main_menu(line):
     def generate_files(line):
         '''
         Generate the shelf files needed to do this inventory. Writes them
-        all into /tmp/inventory/<inventory_id>
+        all into /tmp/inventory/<inventory_id>, from the sections worked out
+        when the inventory was opened, a shelfcode per worker process.
 
         '''
         path = f'/tmp/inventory/{library.inventory.id}'
         if not os.path.exists(path):
             os.makedirs(path)
 
-        for shelfcode in library.shelfcodes.values():
-            sections = library.inventory.sections.get(shelfcode)          
-            print(f'Fecthing {shelfcode.code}...')
-            titles = library.catalog.titles.book_titles(shelfcode=shelfcode)
-            if not titles:
-                print(f'No books for {shelfcode.code}. Continuing...')
-                continue
-            print('Sorting...')
-            titles.sort(key=lambda x: x.shelfkey(shelfcode.code))
-            titles_per_section = math.ceil(len(titles)/len(sections))
-            
-            count = 0
-            section = 0
-            fp = None
- 
-            for title in titles:
-                if count % titles_per_section == 0:
-                    if fp:
-                        fp.write(tex.tex_footer())
-                        fp.close()
-                    section += 1
-                    sc = shelfcode.code.replace('/', '_')
-                    fp = open(f'{path}/{sc}_{section}.tex', 'w')            
-                    print(f'Writing {sc}_{section}...')
-                    
-                    fp.write(tex.tex_header(
-                        'Invendex',
-                        f'{shelfcode.code} section {section}'))               
-                
-                shelfcount = int(title.codes[shelfcode.code])
-                fp.write('\\Book{%s}{%s}{%s} %% %s' % (
-                    tex.texquote(title.authortxt),
-                    tex.texquote(tex.nicetitle(title)),
-                    shelfcount, str(title)))
-                fp.write("\n")
-                count += 1
-            fp.write(tex.tex_footer())
-            fp.close()
+        export.parallel_inventory_files(
+            library.inventory, library.shelfcodes.values(), path,
+            progress=print)
 
     
     def stats(line):
@@ -179,27 +138,21 @@ def main_menu(line):
         '''
         no_shelfcode_header()
         header = ('shelfcode', 'progress', 'missing count')
-        total = defaultdict(int)
-        complete = defaultdict(int)
-        stats= []
-        
-        for section in library.inventory.sections.get():
-            total[section.shelfcode] += 1
-            if section.complete:
-                complete[section.shelfcode] += 1
-        
-        missing = dict(library.inventory.stats())
-        
-        for section in total.keys():
-            summary = f'{complete.get(section, 0)}/{total[section]}'
-            if total[section] == complete.get(section, 0):
+        stats = []
+
+        progress = library.inventory.progress()
+        for code, (complete, total, missing) in progress.shelfcodes.items():
+            summary = f'{complete}/{total}'
+            if total == complete:
                 summary = ui.Color.good(summary)
             else:
                 summary = ui.Color.warning(summary)
 
-            stats.append((section, summary, missing.get(section, 0)))
+            stats.append((code, summary, missing))
 
         print(ui.tabulate([header] + sorted(stats, key=lambda x: x[0])))
+        print(f'{progress.done}/{progress.total} sections done,'
+              f' {progress.missing} missing')
     
     def close_inventory(line):
         '''
@@ -208,18 +161,18 @@ def main_menu(line):
         '''
         no_shelfcode_header()
         incomplete = [f'{section.shelfcode}_{section.section}' 
-                      for section in library.inventory.sections.get()
+                      for section in library.inventory.progress().get()
                       if not section.complete]
         if incomplete:
             print(ui.Color.warning(
                 'The following sections have not been marked complete: ' +
                 ' '.join(incomplete)))
         if ui.readyes("Confirm that inventory is complete? [yN]: "):
-            inv = library.inventory
-            inv.close()
+            withdrawn = library.inventory.close()
             no_shelfcode_header()
-            for book in inv.get_missing_books():
-                print (ui.Color.warning(f'{book} withdrawn'))
+            for code, book in withdrawn:
+                print(ui.Color.warning(f'{book} withdrawn'))
+            print(f'{len(withdrawn)} books withdrawn')
             # returning an explicit False lets us go up a menu level
             return False 
         
@@ -246,9 +199,6 @@ def shelfcode_menu(line):
     Working on a specific shelfcode - checking out, completing, losing and
     finding books...
     '''
-    def book_predicate(book):
-        return book.shelfcode == shelfcode
-
     def missing(line):
         '''
         Mark a book in the library missing.
@@ -256,11 +206,18 @@ def shelfcode_menu(line):
         shelfcode_header()
         print('Report Book Missing')
         while True:
-            book = ui.specify_book(library, book_predicate=book_predicate)
+            book = ui.specify_book(
+                library, book_filter=filters.in_shelfcode(shelfcode))
             if not book:
                 break
             library.inventory.report_missing_book(book)
-            print(f'{book} marked missing')
+            where = library.inventory.sections.section_of(book)
+            if where:
+                print(f'{book} marked missing (section {where[1]})')
+            else:
+                print(ui.Color.warning(
+                    f'{book} marked missing, but it wasn\'t on the shelves'
+                    ' when the inventory was opened'))
         shelfcode_header()
         
     def found(line):
@@ -277,13 +234,11 @@ def shelfcode_menu(line):
                 return
     
             if len(options) > 20:
-                author = selecters.select_author(library, 
-                                                 create=False, single=True)
-                if author:
-                    #TODO: use author ids here
-                    options = [book for book in options 
-                               if str(author) in book.authors]
-            book = selecters.select_generic(options)
+                book = ui.specify_book(
+                    library, book_filter=filters.missing(
+                        library.inventory, shelfcode))
+            else:
+                book = selecters.select_generic(options)
             if not book:
                 break
             library.inventory.find_book(book)
@@ -305,21 +260,61 @@ def shelfcode_menu(line):
                           ' been claimed by {i.out_to}.')
                     if not ui.readyes('Take over? [yN] '):
                         return
-        member = ui.specify_member(library.members)
+        member = ui.specify_member(
+            library.members, complete=library.completion.complete_name)
         library.inventory.sections.checkout_section(shelfcode, section, member)
         shelfcode_header()
         print(f'{shelfcode.code} section {section} assigned to {member}')
         
+    def scan_section(line):
+        '''
+        Inventory a section with a barcode scanner: scan everything on the
+        shelves, then record whatever wasn't scanned as missing.
+        '''
+        sections = library.inventory.progress().get(shelfcode)
+        shelfcode_header()
+        section = ui.readnumber(f'Enter the {shelfcode} section: ',
+                                1, len(sections) + 1)
+        if section is None:
+            return
+        scan = SectionScan(library.inventory, shelfcode, section)
+        print(f'{len(scan.expected)} books expected.'
+              ' Scan them, then a blank line to finish.')
+        while True:
+            identifier = ui.read('Scan: ')
+            if not identifier:
+                break
+            if not scan.scan(identifier):
+                print(ui.Color.warning(
+                    f'{identifier} is not in this section'))
+        print(f'{len(scan.scanned)} scanned, {len(scan.missing)} missing,'
+              f' {len(scan.unexpected)} unexpected')
+        if not ui.readyes(
+                'Complete the section and record the missing books? [yN] '):
+            shelfcode_header()
+            return
+        strays = scan.complete()
+        shelfcode_header()
+        print(f'{shelfcode.code} section {section} complete,'
+              f' {len(scan.missing)} missing')
+        for identifier, place in strays:
+            if place:
+                print(f'{identifier} belongs in {place[0]}'
+                      f' section {place[1]}')
+            else:
+                print(ui.Color.warning(f'{identifier} is not a known book'))
+
     def status(line):
         '''
         Print the details about the status of each section of this shelfcode
         '''
         shelfcode_header()
-        print(ui.tabulate([(section.shelfcode, section.section, 
-                            'Done' if section.complete else 'Open', 
-                            section.out_to or '') 
-                           for section 
-                           in library.inventory.sections.get(shelfcode)]))
+        print(ui.tabulate([(section.shelfcode, section.section,
+                            'Done' if section.complete else 'Open',
+                            f'{section.missing}/{section.books} missing',
+                            section.member_name or '')
+                           for section
+                           in library.inventory.progress().get(shelfcode)]))
 
     def complete_section(line):
         '''
@@ -348,6 +343,7 @@ def shelfcode_menu(line):
         ('T', 'Take Section', take_section),
         ('S', 'Show Status', status),
         ('C', 'Complete Section', complete_section),
+        ('B', 'Scan Section', scan_section),
         ('Q', 'Back to Main Menu', None),
         ], title='Shelfcode Updates')
 
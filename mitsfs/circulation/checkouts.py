@@ -11,9 +11,83 @@ from mitsfs.circulation import transactions
 MAXDAYSOUT = 21
 
 
+def due_stamp(checkout_stamp):
+    '''
+    Parameters
+    ----------
+    checkout_stamp : datetime
+        when the book went out.
+
+    Returns
+    -------
+    datetime
+        3am on the morning after the last day it can be out.
+    '''
+    when = checkout_stamp + datetime.timedelta(days=MAXDAYSOUT)
+    due = datetime.datetime(when.year, when.month, when.day, 3, 0, 0, 0)
+    if when.hour >= 3:
+        due += datetime.timedelta(days=1)
+    return due
+
+
+def warp_due(due):
+    '''
+    Move a due stamp past any timewarps it falls into.
+    '''
+    if settings.timewarps_global:
+        return settings.timewarps_global.warp_date(due)
+    return due
+
+
+def overdue_fines(db, when=None, member_id=None):
+    '''
+    The due dates, overdue days and fines for every open checkout, worked
+    out in one pass over one query rather than a Checkout at a time.
+
+    Parameters
+    ----------
+    db : Database
+        The database to read from.
+    when : datetime, optional
+        when to count the days up to. Default is now.
+    member_id : int, optional
+        only this member's checkouts.
+
+    Returns
+    -------
+    list((int, int, int, datetime, int, float))
+        checkout_id, member_id, book_id, due stamp (after timewarps), days
+        overdue and the fine for that, oldest checkout first.
+    '''
+    if not when:
+        when = datetime.datetime.today()
+    sql = (
+        'select checkout_id, member_id, book_id, checkout_stamp'
+        ' from checkout'
+        ' where checkin_stamp is null and checkout_lost is null')
+    args = ()
+    if member_id:
+        sql += ' and member_id = %s'
+        args = (member_id,)
+    sql += ' order by checkout_stamp, checkout_id'
+
+    rows = db.getcursor().execute(sql, args).fetchall()
+    dues = [due_stamp(coercers.coerce_datetime_no_timezone(stamp))
+            for (_, _, _, stamp) in rows]
+    if settings.timewarps_global:
+        dues = settings.timewarps_global.warp_dates(dues)
+
+    results = []
+    for ((checkout_id, member_id, book_id, _), due) in zip(rows, dues):
+        days = max((when - due).days, 0)
+        results.append((checkout_id, member_id, book_id, due, days,
+                        transactions.overdue_fine(days)))
+    return results
+
+
 class Checkouts(list):
     def __init__(self, db, member_id=None,
-                 book_id=None, out=False, checkouts=[]):
+                 book_id=None, out=False, checkouts=[], book=None):
         '''
         Get a history of checkouts given the provided parameters. It is
         theoretically possible to use more than one of the inputs, but it's
@@ -27,6 +101,9 @@ class Checkouts(list):
              The id of the person
         book_id : int
             The id of the book
+        book : Book, optional
+            The book itself, instead of book_id, so checking it in through
+            these checkouts updates that object too.
 
         Returns
         -------
@@ -34,6 +111,9 @@ class Checkouts(list):
         '''
         super().__init__()
         c = db.getcursor()
+        if book is not None:
+            book_id = book.id
+        self.book = book
         self.book_id = book_id
         self.member_id = member_id
         self.db = db
@@ -42,17 +122,18 @@ class Checkouts(list):
             sql = 'select checkout_id from checkout where book_id = %s'
             if out:
                 sql += ' and checkin_stamp is null'
-            c_ids = c.fetchlist(sql, (book_id,))
-            for c_id in c_ids:
-                self.append(Checkout(self.db, checkout_id=c_id))
+            self.extend(Checkout.load_many(
+                self.db, c.fetchlist(sql, (book_id,))))
+            if book is not None:
+                for checkout in self:
+                    checkout._book = book
 
         if member_id:
             sql = 'select checkout_id from checkout where member_id = %s'
             if out:
                 sql += ' and checkin_stamp is null'
-            c_ids = c.fetchlist(sql, (member_id,))
-            for c_id in c_ids:
-                self.append(Checkout(self.db, checkout_id=c_id))
+            self.extend(Checkout.load_many(
+                self.db, c.fetchlist(sql, (member_id,))))
 
         for x in checkouts:
             self.append(x)
@@ -61,6 +142,7 @@ class Checkouts(list):
         c = Checkouts(self.db, checkouts=checkouts)
 
         # have to set these separately, or they'd trigger an init load
+        c.book = self.book
         c.book_id = self.book_id
         c.member_id = self.member_id
 
@@ -91,7 +173,8 @@ class Checkouts(list):
 
     def reload(self):
         self.clear()
-        self.__init__(self.db, member_id=self.member_id, book_id=self.book_id)
+        self.__init__(self.db, member_id=self.member_id, book_id=self.book_id,
+                      book=self.book)
 
     def display(self, width=79, show_members=False, enum=False):
         results = []
@@ -163,40 +246,16 @@ class Checkouts(list):
         -------
         list
             Data structure describing all the people with books currently
-            overdue.
+            overdue: email, name and (checkout stamp, shelfcode, dexline)
+            for each book. See VGGReport for the rest.
 
         '''
-        bad_people = list(self.db.cursor.execute(
-            'select'
-            '  email, first_name, last_name, '
-            '  array_agg(checkout_stamp),'
-            '  array_agg(shelfcode),'
-            '  array_agg(title_id)'
-            ' from'
-            '  checkout'
-            '  natural join member'
-            '  natural join book'
-            '  natural join shelfcode'
-            ' where'
-            '  not pseudo'
-            '  and checkin_stamp is null'
-            '  and checkout_lost is null'
-            '  and checkout_stamp <'
-            "   (current_timestamp - interval '3 weeks 1 day')"
-            ' group by email, first_name, last_name order by last_name'))
-        from mitsfs.dex.titles import Title
+        from mitsfs.circulation.vgg import VGGReport
         return [
-            (
-                email,
-                f'{last_name}, {first_name}',
-                [
-                    (checkout_stamp, shelfcode, Title(self.db, title_id))
-                    for (checkout_stamp, shelfcode, title_id)
-                    in list(zip(stamps, shelfcodes, title_ids))
-                    ]
-                )
-            for (email, first_name, last_name, stamps, shelfcodes, title_ids)
-            in bad_people]
+            (email, name, [
+                (stamp, shelfcode, title)
+                for (stamp, days, shelfcode, title) in books])
+            for (email, name, books) in VGGReport(self.db)]
 
 
 class Checkout(db.Entry):
@@ -236,6 +295,9 @@ class Checkout(db.Entry):
 
     lost = db.Field('checkout_lost')
 
+    # the Book this came from, if there was one
+    _book = None
+
     @property
     def title(self):
         '''
@@ -259,7 +321,9 @@ class Checkout(db.Entry):
 
         '''
         from mitsfs.dex.books import Book
-        return Book(self.db, self.book_id)
+        if self._book is None or self._book.id != self.book_id:
+            self._book = Book(self.db, self.book_id)
+        return self._book
 
     @property
     def due_stamp(self):
@@ -270,11 +334,7 @@ class Checkout(db.Entry):
             Internal date for when the book is due back.
 
         '''
-        when = self.checkout_stamp + datetime.timedelta(days=MAXDAYSOUT)
-        due = datetime.datetime(when.year, when.month, when.day, 3, 0, 0, 0)
-        if when.hour >= 3:
-            due += datetime.timedelta(days=1)
-        return due
+        return due_stamp(self.checkout_stamp)
 
     @property
     def due_date(self):
@@ -312,11 +372,7 @@ class Checkout(db.Entry):
         '''
         if not when:
             when = datetime.datetime.today()
-        due = self.due_stamp
-
-        if settings.timewarps_global:
-            due = settings.timewarps_global.warp_date(due)
-        diff = when - due
+        diff = when - warp_due(self.due_stamp)
         return max(diff.days, 0)
 
     def lose(self, when=None):
@@ -419,6 +475,11 @@ class Checkout(db.Entry):
         self.checkin_stamp = when
         self.checkin_user = self.get_logger()
 
+        # the book may have been loaded knowing who had it out (lose()
+        # comes through here too)
+        self.book.cache.pop('out', None)
+        self.book.cache.pop('outto', None)
+
         msgs.append(f'{self.book} has been checked in')
         if self.book.withdrawn:
             msgs += [
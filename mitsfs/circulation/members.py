@@ -4,17 +4,22 @@ Code for manipulating the online membership book
 
 '''
 import re
+import time
 
 from mitsfs.core import db
 from mitsfs.util import ui
 from mitsfs.util.coercers import coerce_boolean
 from mitsfs.circulation.membership import Membership
 from mitsfs.circulation.transactions import get_transactions, Transaction
-from mitsfs.circulation.checkouts import Checkouts
+from mitsfs.circulation.checkouts import Checkouts, Checkout
 
 # constant for number of books a member can have checked out
 MAX_BOOKS = 8
 
+# how many seconds a MemberSummary is trusted for, so changes made from
+# another terminal show up eventually
+SUMMARY_MAX_AGE = 60
+
 
 def format_name(first, last):
     """
@@ -68,16 +73,15 @@ class Members(object):
         name = re.split(r'[^a-zA-Z]+', name)
         where = ' and '.join(['concat(first_name, last_name,  key_initials, email) ~* %s'] * len(name))
 
-        return [
-            Member(self.db, i)
-            for i in
+        return Member.load_many(
+            self.db,
             self.db.cursor.fetchlist(
                 'select member_id'
                 ' from member'
                 ' where'
                 f' {where}'
                 ' and pseudo = %s',
-                (*name, pseudo))]
+                (*name, pseudo)))
 
     def complete_name(self, s, pseudo=False):
         '''
@@ -96,6 +100,50 @@ class Members(object):
         '''
         return [member.full_name for member in self.find(s, pseudo)]
 
+    def verify_balances(self, repair=False):
+        '''
+        Check the running balances in member_balance against adding up
+        everyone's transactions.
+
+        Parameters
+        ----------
+        repair : bool, optional
+            Whether to set the running balances that are off to the real
+            ones. Default is False.
+
+        Returns
+        -------
+        list((int, decimal, decimal))
+            member_id, running balance and the sum of their transactions for
+            each member where the two disagree.
+
+        '''
+        c = self.db.getcursor()
+        wrong = c.execute(
+            'select'
+            '  member_id,'
+            '  coalesce(member_balance.balance, 0),'
+            '  coalesce(sums.balance, 0)'
+            ' from'
+            '  member_balance'
+            '  full join'
+            '  (select member_id, sum(transaction_amount) as balance'
+            '    from transaction group by member_id) as sums'
+            '  using (member_id)'
+            ' where'
+            '  coalesce(member_balance.balance, 0)'
+            '   != coalesce(sums.balance, 0)'
+            ' order by member_id').fetchall()
+        if repair and wrong:
+            c.executemany(
+                'insert into member_balance (member_id, balance)'
+                ' values (%s, %s)'
+                ' on conflict (member_id) do update'
+                '  set balance = excluded.balance',
+                [(member_id, balance) for (member_id, _, balance) in wrong])
+            self.db.commit()
+        return wrong
+
     def __getitem__(self, member_id):
         """returns the unique member object for a given member_id"""
         return Member(self.db, member_id)
@@ -146,6 +194,7 @@ class Member(db.Entry):
 
     membership_ = None
     checkouts_ = None
+    summary_ = None
 
     @property
     def full_name(self):
@@ -264,8 +313,8 @@ class Member(db.Entry):
 
         '''
         bal = self.cursor.selectvalue(
-            'select sum(transaction_amount)'
-            ' from transaction'
+            'select balance'
+            ' from member_balance'
             ' where member_id=%s',
             (self.member_id,))
         return bal or 0
@@ -350,23 +399,41 @@ class Member(db.Entry):
 
     def reset_checkouts(self):
         self.checkouts_ = None
+        self.summary_ = None
+
+    def summary(self):
+        '''
+        The membership, balance and open checkouts, loaded together and kept
+        until something is written to the db (or SUMMARY_MAX_AGE passes).
+
+        Returns
+        -------
+        MemberSummary
+            what the desk needs to know about this member.
+
+        '''
+        if self.summary_ is None or self.summary_.stale:
+            self.summary_ = MemberSummary(self)
+        return self.summary_
 
     def can_checkout(self, override=False):
         msgs = []
         correct = []
 
-        if self.balance < 0:
+        summary = self.summary()
+
+        if summary.balance < 0:
             msgs.append(self.first_name + ' has a negative balance.')
             correct.append('pay fines')
 
-        if self.membership is None:
+        if summary.membership is None:
             msgs.append(self.first_name + ' has no membership.')
             correct.append('get a membership')
-        elif self.membership.expired:
+        elif summary.membership.expired:
             msgs.append(self.first_name + ' has an expired membership.')
             correct.append('get new membership')
 
-        books_due = self.checkout_history.overdue
+        books_due = summary.overdue
 
         if books_due:
             msg = self.first_name + ' has overdue books.'
@@ -375,7 +442,7 @@ class Member(db.Entry):
             msgs.append(msg)
             correct.append('return books')
 
-        count = len([x for x in self.checkout_history.out if not x.lost])
+        count = len(summary.out)
         if count >= MAX_BOOKS:
             msgs.append(('%s has %d books out.' % (self.first_name, count)))
             if 'return books' not in correct:
@@ -514,6 +581,9 @@ class Member(db.Entry):
                 'delete from member where member_id=%s',
                 (other_id,))
             self.db.commit()
+            # their checkouts and transactions are ours now
+            self.reset_checkouts()
+            other.cache_reset()
         except Exception:
             self.db.rollback()
             raise
@@ -572,3 +642,86 @@ def star_committees(db):
         ' where not rolcanlogin'
         "  and rolname !~ '^pg_'")
     return list(set(committees) - set(omit))
+
+
+class MemberSummary(object):
+    '''
+    Everything the member header and can_checkout() look at, fetched in one
+    query rather than a chain of lazy ones.
+
+    Attributes
+    ----------
+    membership : Membership or None
+        the most recent membership, with its fields already loaded.
+    membership_description : str or None
+        what kind of membership that is.
+    balance : decimal
+        the member's balance.
+    out : Checkouts
+        the open checkouts, oldest first, with their fields loaded.
+    overdue : Checkouts
+        the ones of those that are overdue.
+    '''
+    def __init__(self, member):
+        self.db = member.db
+        self.generation = self.db.writes
+        self.loaded = time.monotonic()
+
+        membership_fields = Membership._all_fields()
+        checkout_fields = Checkout._all_fields()
+        c = self.db.getcursor()
+        rows = c.execute(
+            'select balance, membership_description, ' +
+            ', '.join(f'membership.{field.field}'
+                      for field in membership_fields) + ', ' +
+            ', '.join(f'checkout.{field.field}'
+                      for field in checkout_fields) +
+            ' from'
+            '  (select coalesce(max(balance), 0) as balance'
+            '   from member_balance where member_id = %s) as balance'
+            '  left join lateral'
+            '  (select * from membership where member_id = %s'
+            '   order by membership_created desc limit 1) as membership'
+            '  on true'
+            '  left join membership_type'
+            '  on membership_type.membership_type = membership.membership_type'
+            '  left join checkout'
+            '  on checkout.member_id = %s'
+            '   and checkin_stamp is null and checkout_lost is null'
+            ' order by checkout_stamp, checkout_id',
+            (member.id, member.id, member.id)).fetchall()
+
+        first = rows[0]
+        self.balance = first[0]
+        self.membership_description = first[1]
+        membership_row = first[2:2 + len(membership_fields)]
+        self.membership = None
+        membership_id = dict(zip(
+            (field.field for field in membership_fields),
+            membership_row))['membership_id']
+        if membership_id is not None:
+            self.membership = Membership(self.db, membership_id)
+            self.membership._seed(membership_fields, membership_row)
+
+        checkouts = []
+        for row in rows:
+            checkout_row = row[2 + len(membership_fields):]
+            checkout = dict(zip(
+                (field.field for field in checkout_fields), checkout_row))
+            if checkout['checkout_id'] is None:
+                continue
+            checkout = Checkout(self.db, checkout['checkout_id'])
+            checkout._seed(checkout_fields, checkout_row)
+            checkouts.append(checkout)
+        self.out = Checkouts(self.db, checkouts=checkouts)
+        self.out.member_id = member.id
+        self.overdue = self.out.overdue
+
+    @property
+    def stale(self):
+        '''
+        Whether anything has been written through our connection since this
+        was loaded, or it's just old.
+        '''
+        return (self.generation != self.db.writes
+                or time.monotonic() - self.loaded > SUMMARY_MAX_AGE)
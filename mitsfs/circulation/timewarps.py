@@ -1,3 +1,5 @@
+from bisect import bisect_right
+
 from mitsfs.core import db
 from mitsfs.util.coercers import coerce_datetime_no_timezone
 
@@ -41,7 +43,9 @@ class Timewarps(list):
         '''
         A list of all historical timewarps, sorted by end date.
 
-        Primarily used to figure out the new date after a timewarp
+        Primarily used to figure out the new date after a timewarp. The
+        warps are also kept merged into non-overlapping intervals, sorted by
+        start, so that's a binary search.
 
         Parameters
         ----------
@@ -61,6 +65,7 @@ class Timewarps(list):
                                  end=coerce_datetime_no_timezone(end)))
         self.sort(key=lambda x: x.end)
         self.db = db
+        self.merge()
 
     def load_from_db(self, db):
         c = db.getcursor()
@@ -80,15 +85,30 @@ class Timewarps(list):
         t.create()
         self.append(t)
         self.sort(key=lambda x: x.end)
+        self.merge()
+
+    def merge(self):
+        '''
+        Work out self.starts and self.ends, the (inclusive) intervals covered
+        by one or more warps. Warps that overlap or touch are one interval,
+        since falling into the first carries you on into the next.
+        '''
+        self.starts = []
+        self.ends = []
+        for warp in sorted(self, key=lambda x: x.start):
+            if self.ends and warp.start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], warp.end)
+            else:
+                self.starts.append(warp.start)
+                self.ends.append(warp.end)
 
     def warp_date(self, date):
         '''
         Given a due date, warps aheads to a new future date where the book is
         now due.
 
-        Needs to loop through rather than find the first match because there
-        might be overlapping end dates, and one warp might put you into
-        another warp.
+        Overlapping warps have already been merged, so the end of the interval
+        the date falls in is past every warp it would chain into.
 
         Parameters
         ----------
@@ -101,7 +121,31 @@ class Timewarps(list):
             the new due date of the book.
 
         '''
-        for warp in self:
-            if date >= warp.start and date <= warp.end:
-                date = warp.end
+        i = bisect_right(self.starts, date) - 1
+        if i >= 0 and date <= self.ends[i]:
+            date = self.ends[i]
         return coerce_datetime_no_timezone(date)
+
+    def warp_dates(self, dates):
+        '''
+        warp_date() for a lot of dates at once, e.g. the due dates of
+        everything that's out, doing each distinct date once.
+
+        Parameters
+        ----------
+        dates : iterable(date)
+            The initial due dates.
+
+        Returns
+        -------
+        list(date)
+            the new due dates, in the same order.
+
+        '''
+        warped = {}
+        results = []
+        for date in dates:
+            if date not in warped:
+                warped[date] = self.warp_date(date)
+            results.append(warped[date])
+        return results
@@ -13,6 +13,21 @@ OVERDUE_DAY = 0.1
 MAX_OVERDUE = 4.0
 
 
+def overdue_fine(days):
+    '''
+    Parameters
+    ----------
+    days : int
+        how many days a book is overdue.
+
+    Returns
+    -------
+    float
+        the fine for it, as a (negative) transaction amount.
+    '''
+    return -min(days * OVERDUE_DAY, MAX_OVERDUE)
+
+
 def get_transactions(db, member_id, include_voided=True):
     """
     returns a list of transactions associated with a member
@@ -29,48 +44,32 @@ def get_transactions(db, member_id, include_voided=True):
     Returns
     -------
     list(Transaction)
-        A list of all transactions for a member, in chronological order.
+        A list of all transactions for a member, in chronological order,
+        with their fields and linked transactions loaded in one query.
     """
-    if include_voided:
-        sql = ('select'
-               '  transaction_id'
-               ' from transaction'
-               ' where member_id = %s'
-               ' order by transaction_created')
-    else:
-        # TODO: This is a monstrosity, and I think it could be trivially
-        # solved by just putting a voided column onto the transaction row.
-        sql = ("select"
-               "  transaction_id"
-               " from transaction"
-               " where transaction_id in ("
-               "select t0.transaction_id"
-               "  from transaction t0"
-               "  where"
-               "   t0.transaction_type != 'V' and"
-               "   t0.member_id = %s"
-               "  except ("
-               "   select t1.transaction_id"
-               "    from"
-               "     transaction t1"
-               "     inner join transaction_link tl"
-               "      on (t1.transaction_id = tl.transaction_id1)"
-               "     inner join transaction t2"
-               "      on (t2.transaction_id =  tl.transaction_id2)"
-               "    where t2.transaction_type = 'V'"
-               "   union select t1.transaction_id"
-               "    from"
-               "     transaction t1"
-               "     inner join transaction_link tl"
-               "      on (t1.transaction_id = tl.transaction_id2)"
-               "     inner join transaction t2"
-               "      on (t2.transaction_id = tl.transaction_id1)"
-               "    where t2.transaction_type = 'V'))"
-               " order by transaction_created")
-
-    return [Transaction(db, member_id, i)
-            for i in
-            db.cursor.execute(sql, (member_id,))]
+    fields = Transaction._all_fields()
+    sql = ('select'
+           '  transaction_id,'
+           '  array(select transaction_id2 from transaction_link'
+           '         where transaction_id1 = transaction.transaction_id'
+           '        union select transaction_id1 from transaction_link'
+           '         where transaction_id2 = transaction.transaction_id), ' +
+           ', '.join(field.field for field in fields) +
+           ' from transaction'
+           ' where member_id = %s')
+    if not include_voided:
+        # the void itself can be committed before the link that marks it
+        sql += " and not transaction_voided and transaction_type != 'V'"
+    sql += ' order by transaction_created'
+
+    transactions = []
+    for (transaction_id, linked, *row) in db.getcursor().execute(
+            sql, (member_id,)):
+        tx = Transaction(db, None, transaction_id)
+        tx._seed(fields, row)
+        tx.linked = [Transaction(db, None, i) for i in linked]
+        transactions.append(tx)
+    return transactions
 
 
 def get_CASH_id(db):
@@ -88,6 +87,10 @@ class Transaction(db.Entry):
             self.member_id = member_id
         self.linked = None
 
+    @classmethod
+    def from_id(cls, db, id_):
+        return cls(db, None, id_)
+
     transaction_id = db.ReadField('transaction_id')
 
     member_id = db.Field('member_id')
@@ -98,6 +101,9 @@ class Transaction(db.Entry):
     created = db.ReadField('transaction_created')
     created_by = db.ReadField('transaction_created_by')
     created_with = db.ReadField('transaction_created_with')
+    # set by a trigger when the transaction is linked to its void, so
+    # _void_transaction() drops it from the cache
+    voided = db.ReadField('transaction_voided')
 
     @property
     def type_description(self):
@@ -149,8 +155,7 @@ class Transaction(db.Entry):
         return self.linked
 
     def is_void(self):
-        return self.transaction_type == 'V' \
-            or 'V' in [x.transaction_type for x in self.linked_transaction]
+        return self.transaction_type == 'V' or self.voided
 
     def _void_transaction(self):
         '''
@@ -173,8 +178,10 @@ class Transaction(db.Entry):
              'insert into transaction_link values (%s, %s)',
              (self.id, new.id))
 
-        # reset the cache on linked because we added a transaction
+        # reset the cache on linked because we added a transaction, and on
+        # voided because the link set it
         self.linked = None
+        self.cache.pop('transaction_voided', None)
 
         return new
 
@@ -374,7 +381,7 @@ class OverdueTransaction(FineTransaction):
 
         # TODO: Why can't we calculate this from the checkout_id?
         if days:
-            self.amount = -min(days * OVERDUE_DAY, MAX_OVERDUE)
+            self.amount = overdue_fine(days)
             if book:
                 self.description = 'Book %s overdue %d days.' % (book, days)
 
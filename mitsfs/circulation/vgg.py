@@ -0,0 +1,180 @@
+'''
+The VGG, the list of everyone with overdue books.
+
+VGGReport takes the days overdue (after timewarps) from overdue_fines(),
+fetches those checkouts with their members and shelfcodes in one query and
+loads the titles for all of them in one go, so the rows it hands back are
+ready to print. It can also write them out as a text file or as an
+mbox of reminder emails, and keeps track of how long each stage took.
+'''
+
+import contextlib
+import datetime
+import mailbox
+import time
+from email.message import EmailMessage
+
+from mitsfs.core import settings
+from mitsfs.util import coercers
+from mitsfs.circulation.checkouts import overdue_fines
+from mitsfs.circulation.members import format_name
+from mitsfs.dex.titles import Titles
+
+
+class VGGReport(object):
+    '''
+    The overdue books, grouped by member.
+
+    Attributes
+    ----------
+    rows : list((str, str, list((datetime, int, str, str))))
+        email, name and the overdue books for each member, by last name;
+        each book is (checkout stamp, days overdue, shelfcode, dexline),
+        oldest first.
+    timings : list((str, float))
+        each stage of making the report and how many seconds it took.
+    '''
+    def __init__(self, db, when=None, progress=None):
+        '''
+        Parameters
+        ----------
+        db : Database
+            The database to read from.
+        when : datetime, optional
+            what counts as overdue as of. Default is now.
+        progress : callable, optional
+            called with a string as the report goes along, e.g. print.
+
+        '''
+        self.db = db
+        self.when = when or datetime.datetime.today()
+        self.progress = progress
+        self.timings = []
+        self.rows = self.load()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.progress:
+            self.progress(f'{name}...')
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time.perf_counter() - start))
+
+    def load(self):
+        with self.stage('Finding overdue'):
+            overdue = {
+                checkout_id: days
+                for (checkout_id, _, _, due, days, _)
+                in overdue_fines(self.db, self.when)
+                if due < self.when}
+
+        with self.stage('Fetching'):
+            checkouts = self.db.getcursor().execute(
+                'select'
+                '  checkout_id, member_id, email, first_name, last_name,'
+                '  checkout_stamp, shelfcode, title_id'
+                ' from'
+                '  checkout'
+                '  natural join member'
+                '  natural join book'
+                '  natural join shelfcode'
+                ' where'
+                '  not pseudo'
+                '  and checkout_id = any(%s)'
+                ' order by last_name, first_name, member_id,'
+                '  checkout_stamp, checkout_id',
+                (list(overdue),)).fetchall()
+
+        with self.stage('Loading titles'):
+            titles = {
+                title.id: str(title)
+                for title in Titles(self.db).load(
+                    {row[7] for row in checkouts})}
+
+        with self.stage('Rendering'):
+            rows = []
+            last = None
+            for (checkout_id, member_id, email, first_name, last_name,
+                 stamp, shelfcode, title_id) in checkouts:
+                if member_id != last:
+                    rows.append(
+                        (email, format_name(first_name, last_name), []))
+                    last = member_id
+                rows[-1][2].append(
+                    (coercers.coerce_datetime_no_timezone(stamp),
+                     overdue[checkout_id], shelfcode,
+                     titles.get(title_id, '')))
+        return rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def lines(self):
+        '''
+        Yields
+        ------
+        str
+            the report as text, a line at a time.
+        '''
+        for (email, name, books) in self.rows:
+            yield f'{name} <{email}>'
+            for (stamp, days, shelfcode, title) in books:
+                yield f' {stamp.date()} {days:3d} days {shelfcode} {title}'
+
+    def write_text(self, path):
+        '''
+        Write the report out as text.
+        '''
+        with self.stage('Writing'):
+            with open(path, 'w') as fp:
+                for line in self.lines():
+                    fp.write(line + '\n')
+
+    def message(self, email, name, books):
+        '''
+        Returns
+        -------
+        EmailMessage
+            the reminder for one member.
+        '''
+        msg = EmailMessage()
+        msg['From'] = settings.VGG_FROM
+        msg['To'] = f'{name} <{email}>'
+        msg['Subject'] = settings.VGG_SUBJECT
+        msg.set_content(
+            f'{name},\n\n'
+            'Our records show the following books checked out to you are'
+            ' overdue:\n\n' +
+            ''.join(
+                f'  {title} (out {stamp.date()}, {days} days overdue)\n'
+                for (stamp, days, shelfcode, title) in books) +
+            '\nPlease bring them back to the library as soon as you can.\n')
+        return msg
+
+    def write_mbox(self, path):
+        '''
+        Add a reminder email for each member to an mbox, to be sent from
+        there.
+
+        Returns
+        -------
+        int
+            how many messages were written.
+        '''
+        with self.stage('Writing'):
+            box = mailbox.mbox(path)
+            box.lock()
+            try:
+                for (email, name, books) in self.rows:
+                    if email:
+                        box.add(self.message(email, name, books))
+                box.flush()
+            finally:
+                box.unlock()
+                box.close()
+        return sum(1 for (email, _, _) in self.rows if email)
@@ -4,17 +4,62 @@ code for manipulating data stored in postgres databases
 '''
 
 import functools
+import itertools
 import logging
 import os
 import re
+import time
 import psycopg2
 
+from mitsfs.core import settings
+
+# how many statements executemany sends to the server in one round trip
+BATCH_PAGE_SIZE = 100
+
+# how many rows a streaming cursor pulls from the server at a time
+STREAM_ITERSIZE = 2000
+
+# statements that count towards Database.writes
+WRITE_COMMANDS = ('INSERT', 'UPDATE', 'DELETE')
+
+
 class Database(object):
     def getcursor(self):
-        return self.db.cursor(cursor_factory=EasyCursor)
+        c = self.db.cursor(cursor_factory=EasyCursor)
+        c.database = self
+        return c
+
+    def getstreamcursor(self, itersize=STREAM_ITERSIZE):
+        '''
+        A server side (named) cursor, which fetches its results itersize
+        rows at a time as you iterate over it rather than pulling the whole
+        result into memory up front. It can only execute one statement, and
+        it goes away at the end of the transaction, so don't commit while
+        you're still reading from it. See EasyCursor.stream()
+
+        Parameters
+        ----------
+        itersize : int, optional
+            how many rows to fetch from the server at a time.
+            The default is STREAM_ITERSIZE.
+
+        Returns
+        -------
+        EasyCursor
+            the cursor object
+        '''
+        c = self.db.cursor(
+            f'stream_{next(self.stream_ids)}', cursor_factory=EasyCursor)
+        c.itersize = itersize
+        c.database = self
+        return c
 
     def __init__(self, client='mitsfs.dexdb', dsn='dbname=mitsfs'):
         self.dsn = dsn
+        self.stream_ids = itertools.count()
+        # bumped every time a statement changes something, so anything
+        # cached from the db can tell whether it might be out of date
+        self.writes = 0
         try:
             self.db = psycopg2.connect(dsn)
         except psycopg2.OperationalError as e:
@@ -69,8 +114,28 @@ class EasyCursor(psycopg2.extensions.cursor):
 
     def execute(self, sql, args=None):
         log = logging.getLogger('mitsfs.sql')
-        
-        log.debug('%s', self.mogrify(sql, args))
+
+        # formatting the query client side is expensive, so only do it if
+        # someone is going to read it
+        debug = log.isEnabledFor(logging.DEBUG)
+        if debug:
+            log.debug('%s', self.mogrify(sql, args))
+        self._run(sql, args)
+        if debug:
+            log.debug('%s: %s rows: %d',
+                      self.cursor_id(), self.statusmessage, self.rowcount)
+        return self
+
+    def _run(self, sql, args=None):
+        '''
+        Send a statement to the server. If it fails, log it and roll back the
+        connection so it's usable again, then reraise.
+
+        Statements that take longer than settings.SLOW_QUERY_SECONDS are
+        logged as warnings.
+        '''
+        log = logging.getLogger('mitsfs.sql')
+        start = time.perf_counter()
         try:
             psycopg2.extensions.cursor.execute(self, sql, args)
         except Exception as exc:
@@ -83,9 +148,15 @@ class EasyCursor(psycopg2.extensions.cursor):
                               self.cursor_id(), err.__class__.__name__, err)
                 pass
             raise
-        log.debug('%s: %s rows: %d',
-                  self.cursor_id(), self.statusmessage, self.rowcount)
-        return self
+        elapsed = time.perf_counter() - start
+        database = getattr(self, 'database', None)
+        if (database is not None and self.statusmessage
+                and self.statusmessage.split(' ', 1)[0] in WRITE_COMMANDS):
+            database.writes += 1
+        if (settings.SLOW_QUERY_SECONDS is not None
+                and elapsed >= settings.SLOW_QUERY_SECONDS):
+            log.warning('%s: slow query (%.3fs): %s',
+                        self.cursor_id(), elapsed, self.query)
 
     '''
     Pass in a query and args that result in a single value
@@ -140,25 +211,71 @@ class EasyCursor(psycopg2.extensions.cursor):
         return [x[0] for x in self.fetchall()]
         
 
-    def executemany(self, sql, argsiter):
+    def stream(self, sql, args=None):
         '''
-        Pass in a query and a list of args tuples, and executes the sql 
-        repeatedly for each tuple provided
-    
+        Execute a query and yield the rows as they come in, closing the cursor
+        when they run out (or the generator is thrown away). Mostly useful on
+        a cursor from Database.getstreamcursor()
+
         Parameters
         ----------
         sql : str
             SQL string.
         args : tuple, optional
             list of the values to flow into the SQL statement
+
+        Yields
+        ------
+        tuple
+            each row of the result
+        '''
+        try:
+            self.execute(sql, args)
+            for row in self:
+                yield row
+        finally:
+            # a named cursor goes away with its transaction, and closing it
+            # after that is an error; a completion generator that was
+            # abandoned and then committed past ends up here
+            if not self.closed and (
+                    self.name is None
+                    or self.connection.get_transaction_status()
+                    == psycopg2.extensions.TRANSACTION_STATUS_INTRANS):
+                self.close()
+
+    def executemany(self, sql, argsiter, page_size=BATCH_PAGE_SIZE):
+        '''
+        Pass in a query and a list of args tuples, and executes the sql 
+        for each tuple provided. The statements are sent page_size at a time
+        as a single round trip (the same trick as psycopg2's execute_batch),
+        and logged once per page rather than once per row.
+
+        Doesn't make sense for statements that return rows, since only the
+        last statement's results are available.
+    
+        Parameters
+        ----------
+        sql : str
+            SQL string.
+        argsiter : iterable(tuple)
+            the values to flow into each SQL statement
+        page_size : int, optional
+            how many statements to send at once.
+            The default is BATCH_PAGE_SIZE.
     
         Returns
         -------
        EasyCursor
             the cursor object
         '''
-        for args in argsiter:
-            self.execute(sql, args)
+        log = logging.getLogger('mitsfs.sql')
+        argsiter = iter(argsiter)
+        while True:
+            page = list(itertools.islice(argsiter, page_size))
+            if not page:
+                break
+            self._run(b';'.join(self.mogrify(sql, args) for args in page))
+            log.debug('%s: %d x %s', self.cursor_id(), len(page), sql)
         return self
 
     def __nonzero__(self):
@@ -197,9 +314,18 @@ class Field(property):
     
     Field enables full getting and setting of the field.
     ReadFieldUncached is currently unused (used to be for checkout_lost, not
-                                           sure why)
+                                           sure why). It rereads its column
+    every time it is accessed.
     ReadField is the most common. Does a read (no write) but wraps it in a 
     cache.
+
+    The first time any field of an Entry is read, the whole row (every
+    declared field that isn't already in the cache) is fetched in one query,
+    so touching several attributes of an object costs one round trip rather
+    than one per column. Setting a Field updates the cache as well as the
+    row, but anything that changes the row some other way (raw SQL, a
+    trigger) has to call cache_reset() on the Entry, or drop the columns it
+    changed from the cache, so the next read fetches them again.
     
     '''
 
@@ -235,6 +361,13 @@ class Field(property):
         self.coercer = coercer
         super().__init__(self.get, self.set)
 
+    def coerce(self, val, db):
+        '''
+        Apply the coercer (if any) to a value read from the database
+        '''
+        if self.coercer is not None:
+            val = self.coercer(val, db)
+        return val
 
     def get(self, obj):
         '''
@@ -258,16 +391,13 @@ class Field(property):
         object.
             the value in the database in this field for the ID of the caller
         '''
+        if self.field not in obj.cache and not obj.new:
+            obj.load()
         if self.field in obj.cache:
             return obj.cache[self.field]
 
-        command = 'select %s from %s where %s = %%s' \
-            % (self.field, obj.table, obj.idfield)
-        val = obj.cursor.selectvalue(command, (obj.id,))
-
-        if self.coercer is not None:
-            val = self.coercer(val, obj.db)
-        return val
+        # nothing in the db yet
+        return self.coerce(None, obj.db)
 
 
     def set(self, obj, val):
@@ -310,18 +440,18 @@ class Field(property):
 
 
 class ReadFieldUncached(Field):
+    def get(self, obj):
+        # drop whatever we had so that the load fetches it fresh
+        obj.cache.pop(self.field, None)
+        return super().get(obj)
+
     def set(self, obj, val):
         raise AssertionError('Readonly property %s:%s' % (
             repr(obj), self.field))
 
 
 class ReadField(ReadFieldUncached):
-    def get(self, obj):
-        if self.field in obj.cache:
-            return obj.cache[self.field]
-        val = super().get(obj)
-        obj.cache[self.field] = val
-        return val
+    get = Field.get
 
 
 class InfoField(ReadField):
@@ -363,6 +493,9 @@ def get_field_name_if_has_field_attribute(obj, attribute_name):
 
 
 class Entry(object):
+    # class -> {attribute name: column name}, so we only walk dir() once per
+    # class rather than once per object
+    _field_names = {}
 
     def __init__(self, table, idfield, db, id_=None, **kw):
         self.db = db
@@ -381,14 +514,7 @@ class Entry(object):
         # name and the field value, which represents the column name in the
         # table.
         me = self.__class__
-
-        self._fields = dict(
-            (attribute_name, column_name)
-            for (attribute_name, column_name)
-            in ((attribute_name,
-                 get_field_name_if_has_field_attribute(me, attribute_name))
-                for attribute_name in dir(me))
-            if column_name is not None)
+        self._fields = me._field_map()
 
         # This allows us to pre-seed data into the attributes by passing them
         # in as keyword arguments. You can only pass in fields this way to the
@@ -403,6 +529,115 @@ class Entry(object):
         self.cache_date = None
         self.cache = {}
 
+    @classmethod
+    def _field_map(cls):
+        '''
+        {attribute name: column name} for the declared fields of the class
+        '''
+        if cls not in Entry._field_names:
+            Entry._field_names[cls] = dict(
+                (attribute_name, column_name)
+                for (attribute_name, column_name)
+                in ((attribute_name,
+                     get_field_name_if_has_field_attribute(
+                         cls, attribute_name))
+                    for attribute_name in dir(cls))
+                if column_name is not None)
+        return Entry._field_names[cls]
+
+    @classmethod
+    def _all_fields(cls):
+        '''
+        The Field objects for every declared field, one per column, so a
+        query can fetch a whole row to _seed() an entry with.
+        '''
+        fields = {}
+        for attribute_name in cls._field_map():
+            field = getattr(cls, attribute_name)
+            fields[field.field] = field
+        return list(fields.values())
+
+    @classmethod
+    def from_id(cls, db, id_):
+        '''
+        Construct an existing entry from its id. Subclasses whose constructor
+        doesn't take (db, id) override this.
+        '''
+        return cls(db, id_)
+
+    def _unloaded_fields(self):
+        '''
+        The Field objects for the declared fields that aren't in the cache
+        '''
+        me = self.__class__
+        fields = {}
+        for attribute_name in self._fields:
+            field = getattr(me, attribute_name)
+            if field.field not in self.cache:
+                fields[field.field] = field
+        return list(fields.values())
+
+    def _seed(self, fields, row):
+        '''
+        Put a row fetched from the database into the cache, coercing as we go
+        '''
+        if row is None:
+            row = [None] * len(fields)
+        for (field, val) in zip(fields, row):
+            self.cache[field.field] = field.coerce(val, self.db)
+
+    def load(self):
+        '''
+        Fetch every field that isn't already cached in a single query.
+        '''
+        fields = self._unloaded_fields()
+        if self.new or not fields:
+            return
+        c = self.cursor.execute(
+            'select %s from %s where %s = %%s' % (
+                ', '.join(field.field for field in fields),
+                self.table, self.idfield),
+            (self.id,))
+        self._seed(fields, c.fetchone())
+
+    @classmethod
+    def load_many(cls, db, ids):
+        '''
+        Construct a list of entries and load all of their rows in one query.
+
+        Parameters
+        ----------
+        db : Database
+            The database to read from.
+        ids : list(int)
+            The ids of the entries to load.
+
+        Returns
+        -------
+        list
+            Entries in the same order as ids, with their fields cached.
+        '''
+        ids = list(ids)
+        entries = [cls.from_id(db, id_) for id_ in ids]
+        if not entries:
+            return entries
+
+        first = entries[0]
+        fields = first._unloaded_fields()
+        if not fields:
+            return entries
+        c = db.getcursor()
+        c.execute(
+            'select %s, %s from %s where %s = any(%%s)' % (
+                first.idfield,
+                ', '.join(field.field for field in fields),
+                first.table, first.idfield),
+            (ids,))
+        rows = dict((row[0], row[1:]) for row in c.fetchall())
+        for entry in entries:
+            entry._seed(fields, rows.get(entry.id))
+        return entries
+
     def getcursor(self):
         if not self.__cursor:
             return self.db.getcursor()
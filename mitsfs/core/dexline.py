@@ -1,5 +1,5 @@
 import re
-from functools import total_ordering
+from functools import lru_cache, total_ordering
 
 from mitsfs.util import utils
 from mitsfs.dex.editions import Edition, Editions
@@ -12,12 +12,18 @@ START_PAREN = re.compile(r'^\(')
 START_NUMBER = re.compile(r'^(\d\S+) ?(.*)')
 
 
+# The same strings come up over and over when sorting the dex (every book by
+# an author has the same author key), so remember them.
+@lru_cache(maxsize=65536)
 def sanitize_sort_key(s):
     '''
     Sortkeys are used to order books on the shelf, so we do a little bit
     of title/author/series munging to get them ordered appropriately. This
     function strips down the strings for easier sorting.
 
+    The sanitize_sort_key() function in setup/schema.sql does the same thing
+    on the server for the title_sortkey table, so keep them in step.
+
     Parameters
     ----------
     s : string
@@ -173,6 +179,15 @@ class DexLine(object):
                 self.TRAILING_NUMBER.sub('', str(self.series)))
         return ''
 
+    VSRE = re.compile(r' #([-.,\d]+B?)$')
+    @property
+    def placeseriesnumber(self):
+        if self.series:
+            m = self.VSRE.search(self.series[0])
+            if m:
+                return sanitize_sort_key(m.group(0))
+        return None
+
     def sortkey(self):
         self._sortkey = (
             (self.placeauthor, self.placetitle, self.authortxt,
@@ -180,7 +195,6 @@ class DexLine(object):
             self)
         return self._sortkey
 
-    VSRE = re.compile(r' #([-.,\d]+B?)$')
     def shelfkey(self, shelfcode):
         edition = self.codes[shelfcode]
         
@@ -194,9 +208,9 @@ class DexLine(object):
                               or self.series[0][0] == '@')
             if series_visible:
                 key += [self.placeseries]
-                m = self.VSRE.search(self.series[0])
-                if m:
-                    key += [sanitize_sort_key(m.group(0))]
+                number = self.placeseriesnumber
+                if number is not None:
+                    key += [number]
         key += [self.placetitle]
         self._shelfkey = tuple(key)
         return self._shelfkey
@@ -12,4 +12,11 @@ LOCKER = '/Users/telliott'
 CODEBASE = LOCKER + '/newdex'
 TEXBASE = CODEBASE + '/tex'
 
-LOG_LEVEL = logging.DEBUG
\ No newline at end of file
+LOG_LEVEL = logging.DEBUG
+
+# queries that take longer than this many seconds get logged as warnings.
+# None turns it off
+SLOW_QUERY_SECONDS = 1.0
+# who the overdue book reminders are from, and what they say they're about
+VGG_FROM = 'MITSFS <mitsfs@mit.edu>'
+VGG_SUBJECT = 'Overdue MITSFS books'
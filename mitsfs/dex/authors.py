@@ -39,11 +39,25 @@ class Authors(object):
             A list of all the authors we have in the catalog.
 
         '''
-        c = self.db.getcursor()
-        return c.fetchlist(
+        return list(self.iterkeys())
+
+    def iterkeys(self):
+        '''
+        Like keys(), but streams the authors from the server rather than
+        loading them all at once.
+
+        Yields
+        ------
+        str
+            each author we have in the catalog, in order.
+
+        '''
+        c = self.db.getstreamcursor()
+        for (author,) in c.stream(
                 "select CONCAT_WS('=', entity_name, alternate_entity_name)"
                 ' from entity'
-                ' order by entity_name')
+                ' order by entity_name'):
+            yield author
 
     def __contains__(self, author):
         '''
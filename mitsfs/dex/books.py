@@ -46,7 +46,7 @@ class Book(db.Entry):
 
     @property
     def checkout_history(self):
-        return checkouts.Checkouts(self.db, book_id=self.id)
+        return checkouts.Checkouts(self.db, book=self)
 
     @property
     def outto(self):
@@ -54,11 +54,16 @@ class Book(db.Entry):
         Thm member this book is out to, if any. If there are multiple
         members... probably not great
         '''
+        # only present if the book came from Title.books_with_borrowers()
+        if 'outto' in self.cache:
+            return self.cache['outto']
         return ' '.join(members.Member(self.db, x.member_id).full_name
                         for x in self.checkout_history.out)
 
     @property
     def out(self):
+        if 'out' in self.cache:
+            return self.cache['out']
         return len(self.checkout_history.out) > 0
 
     @property
@@ -83,11 +88,15 @@ class Book(db.Entry):
         '''
         if date is None:
             date = datetime.datetime.now()
+        # don't trust what we loaded earlier for this
+        self.cache.pop('out', None)
+        self.cache.pop('outto', None)
         if self.out:
             raise exceptions.CirculationException(
                 'Book already checked out to ' + str(self.outto))
         c = checkouts.Checkout(self.db, None, member_id=member.id,
                                checkout_stamp=date, book_id=self.id)
+        c._book = self
         c.create()
         return c
 
@@ -1,6 +1,33 @@
-from mitsfs.dex import titles, authors, series, shelfcodes, books
+from mitsfs.dex import titles, authors, series, shelfcodes, books, export
 from mitsfs.core import settings, dexline
 
+# search modes for Catalog.search
+GREP = 'grep'
+FUZZY = 'fuzzy'
+
+# how many titles Catalog.fuzzy returns unless you ask for more
+FUZZY_LIMIT = 20
+
+# where Catalog.fuzzy looks for the author, title and series parts of a
+# search, as (tables, column)
+FUZZY_FIELDS = (
+    (('entity natural join title_responsibility', 'entity_name'),
+     ('entity natural join title_responsibility', 'alternate_entity_name')),
+    (('title_title', 'title_name'),
+     ('title_title', 'alternate_name')),
+    (('series natural join title_series', 'series_name'),),
+    )
+
+# where Catalog.grep looks for the author, title and series parts of a
+# search, as (tables, columns). The first table has the title_id.
+GREP_FIELDS = (
+    ('title_responsibility natural join entity',
+     ('entity_name', 'alternate_entity_name')),
+    ('title_title', ('title_name', 'alternate_name')),
+    ('title_series natural join series', ('series_name',)),
+    )
+
+
 class Catalog(object):
     def __init__(self, db):
         self.db = db
@@ -11,54 +38,223 @@ class Catalog(object):
         self.shelfcodes = settings.shelfcodes_global \
             or shelfcodes.Shelfcodes(self.db)
 
-    def grep(self, candidate):
+    def grep(self, candidate, limit=None, book_filter=None):
+        '''
+        Search by regular expression. The whole search is done by one
+        query in the db, so only the matching titles come back.
+
+        Parameters
+        ----------
+        candidate : str
+            Either a single regular expression, which is matched against
+            authors, titles and series, or author<title<series<shelfcodes,
+            where every part given has to match. Shelfcodes are a comma
+            separated list, any of which will do.
+        limit : int, optional
+            The most titles to return, counting in dex order (by the sort
+            keys, then title_id). The default is all of them.
+        book_filter : BookFilter, optional
+            Only return titles with a book that passes this, from
+            mitsfs.dex.filters.
+
+        Returns
+        -------
+        list(Title)
+            the matching titles, in dex order.
+
+        '''
+        query = self._grep_query(candidate)
+        if query is None:
+            return []
+        where, args = query
+        if book_filter is not None:
+            clause, filter_args = book_filter.where('title.title_id')
+            where += f' and {clause}'
+            args += filter_args
+
+        sql = (
+            'select title_id'
+            ' from title left join title_sortkey using (title_id)'
+            f' where {where}'
+            " order by coalesce(sortkey_author, ''),"
+            " coalesce(sortkey_title, ''), title_id")
+        if limit is not None:
+            sql += ' limit %s'
+            args.append(limit)
+        ids = self.db.getcursor().fetchlist(sql, args)
+
+        # the order the ids came back in is the one the limit was applied
+        # in, so keep it rather than sorting again
+        loaded = {title.id: title for title in self.titles.load(ids)}
+        return [loaded[i] for i in ids if i in loaded]
+
+    def _grep_query(self, candidate):
+        '''
+        Compile a grep() search into a where clause on title.
+
+        Parameters
+        ----------
+        candidate : str
+            as for grep().
+
+        Returns
+        -------
+        (str, list) or None
+            the where clause and its arguments, or None if there's nothing
+            to search for.
+
+        '''
+        candidate = candidate.upper()
+        if '<' not in candidate:
+            # single value, so just look for it everywhere
+            clauses = [_grep_exists(tables, columns)
+                       for (tables, columns) in GREP_FIELDS]
+            args = [candidate] * sum(
+                len(columns) for (_, columns) in GREP_FIELDS)
+            return '(' + ' or '.join(clauses) + ')', args
+
+        # we need to check against each section and only return ones
+        # that match everything specified
+        candidates = candidate.split('<')
+        clauses = []
+        args = []
+        for part, (tables, columns) in zip(candidates[:3], GREP_FIELDS):
+            if part:
+                clauses.append(_grep_exists(tables, columns))
+                args += [part] * len(columns)
+
+        # anything that isn't in a specified shelfcode is out
+        if len(candidates) > 3 and candidates[3]:
+            clauses.append(_shelfcode_exists('title.title_id'))
+            args.append(candidates[3].split(','))
+
+        if not clauses:
+            return None
+        return ' and '.join(clauses), args
+
+    def fuzzy(self, candidate, limit=FUZZY_LIMIT, book_filter=None):
+        '''
+        Search that forgives typos, ranked by pg_trgm's word similarity, so
+        the best guesses come first.
+
+        Parameters
+        ----------
+        candidate : str
+            Either a single string, which is matched against authors,
+            titles and series, or author<title<series<shelfcodes, where
+            every part given has to match. Shelfcodes have to match exactly,
+            as for grep().
+        limit : int, optional
+            How many titles to return. The default is FUZZY_LIMIT.
+        book_filter : BookFilter, optional
+            Only return titles with a book that passes this, as for grep().
+
+        Returns
+        -------
+        list(Title)
+            the matching titles, best match first.
+
+        '''
+        candidate = candidate.upper()
         if '<' in candidate:
-            # we need to check against each section and only return ones
-            # that match everything specified
-            candidates = candidate.split('<')
-            ids = {}
-            ids_filled = False
-
-            # start with author
-            if candidates[0]:
-                ids = set(self.authors.grep(candidates[0]))
-                ids_filled = True
-
-            # remove anything that doesn't also match title
-            if candidates[1]:
-                title_ids = set(self.titles.grep(candidates[1]))
-                if ids_filled:
-                    ids = ids.intersection(title_ids)
-                else:
-                    ids = title_ids
-                    ids_filled = True
-
-            # remove anything that doesn't also match series
-            if len(candidates) > 2 and candidates[2]:
-                series_ids = set(self.series.grep(candidates[2]))
-                if ids_filled:
-                    ids = ids.intersection(series_ids)
-                else:
-                    ids = set(series_ids)
-                    ids_filled = True
-
-            # remove anything that isn't in a specified shelfcode
-            if len(candidates) > 3 and candidates[3]:
-                code_ids = []
-                for shelfcode in candidates[3].split(','):
-                    code_ids += self.shelfcodes.grep(shelfcode.upper())
-                if ids_filled:
-                    ids = ids.intersection(code_ids)
-                else:
-                    ids = set(code_ids)
+            parts = (candidate.split('<') + ['', '', ''])[:4]
+            fields = [
+                (part.strip(), FUZZY_FIELDS[i])
+                for i, part in enumerate(parts[:3]) if part.strip()]
+            codes = [i.strip() for i in parts[3].split(',') if i.strip()]
         else:
-            # single value, so just look for it everywhere
-            ids = set(self.titles.grep(candidate)
-                      + self.authors.grep(candidate)
-                      + self.series.grep(candidate))
-        title_list = [titles.Title(self.db, id) for id in ids]
-        title_list.sort(key=lambda x: x.sortkey())
-        return title_list
+            fields = [(candidate.strip(), sum(FUZZY_FIELDS, ()))]
+            codes = []
+        if not fields or not fields[0][0]:
+            return []
+
+        # one subquery per part with the best score for each title, joined
+        # so a title has to match all of them
+        subqueries = []
+        args = []
+        for i, (text, sources) in enumerate(fields):
+            subqueries.append(
+                f'(select title_id, max(score) as score_{i} from (' +
+                ' union all '.join(
+                    f'select title_id, word_similarity(%s, {column}) as score'
+                    f' from {tables} where %s <%% {column}'
+                    for (tables, column) in sources) +
+                f') as matches_{i} group by title_id) as field_{i}')
+            args += [text, text] * len(sources)
+
+        sql = (
+            'select title_id from ' +
+            ' join '.join(
+                subqueries[:1] + [s + ' using (title_id)'
+                                  for s in subqueries[1:]]))
+        conditions = []
+        if codes:
+            conditions.append(_shelfcode_exists('field_0.title_id'))
+            args.append(codes)
+        if book_filter is not None:
+            clause, filter_args = book_filter.where('field_0.title_id')
+            conditions.append(clause)
+            args += filter_args
+        if conditions:
+            sql += ' where ' + ' and '.join(conditions)
+        sql += (
+            ' order by ' +
+            ' + '.join(f'score_{i}' for i in range(len(fields))) +
+            ' desc, title_id limit %s')
+        args.append(limit)
+
+        ids = self.db.getcursor().fetchlist(sql, args)
+        loaded = {title.id: title for title in self.titles.load(ids)}
+        return [loaded[i] for i in ids if i in loaded]
+
+    def search(self, candidate, mode=GREP, limit=None, book_filter=None):
+        '''
+        Search the catalog either the old way, by regular expression, or
+        fuzzily.
+
+        Parameters
+        ----------
+        candidate : str
+            what to look for, as for grep() or fuzzy().
+        mode : str, optional
+            GREP or FUZZY. The default is GREP.
+        limit : int, optional
+            The most titles to return. The default is no limit for GREP
+            and FUZZY_LIMIT for FUZZY.
+        book_filter : BookFilter, optional
+            Only return titles with a book that passes this.
+
+        Returns
+        -------
+        list(Title)
+            In dex order for GREP, best match first for FUZZY.
+
+        '''
+        if mode == FUZZY:
+            return self.fuzzy(candidate, limit or FUZZY_LIMIT, book_filter)
+        elif mode == GREP:
+            return self.grep(candidate, limit, book_filter)
+        raise ValueError(f'unknown search mode {mode}')
+
+    def export(self, writers, progress=None):
+        '''
+        Write the dex out through the writers in mitsfs.dex.export, in one
+        pass over the books.
+
+        Parameters
+        ----------
+        writers : list(DexWriter)
+            where to write it all.
+        progress : callable, optional
+            called with a string as the export goes along, e.g. print.
+
+        Returns
+        -------
+        list((DexWriter, Title, Exception))
+            the titles that a writer couldn't write.
+
+        '''
+        return export.export(self.titles, writers, progress)
 
     def add_from_dexline(self, line):
         # primarily a helper function for testing. takes a dexline string and
@@ -105,3 +301,22 @@ class Catalog(object):
                 book.create(commit=False)
 
         self.db.commit()
+
+
+def _shelfcode_exists(title_id):
+    # a clause that's true when the title has a book in one of a list of
+    # shelfcodes; deprecated ones don't count, as in Shelfcodes
+    return (
+        'exists (select 1 from book natural join shelfcode'
+        f' where book.title_id = {title_id}'
+        " and not withdrawn and shelfcode_type != 'D'"
+        ' and shelfcode = any(%s))')
+
+
+def _grep_exists(tables, columns):
+    # a clause that's true when one of columns matches a regex
+    table = tables.split()[0]
+    return (
+        f'exists (select 1 from {tables}'
+        f' where {table}.title_id = title.title_id and (' +
+        ' or '.join(f'{column} ~ %s' for column in columns) + '))')
@@ -0,0 +1,304 @@
+'''
+Tab completion from memory.
+
+The completers in Authors, Titles, SeriesIndex and Members go to the db on
+every press of Tab. CompletionIndex loads the names once into sorted lists,
+so a completion is a bisect, and then keeps them up to date from the log
+table the same way CatalogSnapshot does, reloading only the rows that have
+changed.
+'''
+
+import re
+from bisect import bisect_left, insort
+
+from mitsfs.circulation.members import format_name
+from mitsfs.dex.snapshot import parse_change
+
+
+class PrefixIndex(object):
+    '''
+    A sorted list of (key, value, id) with the keys uppercased, so
+    everything starting with a prefix is one bisect away. Each id can have
+    any number of keys, and they can be replaced as a group.
+    '''
+    def __init__(self):
+        self.entries = []
+        self.by_id = {}
+
+    def set(self, obj_id, pairs):
+        '''
+        Replace the entries for obj_id.
+
+        Parameters
+        ----------
+        obj_id : int
+            what the entries belong to, e.g. an entity_id.
+        pairs : list((str, str))
+            (key, value) pairs; complete() looks for the prefix in the key
+            and hands back the value.
+
+        '''
+        self.discard(obj_id)
+        pairs = [(key.upper(), value) for (key, value) in pairs if key]
+        for (key, value) in pairs:
+            insort(self.entries, (key, value, obj_id))
+        if pairs:
+            self.by_id[obj_id] = pairs
+
+    def discard(self, obj_id):
+        for (key, value) in self.by_id.pop(obj_id, ()):
+            i = bisect_left(self.entries, (key, value, obj_id))
+            del self.entries[i]
+
+    def matches(self, prefix):
+        '''
+        Yields
+        ------
+        (str, int)
+            the value and id of each entry whose key starts with prefix.
+        '''
+        prefix = prefix.upper()
+        for i in range(bisect_left(self.entries, (prefix,)),
+                       len(self.entries)):
+            key, value, obj_id = self.entries[i]
+            if not key.startswith(prefix):
+                break
+            yield value, obj_id
+
+    def complete(self, prefix):
+        '''
+        Returns
+        -------
+        list(str)
+            the distinct values for the keys starting with prefix, sorted.
+        '''
+        return sorted({value for (value, _) in self.matches(prefix)})
+
+
+class CompletionIndex(object):
+    '''
+    Author, title, series and member names for tab completion, loaded once
+    and then caught up with refresh().
+    '''
+    def __init__(self, db):
+        self.db = db
+        self.load()
+
+    def load(self):
+        '''
+        (Re)load everything from the db.
+        '''
+        c = self.db.getcursor()
+        # as in CatalogSnapshot, read the generation first so nothing that
+        # changes while we load gets missed
+        self.generation = c.selectvalue(
+            'select coalesce(max(generation), 0) from log')
+
+        self.authors = PrefixIndex()
+        self.titles = PrefixIndex()
+        self.series = PrefixIndex()
+        self.entity_titles = {}
+        self.title_entities = {}
+        self.members = {}
+
+        self._load_entities(None)
+        self._load_titles(None)
+        self._load_responsibility(None)
+        self._load_series(None)
+        self._load_members(None)
+
+    def refresh(self):
+        '''
+        Replay the log since the last generation we saw, reloading the names
+        that have changed.
+
+        Returns
+        -------
+        int
+            how many log entries there were to look at.
+
+        '''
+        c = self.db.getcursor()
+        changed = {}
+        count = 0
+        for (generation, obj_id, change) in c.execute(
+                'select generation, obj_id, change'
+                ' from log'
+                ' where generation > %s'
+                ' order by generation', (self.generation,)):
+            event, table, values = parse_change(change)
+            changed.setdefault(table, set()).add(obj_id)
+            self.generation = generation
+            count += 1
+
+        if 'entity' in changed:
+            self._load_entities(changed['entity'])
+        if 'title_title' in changed:
+            self._load_titles(changed['title_title'])
+        if 'title_responsibility' in changed:
+            self._load_responsibility(changed['title_responsibility'])
+        if 'series' in changed:
+            self._load_series(changed['series'])
+        if 'member' in changed:
+            self._load_members(changed['member'])
+        return count
+
+    def _fetch(self, sql, column, ids):
+        # the whole table if ids is None, otherwise just those rows
+        args = None
+        if ids is not None:
+            sql += f' where {column} = any(%s)'
+            args = (list(ids),)
+        return self.db.getstreamcursor().stream(sql, args)
+
+    @staticmethod
+    def _group(rows):
+        grouped = {}
+        for (obj_id, *row) in rows:
+            grouped.setdefault(obj_id, []).append(row)
+        return grouped
+
+    def _load_entities(self, ids):
+        found = self._group(self._fetch(
+            'select entity_id, entity_name, alternate_entity_name'
+            ' from entity', 'entity_id', ids))
+        for entity_id in (ids or ()):
+            self.authors.discard(entity_id)
+        for entity_id, rows in found.items():
+            self.authors.set(entity_id, [
+                (key, name) for (name, alt) in rows for key in (name, alt)])
+
+    def _load_titles(self, ids):
+        found = self._group(self._fetch(
+            'select title_id, title_name, alternate_name'
+            ' from title_title', 'title_id', ids))
+        for title_id in (ids or ()):
+            self.titles.discard(title_id)
+        for title_id, rows in found.items():
+            self.titles.set(title_id, [
+                (key, name) for (name, alt) in rows for key in (name, alt)])
+
+    def _load_responsibility(self, ids):
+        found = self._group(self._fetch(
+            'select title_id, entity_id from title_responsibility',
+            'title_id', ids))
+        for title_id in (ids or ()):
+            for entity_id in self.title_entities.pop(title_id, ()):
+                self.entity_titles[entity_id].discard(title_id)
+        for title_id, rows in found.items():
+            self.title_entities[title_id] = {i for (i,) in rows}
+            for (entity_id,) in rows:
+                self.entity_titles.setdefault(entity_id, set()).add(title_id)
+
+    def _load_series(self, ids):
+        found = self._group(self._fetch(
+            'select series_id, series_name from series', 'series_id', ids))
+        for series_id in (ids or ()):
+            self.series.discard(series_id)
+        for series_id, rows in found.items():
+            self.series.set(series_id, [(name, name) for (name,) in rows])
+
+    def _load_members(self, ids):
+        found = self._group(self._fetch(
+            'select member_id, first_name, last_name, key_initials, email,'
+            '  pseudo'
+            ' from member', 'member_id', ids))
+        for member_id in (ids or ()):
+            self.members.pop(member_id, None)
+        for member_id, rows in found.items():
+            (first_name, last_name, key_initials, email, pseudo) = rows[0]
+            self.members[member_id] = (
+                ''.join(i or '' for i in (
+                    first_name, last_name, key_initials, email)),
+                format_name(first_name, last_name),
+                pseudo)
+
+    def complete_author(self, key):
+        '''
+        Authors.complete(), from memory.
+
+        Parameters
+        ----------
+        key : str
+            String to check against the start of author names.
+
+        Returns
+        -------
+        list(str)
+            a list of author names.
+
+        '''
+        return self.authors.complete(key)
+
+    def complete_title(self, title, author=None):
+        '''
+        Titles.complete(), from memory.
+
+        Parameters
+        ----------
+        title : str
+            String to check against the start of titles.
+        author : str, optional
+            Restrict the titles to the authors whose names start with this.
+
+        Returns
+        -------
+        list(str)
+            a list of titles to autocomplete with.
+
+        '''
+        if not author:
+            return self.titles.complete(title)
+
+        title_ids = set()
+        for (_, entity_id) in self.authors.matches(author):
+            title_ids.update(self.entity_titles.get(entity_id, ()))
+        title = title.upper()
+        return sorted({
+            value
+            for title_id in title_ids
+            for (key, value) in self.titles.by_id.get(title_id, ())
+            if key.startswith(title)})
+
+    def complete_series(self, s):
+        '''
+        SeriesIndex.complete(), from memory.
+
+        Parameters
+        ----------
+        s : str
+            String to check against the start of series names.
+
+        Returns
+        -------
+        list(str)
+            a list of series names.
+
+        '''
+        return self.series.complete(s.strip())
+
+    def complete_name(self, s, pseudo=False):
+        '''
+        Members.complete_name(), from memory. Every word of s has to be
+        somewhere in the member's name, key initials or email.
+
+        Parameters
+        ----------
+        s : str
+            A substring to search against the member names.
+        pseudo : bool, optional
+            Whether to look at the fake members instead. Default is False.
+
+        Returns
+        -------
+        list(str)
+            list of names.
+
+        '''
+        words = [re.compile(word, re.IGNORECASE)
+                 for word in re.split(r'[^a-zA-Z]+', s)]
+        return sorted(
+            name
+            for (haystack, name, is_pseudo) in self.members.values()
+            if is_pseudo == pseudo
+            and all(word.search(haystack) for word in words))
@@ -0,0 +1,378 @@
+'''
+Writing the dex out to files.
+
+export() streams the titles from the catalog in the right order and hands
+each one to any number of writers as it arrives. A writer either wants the
+whole dex in dex order, or a single shelfcode in shelf order; the server
+puts the titles in order (see DEX_ORDER and SHELF_ORDER in
+mitsfs.dex.titles), and every writer that wants the same order is fed from
+one scan, so the text dex and the TeX pinkdex come out of the same pass.
+'''
+
+import concurrent.futures
+import math
+
+from mitsfs.util import tex
+from mitsfs.dex.titles import Titles
+
+
+def book_line(title, count):
+    '''
+    The TeX line for a title on a shelf, with the dexline as a comment so it
+    can be found again.
+
+    Parameters
+    ----------
+    title : Title
+        the title to write.
+    count : int
+        how many copies are on the shelf.
+
+    Returns
+    -------
+    str
+        a \\Book{}{}{} line.
+
+    '''
+    return '\\Book{%s}{%s}{%s} %% %s\n' % (
+        tex.texquote(title.authortxt),
+        tex.texquote(tex.nicetitle(title)),
+        count, str(title))
+
+
+class DexWriter(object):
+    '''
+    Base class for the export writers. export() calls begin() with the
+    number of titles it's going to write, write() for each one, and then
+    end().
+
+    If shelfcode is None, the writer gets every title in dex order.
+    Otherwise it only gets the titles with a copy in that shelfcode, in
+    shelf order.
+    '''
+    shelfcode = None
+
+    def __init__(self, path):
+        self.path = path
+        self.fp = None
+        self.progress = None
+
+    def report(self, message):
+        if self.progress:
+            self.progress(message)
+
+    def begin(self, count):
+        self.fp = open(self.path, 'w')
+
+    def write(self, title):
+        raise NotImplementedError
+
+    def end(self):
+        if self.fp:
+            self.fp.close()
+            self.fp = None
+
+
+class TextWriter(DexWriter):
+    '''
+    The plain text dex, one dexline per title.
+    '''
+    def write(self, title):
+        self.fp.write(str(title) + '\n')
+
+
+class TexWriter(DexWriter):
+    '''
+    The full pinkdex, in TeX, with a break at each letter of the alphabet.
+    '''
+    def begin(self, count):
+        super().begin(count)
+        self.fp.write(tex.tex_header('Pinkdex'))
+        self.letter = None
+
+    def write(self, title):
+        letter = None
+        if title.placeauthor:
+            letter = title.placeauthor[0]
+
+        if self.letter != letter:
+            if self.letter is not None:
+                self.fp.write(r'\NextLetter' + '\n')
+            self.letter = letter
+            self.report(letter)
+
+        self.fp.write('\\Book{%s}{%s}{%s}\n' % (
+            tex.texquote(title.authortxt),
+            tex.texquote(tex.nicetitle(title)),
+            tex.texquote(str(title.codes).replace(':', r'\:'))))
+
+    def end(self):
+        if self.fp:
+            self.fp.write(tex.tex_footer())
+        super().end()
+
+
+class ShelfWriter(DexWriter):
+    '''
+    The shelfdex for one shelfcode, in TeX.
+    '''
+    def __init__(self, path, shelfcode):
+        super().__init__(path)
+        self.shelfcode = shelfcode
+
+    def begin(self, count):
+        super().begin(count)
+        self.fp.write(tex.tex_header('Shelfdex', self.shelfcode.code))
+
+    def write(self, title):
+        self.fp.write(book_line(
+            title, int(title.codes[self.shelfcode.code])))
+
+    def end(self):
+        if self.fp:
+            self.fp.write(tex.tex_footer())
+        super().end()
+
+
+def open_section(directory, shelfcode, section, report=None):
+    '''
+    Start the inventory file for a section.
+
+    Returns
+    -------
+    file
+        the file, with the TeX header already written.
+
+    '''
+    sc = shelfcode.code.replace('/', '_')
+    fp = open(f'{directory}/{sc}_{section}.tex', 'w')
+    if report:
+        report(f'Writing {sc}_{section}...')
+    fp.write(tex.tex_header(
+        'Invendex', f'{shelfcode.code} section {section}'))
+    return fp
+
+
+def inventory_files(inventory, shelfcode, directory, progress=None):
+    '''
+    Write the inventory files for one shelfcode from the sections worked
+    out when the inventory was opened, so nothing needs sorting.
+
+    Parameters
+    ----------
+    inventory : Inventory
+        the open inventory.
+    shelfcode : Shelfcode
+        the shelfcode to write.
+    directory : str
+        where to put the files.
+    progress : callable, optional
+        called with a string as it goes along, e.g. print.
+
+    Returns
+    -------
+    int
+        how many files were written.
+
+    '''
+    books = inventory.sections.books(shelfcode)
+    if not books:
+        if progress:
+            progress(f'No books for {shelfcode.code}. Continuing...')
+        return 0
+
+    # (section, shelf_order) => [title_id, copies]
+    lines = {}
+    for (section, shelf_order, book_id, title_id) in books:
+        line = lines.setdefault((section, shelf_order), [title_id, 0])
+        line[1] += 1
+    titles = {
+        title.id: title for title in
+        Titles(inventory.db).load(
+            {title_id for (title_id, _) in lines.values()})}
+
+    fp = None
+    current = None
+    try:
+        for ((section, _), (title_id, count)) in sorted(lines.items()):
+            if section != current:
+                if fp:
+                    fp.write(tex.tex_footer())
+                    fp.close()
+                fp = open_section(directory, shelfcode, section, progress)
+                current = section
+            fp.write(book_line(titles[title_id], count))
+    finally:
+        if fp:
+            fp.write(tex.tex_footer())
+            fp.close()
+    return len({section for (section, _) in lines})
+
+
+def _inventory_files_worker(dsn, client, inventory_id, code, directory):
+    '''
+    inventory_files() for one shelfcode, in a process of its own with its
+    own connection.
+
+    Returns
+    -------
+    (str, int, list(str))
+        the shelfcode, how many files were written and the progress
+        messages, to be passed on by the parent.
+
+    '''
+    # imported here, since the library imports this module
+    from mitsfs.library import Library
+    from mitsfs.dex.inventory import Inventory
+
+    library = Library(client=client, dsn=dsn)
+    try:
+        messages = []
+        count = inventory_files(
+            Inventory(library.db, inventory_id), library.shelfcodes[code],
+            directory, messages.append)
+        return code, count, messages
+    finally:
+        library.db.db.close()
+
+
+def parallel_inventory_files(
+        inventory, shelfcodes, directory, processes=None, progress=None):
+    '''
+    Write the inventory files for a set of shelfcodes, each in a worker
+    process with its own db connection. Each file is written by exactly one
+    worker, the same way inventory_files() would write it, so the output is
+    identical to doing them one at a time.
+
+    Parameters
+    ----------
+    inventory : Inventory
+        the open inventory.
+    shelfcodes : list(Shelfcode)
+        the shelfcodes to write.
+    directory : str
+        where to put the files.
+    processes : int, optional
+        how many workers. Default is one per CPU.
+    progress : callable, optional
+        called with a string as each shelfcode finishes, e.g. print.
+
+    Returns
+    -------
+    dict(str => int)
+        how many files were written for each shelfcode.
+
+    '''
+    def report(message):
+        if progress:
+            progress(message)
+
+    db = inventory.db
+    codes = [shelfcode.code for shelfcode in shelfcodes]
+    counts = {}
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes) as pool:
+        futures = [
+            pool.submit(_inventory_files_worker, db.dsn, db.client,
+                        inventory.id, code, directory)
+            for code in codes]
+        for future in concurrent.futures.as_completed(futures):
+            code, count, messages = future.result()
+            for message in messages:
+                report(message)
+            counts[code] = count
+            report(f'{code} done ({len(counts)}/{len(codes)})')
+    return counts
+
+
+class InventoryWriter(DexWriter):
+    '''
+    The inventory files for one shelfcode: the shelfdex split into a file
+    per section, with the titles spread evenly across them.
+    '''
+    def __init__(self, directory, shelfcode, sections):
+        super().__init__(directory)
+        self.shelfcode = shelfcode
+        self.sections = max(sections, 1)
+
+    def begin(self, count):
+        self.per_section = math.ceil(count / self.sections)
+        self.count = 0
+        self.section = 0
+        if not count:
+            self.report(f'No books for {self.shelfcode.code}. Continuing...')
+
+    def write(self, title):
+        if self.count % self.per_section == 0:
+            self.end()
+            self.section += 1
+            self.fp = open_section(
+                self.path, self.shelfcode, self.section, self.report)
+
+        self.fp.write(book_line(
+            title, int(title.codes[self.shelfcode.code])))
+        self.count += 1
+
+    def end(self):
+        if self.fp:
+            self.fp.write(tex.tex_footer())
+        super().end()
+
+
+def export(titles, writers, progress=None):
+    '''
+    Write the dex out through a set of writers. Each ordering asked for (the
+    dex order, plus shelf order for each shelfcode) is streamed from the db
+    already in that order, once, and each title is handed to every writer
+    that wants it as it comes in, so the dex is never all in memory.
+
+    Parameters
+    ----------
+    titles : Titles
+        the title index to export from.
+    writers : list(DexWriter)
+        where to write it all.
+    progress : callable, optional
+        called with a string as the export goes along, e.g. print.
+
+    Returns
+    -------
+    list((DexWriter, Title, Exception))
+        the titles that a writer choked on. They're left out of that
+        writer's output and everything else carries on.
+
+    '''
+    def report(message):
+        if progress:
+            progress(message)
+
+    orders = {}
+    for writer in writers:
+        writer.progress = progress
+        code = writer.shelfcode.code if writer.shelfcode else None
+        orders.setdefault(code, []).append(writer)
+
+    problems = []
+    for code, group in orders.items():
+        shelfcode = group[0].shelfcode
+        report(f'Writing {code}...' if code else 'Writing...')
+        count = titles.count_book_titles(shelfcode)
+        for writer in group:
+            writer.begin(count)
+        if shelfcode is None:
+            source = titles.iter_book_titles()
+        else:
+            source = titles.iter_shelf_titles(shelfcode)
+        try:
+            for title in source:
+                for writer in group:
+                    try:
+                        writer.write(title)
+                    except Exception as e:
+                        report(f'Problematic: {title.titles}')
+                        problems.append((writer, title, e))
+        finally:
+            for writer in group:
+                writer.end()
+
+    return problems
@@ -0,0 +1,130 @@
+'''
+Restrictions on which books a search turns up, e.g. only the ones that are
+checked out.
+
+A BookFilter can be handed to Catalog.grep() or Catalog.fuzzy(), which put
+it into the query as an EXISTS on the book table, so only titles with a
+matching book come back. It can also be called on a Book in hand, so the
+same filter picks the copies to offer once a title has been chosen.
+Filters combine with &, which means the same book has to pass both.
+'''
+
+
+class BookFilter(object):
+    '''
+    A condition on the book table, and the same condition in Python.
+    '''
+    def __init__(self, condition, args=(), predicate=None):
+        '''
+        Parameters
+        ----------
+        condition : str
+            an SQL condition on a (not withdrawn) row of book, which is
+            called book.
+        args : tuple, optional
+            values for the condition.
+        predicate : callable
+            takes a Book and returns whether it passes.
+
+        '''
+        self.condition = condition
+        self.args = tuple(args)
+        self.predicate = predicate
+
+    def where(self, title_id):
+        '''
+        Parameters
+        ----------
+        title_id : str
+            the title_id column of the query this is going into, e.g.
+            'title.title_id'
+
+        Returns
+        -------
+        (str, list)
+            a clause that's true when the title has a matching book, and its
+            arguments.
+
+        '''
+        return (
+            'exists (select 1 from book'
+            f' where book.title_id = {title_id}'
+            f' and not book.withdrawn and {self.condition})',
+            list(self.args))
+
+    def __call__(self, book):
+        return self.predicate(book)
+
+    def __and__(self, other):
+        return BookFilter(
+            f'({self.condition}) and ({other.condition})',
+            self.args + other.args,
+            lambda book: self(book) and other(book))
+
+
+OUT = BookFilter(
+    'exists (select 1 from checkout'
+    ' where checkout.book_id = book.book_id'
+    ' and checkin_stamp is null and checkout_lost is null)',
+    predicate=lambda book: book.out)
+
+IN = BookFilter(
+    'not exists (select 1 from checkout'
+    ' where checkout.book_id = book.book_id'
+    ' and checkin_stamp is null and checkout_lost is null)',
+    predicate=lambda book: not book.out)
+
+CIRCULATING = BookFilter(
+    'book.shelfcode_id in (select shelfcode_id from shelfcode'
+    "  where shelfcode_type = 'C')",
+    predicate=lambda book: book.circulating)
+
+
+def in_shelfcode(shelfcode):
+    '''
+    Parameters
+    ----------
+    shelfcode : Shelfcode
+        the shelfcode the books have to be in.
+
+    Returns
+    -------
+    BookFilter
+        books in that shelfcode.
+
+    '''
+    return BookFilter(
+        'book.shelfcode_id = %s', (shelfcode.id,),
+        lambda book: book.shelfcode == shelfcode)
+
+
+def missing(inventory, shelfcode=None):
+    '''
+    Parameters
+    ----------
+    inventory : Inventory
+        the inventory the books were reported missing in.
+    shelfcode : Shelfcode, optional
+        only the books missing from this shelfcode.
+
+    Returns
+    -------
+    BookFilter
+        the books that are missing and haven't been found yet.
+
+    '''
+    missing_sql = (
+        'select book_id from inventory_missing'
+        ' where inventory_id = %s and not located')
+    args = [inventory.id]
+    if shelfcode:
+        missing_sql += ' and inventory_missing.shelfcode = %s'
+        args.append(shelfcode.code)
+    condition = (
+        'exists (' + missing_sql +
+        ' and inventory_missing.book_id = book.book_id)')
+
+    # fetched once here, so testing a book is a set lookup
+    book_ids = set(inventory.db.getcursor().fetchlist(missing_sql, args))
+
+    return BookFilter(condition, args, lambda book: book.id in book_ids)
@@ -1,9 +1,11 @@
 import math
+import time
 from datetime import datetime
 
 from mitsfs.core import db
 from mitsfs.util import coercers
 from mitsfs.dex.books import Book
+from mitsfs.dex.titles import Title, Titles
 from mitsfs.util import exceptions
 from mitsfs.circulation import members
 
@@ -11,6 +13,10 @@ from mitsfs.circulation import members
 # books, it'll be broken into two sections, etc.
 INVENTORY_SIZE  = 500
 
+# how many seconds an InventoryProgress is trusted for, so sections claimed
+# and completed at other terminals show up on a status screen
+PROGRESS_MAX_AGE = 10
+
 '''
 Inventory has three database tables. The first simply opens and closes an
 inventory, putting the library into inventory mode. 
@@ -108,6 +114,8 @@ class Inventory(db.Entry):
         '''
         super().__init__('inventory', 'inventory_id', db, inventory_id, **kw)
 
+    progress_ = None
+
     open_date = db.Field('inventory_stamp', 
                                coercer=coercers.coerce_datetime_no_timezone)
     close_date = db.Field('inventory_closed', 
@@ -127,6 +135,21 @@ class Inventory(db.Entry):
         '''
         return InventorySections(self.db, self.id)
     
+    def progress(self):
+        '''
+        How far along the inventory is, loaded in one query and kept until
+        something is written to the db (or PROGRESS_MAX_AGE passes).
+
+        Returns
+        -------
+        InventoryProgress
+            the sections with their books and missing counts.
+
+        '''
+        if self.progress_ is None or self.progress_.stale:
+            self.progress_ = InventoryProgress(self)
+        return self.progress_
+
     def create(self, shelfcodes):
         '''
         Creates the inventory, and also figures out the sections for the 
@@ -143,13 +166,32 @@ class Inventory(db.Entry):
 
         '''
         super().create(commit=False)
-        counts = shelfcodes.stats()
+
+        # the books on each shelf, so the sections can be worked out now
+        # rather than every time something needs to know what's in one
+        books = {}
+        counts = {}
+        for (title_id, code, book_id) in self.cursor.execute(
+                'select title_id, shelfcode, book_id'
+                ' from book natural join shelfcode'
+                ' where not withdrawn'
+                ' order by book_id'):
+            books.setdefault((title_id, code), []).append(book_id)
+            counts[code] = counts.get(code, 0) + 1
+        titles = Titles(self.db).book_titles()
+
         for shelfcode in shelfcodes.values():
             if shelfcode.code not in counts:
                 continue
             count = counts[shelfcode.code]
             sections = math.ceil(count / INVENTORY_SIZE)
             self.sections.add_shelfcode(shelfcode, sections)
+            self.sections.divide(
+                shelfcode, sections,
+                sorted((title for title in titles
+                        if shelfcode.code in title.codes),
+                       key=lambda x: x.shelfkey(shelfcode.code)),
+                books)
         self.db.commit()
     
     
@@ -159,15 +201,43 @@ class Inventory(db.Entry):
         from the library, then the close date will be added to the inventory
         row, returning the library to normal function.
 
+        The books are all withdrawn by one update, and that and the close
+        date go in as one transaction.
+
         Returns
         -------
-        None.
-
-        '''
-        for book in self.get_missing_books():
-            book.withdraw()
-        self.db.commit()
+        list((str, str))
+            the shelfcode and description of each book withdrawn, by
+            shelfcode and then in dex order.
+
+        '''
+        withdrawn = self.cursor.execute(
+            'with withdrawn as ('
+            '  update book set withdrawn = true'
+            '   where not withdrawn and book_id in ('
+            '    select book_id from inventory_missing'
+            '     where inventory_id = %s and not located)'
+            '   returning book_id, title_id, shelfcode_id)'
+            ' select title_id, shelfcode'
+            '  from withdrawn natural join shelfcode',
+            (self.id,)).fetchall()
+
+        self.docommit = False
         self.close_date = datetime.now()
+        self.commit()
+
+        # the titles come back in dex order, with everything for
+        # Book.__str__ already loaded
+        titles = {
+            title.id: (i, title) for (i, title) in enumerate(
+                Titles(self.db).load(
+                    {title_id for (title_id, _) in withdrawn}))}
+        summary = []
+        for (title_id, code) in withdrawn:
+            (i, title) = titles.get(title_id, (0, Title(self.db, title_id)))
+            summary.append(((code, i), (code, '%s<%s<%s<%s' % (
+                title.authortxt, title.titletxt, title.seriestxt, code))))
+        return [line for (_, line) in sorted(summary)]
 
     def report_missing_book(self, book):
         '''
@@ -232,14 +302,15 @@ class Inventory(db.Entry):
             s = ' and shelfcode = %s'
             args.append(shelfcode.code)
             
-        return [Book(self.db, i) for i in 
-                self.cursor.fetchlist(
-                    'select book_id from inventory_missing'
-                    ' where inventory_id = %s'
-                    + s +
-                    ' and not located',
-                    args
-                    )]
+        return Book.load_many(
+            self.db,
+            self.cursor.fetchlist(
+                'select book_id from inventory_missing'
+                ' where inventory_id = %s'
+                + s +
+                ' and not located',
+                args
+                ))
     
     def stats(self, shelfcode=None):
         '''
@@ -325,7 +396,8 @@ class InventorySections(object):
             args.append(section)
         
         results = self.db.cursor.execute(
-            'select shelfcode, section, member_id, complete'
+            'select'
+            '  shelfcode, section, member_id, complete, first_title, last_title'
             ' from inventory_sections'
             ' where inventory_id = %s'
             + shelfcode_query
@@ -367,6 +439,139 @@ class InventorySections(object):
            rows)
         self.db.commit()
         
+    def divide(self, shelfcode, section_count, titles, books):
+        '''
+        Split a shelfcode's titles evenly across its sections, and record
+        which books are in each one and where they are on the shelf.
+
+        Parameters
+        ----------
+        shelfcode : Shelfcode object
+            The shelfcode being divided.
+        section_count : int
+            The number of sections it has.
+        titles : list(Title)
+            The titles on the shelf, in shelf order.
+        books : dict((int, str) => list(int))
+            The book_ids for each (title_id, shelfcode code).
+
+        Returns
+        -------
+        None.
+
+        '''
+        if not titles:
+            return
+        per_section = math.ceil(len(titles) / max(section_count, 1))
+        rows = []
+        for (i, title) in enumerate(titles):
+            for book_id in books.get((title.id, shelfcode.code), ()):
+                rows.append((self.inventory_id, book_id, shelfcode.code,
+                             i // per_section + 1, i))
+        self.db.cursor.executemany(
+            'insert into inventory_section_books'
+            ' (inventory_id, book_id, shelfcode, section, shelf_order)'
+            ' values (%s, %s, %s, %s, %s)',
+            rows)
+        self.db.cursor.executemany(
+            'update inventory_sections'
+            ' set first_title = %s, last_title = %s'
+            ' where inventory_id = %s and shelfcode = %s and section = %s',
+            [(str(titles[start]),
+              str(titles[min(start + per_section, len(titles)) - 1]),
+              self.inventory_id, shelfcode.code, start // per_section + 1)
+             for start in range(0, len(titles), per_section)])
+        self.db.commit()
+
+    def books(self, shelfcode, section=None):
+        '''
+        The books that were in a section (or the whole shelfcode) when the
+        inventory was opened.
+
+        Parameters
+        ----------
+        shelfcode : Shelfcode object
+            The shelfcode.
+        section : int, optional
+            The section in the shelfcode.
+
+        Returns
+        -------
+        list((int, int, int, int))
+            section, shelf_order, book_id and title_id for each book, in
+            shelf order.
+
+        '''
+        args = [self.inventory_id, shelfcode.code]
+        section_query = ''
+        if section:
+            section_query = ' and section = %s'
+            args.append(section)
+        return self.db.cursor.execute(
+            'select section, shelf_order, book_id, title_id'
+            ' from inventory_section_books natural join book'
+            ' where inventory_id = %s and shelfcode = %s'
+            + section_query +
+            ' order by section, shelf_order, book_id',
+            args).fetchall()
+
+    def section_of(self, book):
+        '''
+        Parameters
+        ----------
+        book : Book
+            A book.
+
+        Returns
+        -------
+        (str, int) or None
+            The shelfcode and section the book was in when the inventory was
+            opened, or None if it wasn't on the shelves then.
+
+        '''
+        return self.db.cursor.execute(
+            'select shelfcode, section from inventory_section_books'
+            ' where inventory_id = %s and book_id = %s',
+            (self.inventory_id, book.id)).fetchone()
+
+    def missing_counts(self, shelfcode=None):
+        '''
+        How many books each section has, and how many of them are missing.
+
+        Parameters
+        ----------
+        shelfcode : Shelfcode object, optional
+            Limit to just the sections for one shelfcode.
+
+        Returns
+        -------
+        dict((str, int) => (int, int))
+            (shelfcode, section) => (books, missing)
+
+        '''
+        args = [self.inventory_id]
+        shelfcode_query = ''
+        if shelfcode:
+            shelfcode_query = ' and section_books.shelfcode = %s'
+            args.append(shelfcode.code)
+        return {
+            (code, section): (books, missing)
+            for (code, section, books, missing) in self.db.cursor.execute(
+                'select'
+                '  section_books.shelfcode, section, count(*),'
+                '  count(inventory_missing.book_id)'
+                ' from'
+                '  inventory_section_books section_books'
+                '  left join inventory_missing'
+                '  on inventory_missing.inventory_id ='
+                '     section_books.inventory_id'
+                '   and inventory_missing.book_id = section_books.book_id'
+                '   and not located'
+                ' where section_books.inventory_id = %s'
+                + shelfcode_query +
+                ' group by section_books.shelfcode, section',
+                args)}
+
     def checkout_section(self, shelfcode, section, member):
         '''
         Claim a section for a member who is going to work on it.
@@ -419,7 +624,9 @@ class InventorySections(object):
 
         
 class InventorySection(object):
-    def __init__(self, db, shelfcode, section, member_id, complete):
+    def __init__(self, db, shelfcode, section, member_id, complete,
+                 first_title=None, last_title=None, member_name=None,
+                 books=0, missing=0):
         '''
         Just a data object to give you structured access to the rows
 
@@ -437,6 +644,16 @@ class InventorySection(object):
             The member who has checked out this section (if any).
         complete : boolean
             Whether the section has been completed..
+        first_title : str, optional
+            The dexline of the first title in the section.
+        last_title : str, optional
+            The dexline of the last title in the section.
+        member_name : str, optional
+            The name of the member who has it, if it's been looked up.
+        books : int, optional
+            How many books were in the section when the inventory opened.
+        missing : int, optional
+            How many of those are missing.
 
         Returns
         -------
@@ -448,6 +665,11 @@ class InventorySection(object):
         self.section = section
         self.complete = complete
         self.member_id = member_id
+        self.first_title = first_title
+        self.last_title = last_title
+        self.member_name = member_name
+        self.books = books
+        self.missing = missing
     
     @property
     def out_to(self):
@@ -462,4 +684,251 @@ class InventorySection(object):
 
     def __repr__(self):
         return (f'<{self.shelfcode}, {self.section}, '
-                f'{self.complete}, {self.member_id}>')
\ No newline at end of file
+                f'{self.complete}, {self.member_id}>')
+
+
+class InventoryProgress(object):
+    '''
+    Everything a status screen shows about an inventory, fetched in one
+    grouped query.
+
+    Attributes
+    ----------
+    sections : list(InventorySection)
+        every section, by shelfcode and section, with member_name, books and
+        missing filled in.
+    shelfcodes : dict(str => (int, int, int))
+        sections complete, sections and books missing for each shelfcode.
+    '''
+    def __init__(self, inventory):
+        self.db = inventory.db
+        self.generation = self.db.writes
+        self.loaded = time.monotonic()
+
+        rows = self.db.getcursor().execute(
+            'select'
+            '  s.shelfcode, s.section, s.member_id, s.complete,'
+            '  s.first_title, s.last_title, first_name, last_name,'
+            '  coalesce(books.books, 0), coalesce(books.missing, 0),'
+            '  coalesce(missing.missing, 0)'
+            ' from'
+            '  inventory_sections s'
+            '  left join member on member.member_id = s.member_id'
+            '  left join'
+            '  (select'
+            '     section_books.shelfcode, section, count(*) as books,'
+            '     count(inventory_missing.book_id) as missing'
+            '    from'
+            '     inventory_section_books section_books'
+            '     left join inventory_missing'
+            '     on inventory_missing.inventory_id ='
+            '        section_books.inventory_id'
+            '      and inventory_missing.book_id = section_books.book_id'
+            '      and not located'
+            '    where section_books.inventory_id = %s'
+            '    group by section_books.shelfcode, section) as books'
+            '  on books.shelfcode = s.shelfcode and books.section = s.section'
+            '  left join'
+            '  (select shelfcode, count(*) as missing'
+            '    from inventory_missing'
+            '    where inventory_id = %s and not located'
+            '    group by shelfcode) as missing'
+            '  on missing.shelfcode = s.shelfcode'
+            ' where s.inventory_id = %s'
+            ' order by s.shelfcode, s.section',
+            (inventory.id, inventory.id, inventory.id)).fetchall()
+
+        self.sections = []
+        self.shelfcodes = {}
+        for (code, section, member_id, complete, first_title, last_title,
+             first_name, last_name, books, missing, shelf_missing) in rows:
+            self.sections.append(InventorySection(
+                self.db, code, section, member_id, complete,
+                first_title, last_title,
+                members.format_name(first_name, last_name)
+                if member_id else None,
+                books, missing))
+            (done, total, _) = self.shelfcodes.get(code, (0, 0, 0))
+            self.shelfcodes[code] = (
+                done + bool(complete), total + 1, shelf_missing)
+
+    def get(self, shelfcode=None):
+        '''
+        Returns
+        -------
+        list(InventorySection)
+            the sections, or just the ones for a shelfcode.
+        '''
+        if shelfcode is None:
+            return list(self.sections)
+        return [section for section in self.sections
+                if section.shelfcode == shelfcode.code]
+
+    @property
+    def done(self):
+        return sum(done for (done, _, _) in self.shelfcodes.values())
+
+    @property
+    def total(self):
+        return len(self.sections)
+
+    @property
+    def missing(self):
+        return sum(missing for (_, _, missing) in self.shelfcodes.values())
+
+    @property
+    def stale(self):
+        '''
+        Whether anything has been written through our connection since this
+        was loaded, or it's just old.
+        '''
+        return (self.generation != self.db.writes
+                or time.monotonic() - self.loaded > PROGRESS_MAX_AGE)
+
+
+class SectionScan(object):
+    '''
+    A section being inventoried with a barcode scanner.
+
+    The books that should be in the section, and the barcodes on them, are
+    loaded up front, so each scan is a dictionary lookup. Nothing is
+    written until complete(), which records the missing books, marks any
+    that turned up as found and completes the section in one transaction.
+
+    Attributes
+    ----------
+    expected : set(int)
+        the book_ids that were in the section when the inventory opened.
+    scanned : set(int)
+        the ones of those that have been scanned.
+    unexpected : list(str)
+        whatever was scanned that isn't one of them, in order.
+    '''
+    def __init__(self, inventory, shelfcode, section):
+        '''
+        Parameters
+        ----------
+        inventory : Inventory
+            The open inventory.
+        shelfcode : Shelfcode object
+            The shelfcode.
+        section : int
+            The section in the shelfcode.
+
+        '''
+        self.db = inventory.db
+        self.inventory = inventory
+        self.shelfcode = shelfcode
+        self.section = section
+
+        # a book can be scanned by its barcode, or have its book_id typed
+        # in if the barcode is missing
+        self.identifiers = {}
+        self.expected = set()
+        for (book_id, barcode) in self.db.getcursor().execute(
+                'select section_books.book_id, barcode'
+                ' from'
+                '  inventory_section_books section_books'
+                '  left join barcode'
+                '  on barcode.book_id = section_books.book_id'
+                ' where inventory_id = %s and shelfcode = %s'
+                '  and section = %s',
+                (inventory.id, shelfcode.code, section)):
+            self.expected.add(book_id)
+            self.identifiers[str(book_id)] = book_id
+            if barcode:
+                self.identifiers[barcode] = book_id
+        self.scanned = set()
+        self.unexpected = []
+
+    def scan(self, identifier):
+        '''
+        Parameters
+        ----------
+        identifier : str
+            A barcode or book_id.
+
+        Returns
+        -------
+        bool
+            Whether it's a book that belongs in this section.
+
+        '''
+        identifier = identifier.strip()
+        book_id = self.identifiers.get(identifier)
+        if book_id is None:
+            self.unexpected.append(identifier)
+            return False
+        self.scanned.add(book_id)
+        return True
+
+    @property
+    def missing(self):
+        '''
+        Returns
+        -------
+        set(int)
+            The book_ids that haven't been scanned (yet).
+        '''
+        return self.expected - self.scanned
+
+    def complete(self):
+        '''
+        Record the books that weren't scanned as missing, mark any scanned
+        ones that had been reported missing as found, and complete the
+        section, all in one transaction.
+
+        Returns
+        -------
+        list((str, (str, int) or None))
+            Each unexpected identifier, with the shelfcode and section it
+            belongs in, or None if it isn't a book in the inventory.
+
+        '''
+        c = self.db.getcursor()
+        missing = sorted(self.missing)
+        try:
+            c.execute(
+                'insert into inventory_missing'
+                ' (inventory_id, book_id, shelfcode, located)'
+                ' select %s, missing.book_id, %s, false'
+                '  from unnest(%s::integer[]) as missing(book_id)'
+                '  where not exists ('
+                '   select 1 from inventory_missing'
+                '    where inventory_id = %s'
+                '     and inventory_missing.book_id = missing.book_id'
+                '     and not located)',
+                (self.inventory.id, self.shelfcode.code, missing,
+                 self.inventory.id))
+            c.execute(
+                'update inventory_missing set located = true'
+                ' where inventory_id = %s and book_id = any(%s)'
+                '  and not located',
+                (self.inventory.id, sorted(self.scanned)))
+            c.execute(
+                'update inventory_sections set complete = true'
+                ' where inventory_id = %s and shelfcode = %s'
+                '  and section = %s',
+                (self.inventory.id, self.shelfcode.code, self.section))
+
+            # where the strays go, in one go
+            # a barcode wins over a book_id that looks the same
+            book_ids = {i: int(i) for i in self.unexpected if i.isdigit()}
+            if self.unexpected:
+                book_ids.update(c.execute(
+                    'select barcode, book_id from barcode'
+                    ' where barcode = any(%s)',
+                    (self.unexpected,)))
+            places = {
+                book_id: (code, section)
+                for (book_id, code, section) in c.execute(
+                    'select book_id, shelfcode, section'
+                    ' from inventory_section_books'
+                    ' where inventory_id = %s and book_id = any(%s)',
+                    (self.inventory.id, list(book_ids.values())))}
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return [(i, places.get(book_ids.get(i)))
+                for i in self.unexpected]
@@ -67,6 +67,7 @@ class Shelfcode(db.Entry):
         self.db.getcursor().execute("update shelfcode"
                                     " set shelfcode_type = 'D'"
                                     " where shelfcode_id = %s", (self.id))
+        self.cache['shelfcode_type'] = 'D'
         self.db.commit
 
 
@@ -97,14 +98,37 @@ class Shelfcodes(dict):
     '''
     A dictionary of shelfcode objects, keyed by shelfcode
     
-    Loaded from the db on initialization
+    Loaded from the db on initialization. Also keeps a secondary index of
+    the same objects keyed by shelfcode_id, for turning book rows into
+    shelfcodes.
     '''
     def __init__(self, db):
         super().__init__()
 
         self.db = db
+        self.by_id = {}
         self.load_from_db()
 
+    def __setitem__(self, key, shelfcode):
+        super().__setitem__(key, shelfcode)
+        if shelfcode.id is not None:
+            self.by_id[shelfcode.id] = shelfcode
+
+    def get_by_id(self, shelfcode_id):
+        '''
+        Parameters
+        ----------
+        shelfcode_id : int
+            the id of the shelfcode in the db
+
+        Returns
+        -------
+        Shelfcode
+            The shelfcode, or None if it's unknown (or deprecated)
+
+        '''
+        return self.by_id.get(shelfcode_id)
+
     def load_from_db(self):
         '''
         Making a separate db load method for easier reloading
@@ -117,6 +141,9 @@ class Shelfcodes(dict):
         # keep track of these two lists to build the matching regex
         double = []
         normal = []
+        # start both indexes over, so ones that have gone away go from both
+        self.clear()
+        self.by_id = {}
         for row in c.fetchall():
             (s_id, shelfcode, description, ctype,
              cost, code_class, is_double) = row
@@ -124,7 +151,7 @@ class Shelfcodes(dict):
                           description=description,
                           code_type=ctype, replacement_cost=cost,
                           code_class=code_class, is_double=is_double)
-            super().__setitem__(s.code, s)
+            self[s.code] = s
             if is_double:
                 double.append(shelfcode)
             else:
@@ -147,7 +174,6 @@ class Shelfcodes(dict):
             Titles for each title that has a copy in this shelfcode.
 
         '''
-        c = self.db.getcursor()
         try:
             from mitsfs.dex.editions import Edition
             e = Edition(key)
@@ -175,10 +201,11 @@ class Shelfcodes(dict):
             values += [doublecrap]
         q += ' order by entity_name, title_name'
         from mitsfs.dex.titles import Title
+        c = self.db.getstreamcursor()
         return (
             Title(self.db, title_id[0])
             for title_id
-            in c.execute(q, values))
+            in c.stream(q, values))
 
     def stats(self):
         '''
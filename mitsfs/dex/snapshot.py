@@ -0,0 +1,301 @@
+'''
+An in-memory copy of the dex, kept up to date from the log table.
+
+Every change to a title, its authors, titles, series or books goes through
+log_row(), which writes a row to log with an ever increasing generation. So
+once the dex is loaded, we only need to look at the log entries after the
+last generation we saw to know which titles to reload.
+
+The titles are kept as the plain tuples Titles.iter_book_lines() gives
+rather than as Title objects, which are much bigger; a Title is made from
+its line only when it's handed out.
+'''
+
+import re
+
+from mitsfs.core import settings
+from mitsfs.dex.editions import Editions
+from mitsfs.dex.series import munge_series
+
+# where things are in the lines from Titles.iter_book_lines()
+AUTHORS, TITLES, SERIES, CODES = range(4)
+
+# tables whose log entries have a title_id for their obj_id
+TITLE_TABLES = ('title', 'title_responsibility', 'title_title', 'title_series')
+
+
+def parse_change(change):
+    '''
+    Pull apart the change text log_row() writes:
+
+        EVENT table
+        column nlines
+        value (nlines lines of it)
+        ...
+
+    Updates list each changed column twice, old value then new.
+
+    Parameters
+    ----------
+    change : str
+        the change column of a log row.
+
+    Returns
+    -------
+    (str, str, dict(str: list(str)))
+        the event (INSERT, UPDATE or DELETE), the table and the values of
+        each column mentioned.
+
+    '''
+    lines = change.split('\n')
+    event, table = lines[0].split(' ', 1)
+    values = {}
+    i = 1
+    # there's a trailing newline, so the last line is always empty
+    while i < len(lines) - 1:
+        column, count = lines[i].rsplit(' ', 1)
+        count = int(count)
+        values.setdefault(column, []).append(
+            '\n'.join(lines[i + 1:i + 1 + count]))
+        i += 1 + count
+    return event, table, values
+
+
+class CatalogSnapshot(object):
+    '''
+    All the titles we have books for, loaded once and then caught up with
+    refresh(), which is up to the caller; nothing here goes back to the db
+    on its own.
+    '''
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.db = catalog.db
+        self.load()
+
+    def load(self):
+        '''
+        (Re)load everything from the db.
+        '''
+        # Read the generation before the titles, so anything that changes
+        # while we're loading gets replayed (harmlessly) on the next
+        # refresh. A transaction that takes a generation but commits after
+        # we read it can still slip past; a load() picks that up.
+        c = self.db.getcursor()
+        self.generation = c.selectvalue(
+            'select coalesce(max(generation), 0) from log')
+        # title_id: (sort key, line)
+        self.lines = {
+            title_id: (sortkey, line)
+            for (sortkey, title_id, line)
+            in self.catalog.titles.iter_book_lines()}
+        self._sorted = None
+
+    def refresh(self):
+        '''
+        Replay the log since the last generation we saw, reloading any
+        titles that have changed.
+
+        Returns
+        -------
+        int
+            how many titles were reloaded.
+
+        '''
+        c = self.db.getcursor()
+        title_ids = set()
+        book_ids = set()
+        entity_ids = set()
+        series_ids = set()
+        reload = False
+        generation = self.generation
+        for (generation, obj_id, change) in c.execute(
+                'select generation, obj_id, change'
+                ' from log'
+                ' where generation > %s'
+                ' order by generation', (self.generation,)):
+            event, table, values = parse_change(change)
+            if table in TITLE_TABLES:
+                title_ids.add(obj_id)
+            elif table == 'book':
+                book_ids.add(obj_id)
+                # the book may have moved between titles, or be gone
+                title_ids.update(
+                    int(i) for i in values.get('title_id', []) if i.isdigit())
+            elif table == 'entity':
+                entity_ids.add(obj_id)
+            elif table == 'series':
+                series_ids.add(obj_id)
+            elif table == 'shelfcode':
+                # this could change any line in the dex
+                reload = True
+
+        if generation == self.generation:
+            return 0
+
+        if reload:
+            self.load()
+            return len(self.lines)
+
+        if book_ids:
+            title_ids.update(c.fetchlist(
+                'select title_id from book where book_id = any(%s)',
+                (list(book_ids),)))
+        if entity_ids:
+            title_ids.update(c.fetchlist(
+                'select title_id from title_responsibility'
+                ' where entity_id = any(%s)',
+                (list(entity_ids),)))
+        if series_ids:
+            title_ids.update(c.fetchlist(
+                'select title_id from title_series where series_id = any(%s)',
+                (list(series_ids),)))
+
+        for title_id in title_ids:
+            self.lines.pop(title_id, None)
+        if title_ids:
+            for (sortkey, title_id, line) in \
+                    self.catalog.titles.iter_book_lines(title_ids=title_ids):
+                self.lines[title_id] = (sortkey, line)
+
+        self.generation = generation
+        self._sorted = None
+        return len(title_ids)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __contains__(self, title_id):
+        return title_id in self.lines
+
+    def __getitem__(self, title_id):
+        return self._title(title_id)
+
+    def __iter__(self):
+        '''
+        The titles in dex order
+        '''
+        return (self._title(title_id) for title_id in self._order())
+
+    def _order(self):
+        # the title_ids in dex order, by the same keys (and tiebreak) as
+        # Titles.iter_book_titles()
+        if self._sorted is None:
+            self._sorted = sorted(
+                self.lines, key=lambda i: (self.lines[i][0], i))
+        return self._sorted
+
+    def _title(self, title_id):
+        return self.catalog.titles.make_title(
+            title_id, self.lines[title_id][1])
+
+    def iter_book_titles(self, shelfcode=None, title_ids=None):
+        '''
+        Titles.iter_book_titles(), from memory, so the snapshot can be
+        handed to mitsfs.dex.export.export()
+        '''
+        for title_id in self._book_title_ids(shelfcode, title_ids):
+            yield self._title(title_id)
+
+    def _book_title_ids(self, shelfcode=None, title_ids=None):
+        for title_id in self._order():
+            if title_ids is not None and title_id not in title_ids:
+                continue
+            if shelfcode and shelfcode.code not in Editions(
+                    self.lines[title_id][1][CODES]):
+                continue
+            yield title_id
+
+    def iter_shelf_titles(self, shelfcode):
+        '''
+        Titles.iter_shelf_titles(), from memory
+        '''
+        return iter(sorted(
+            self.iter_book_titles(shelfcode),
+            key=lambda x: x.shelfkey(shelfcode.code)))
+
+    def count_book_titles(self, shelfcode=None):
+        '''
+        Titles.count_book_titles(), from memory
+        '''
+        return sum(1 for _ in self._book_title_ids(shelfcode))
+
+    def grep(self, candidate):
+        '''
+        Catalog.grep(), from memory. Only titles we have books for are in
+        the snapshot, so it won't find the others.
+
+        Parameters
+        ----------
+        candidate : str
+            a regular expression, or several in dexline form
+            (author<title<series<shelfcodes)
+
+        Returns
+        -------
+        list(Title)
+            the matching titles, in dex order.
+
+        '''
+        candidate = candidate.upper()
+        suffix = _responsibility_suffix()
+        if '<' in candidate:
+            parts = candidate.split('<') + ['', '', '']
+            author, title, series, codes = parts[:4]
+            tests = []
+            if author:
+                tests.append(lambda x, r=re.compile(author):
+                             _any(r, _author_names(x, suffix)))
+            if title:
+                tests.append(lambda x, r=re.compile(title):
+                             _any(r, _title_names(x)))
+            if series:
+                tests.append(lambda x, r=re.compile(series):
+                             _any(r, _series_names(x)))
+            if codes:
+                tests.append(lambda x, c=codes.split(','):
+                             any(code in Editions(x[CODES]) for code in c))
+            if not tests:
+                return []
+
+            def test(x):
+                return all(t(x) for t in tests)
+        else:
+            r = re.compile(candidate)
+
+            def test(x):
+                return (_any(r, _author_names(x, suffix))
+                        or _any(r, _title_names(x))
+                        or _any(r, _series_names(x)))
+        return [
+            self._title(title_id) for title_id in self._order()
+            if test(self.lines[title_id][1])]
+
+
+def _any(regex, names):
+    return any(regex.search(name) for name in names if name)
+
+
+def _author_names(line, suffix):
+    # the authors come with their responsibility tacked on, e.g.
+    # NAME=ALT (EDITOR), so take that off before splitting out the alt name
+    for author in line[AUTHORS]:
+        if suffix:
+            author = suffix.sub('', author)
+        yield from author.split('=', 1)
+
+
+def _title_names(line):
+    for name in line[TITLES]:
+        yield from name.split('=', 1)
+
+
+def _series_names(line):
+    for series in line[SERIES]:
+        yield munge_series(series)[0]
+
+
+def _responsibility_suffix():
+    if not settings.responsibility_types_global:
+        return None
+    return re.compile(r' \((?:%s)\)$' % '|'.join(
+        re.escape(i) for i in settings.responsibility_types_global.values()))
@@ -1,3 +1,4 @@
+import itertools
 import re
 
 from mitsfs.core import db, dexline
@@ -5,6 +6,45 @@ from mitsfs.util import exceptions, utils
 from mitsfs.dex.editions import Editions
 from mitsfs.dex.books import Book
 from mitsfs.dex.series import munge_series
+from mitsfs.circulation.members import format_name
+
+
+# The orderings Titles._stream() can load titles in: queries for
+# (title_id, sortkey), where sortkey is a text array in the C collation, so
+# it sorts the same way on the server as the list does in python.
+
+# dex order, as DexLine.sortkey() but with title_id as the last tiebreak
+DEX_ORDER = (
+    "select"
+    "  title_id,"
+    "  array[coalesce(sortkey_author, ''), coalesce(sortkey_title, '')]"
+    "  as sortkey"
+    " from title left join title_sortkey using (title_id)")
+
+# shelf order for the books in one shelfcode, built the same way as
+# DexLine.shelfkey(): the double info, then the author, then the series and
+# its number if the series is shown on the spine, then the title
+SHELF_ORDER = (
+    "select"
+    "  title_id,"
+    "  array_remove(array["
+    "   nullif(doublecrap, '') collate \"C\","
+    "   coalesce(sortkey_author, ''),"
+    "   case when show_series then coalesce(sortkey_series, '') end,"
+    "   case when show_series then sortkey_series_number end,"
+    "   coalesce(sortkey_title, '')], null) as sortkey"
+    " from"
+    "  (select"
+    "     title_id, min(doublecrap) as doublecrap,"
+    "     coalesce(("
+    "      select bool_or(book_series_visible) or series_visible"
+    "       from title_series"
+    "       where title_series.title_id = book.title_id"
+    "       order by order_series_by limit 1), false) as show_series"
+    "    from book"
+    "    where not withdrawn and shelfcode_id = %s"
+    "    group by title_id) as shelved"
+    "  left join title_sortkey using (title_id)")
 
 
 class Titles(object):
@@ -19,9 +59,23 @@ class Titles(object):
         list(str)
             A list of all the titles we have in the dex.
         '''
-        c = self.db.getcursor()
-        return c.fetchlist("select CONCAT_WS('=', title_name, alternate_name)"
-                           " from title_title")
+        return list(self.iterkeys())
+
+    def iterkeys(self):
+        '''
+        Like keys(), but streams the titles from the server rather than
+        loading them all at once.
+
+        Yields
+        ------
+        str
+            each title we have in the dex.
+        '''
+        c = self.db.getstreamcursor()
+        for (title,) in c.stream(
+                "select CONCAT_WS('=', title_name, alternate_name)"
+                " from title_title"):
+            yield title
 
     def search(self, title):
         '''
@@ -189,32 +243,326 @@ class Titles(object):
             "  or alternate_entity_name ilike %s",
             (f'{author}%', f'{author}%'))
 
-    def book_titles(self, shelfcode=None):
+    def book_titles(self, shelfcode=None, title_ids=None):
         '''
-        A list of titles for which we have a book
+        A list of titles for which we have a book. See iter_book_titles() if
+        you don't need them all at once.
 
         Parameters
         ----------
         shelfcode : Shelfcode (optional)
            Limit this to books of a specific shelfcode
+        title_ids : list(int) (optional)
+           Limit this to these titles
 
         Returns
         -------
-        list(str)
-            a list of title objects for autocomplete.
+        list(Title)
+            a list of title objects with their authors, titles, series and
+            codes already loaded, so they can be sorted and written out
+            without going back to the db for each one.
 
         '''
-        c = self.db.getcursor()
+        return list(self.iter_book_titles(shelfcode, title_ids))
+
+    def iter_book_titles(self, shelfcode=None, title_ids=None):
+        '''
+        Like book_titles(), but streams the titles from the server, in dex
+        order, rather than loading them all at once.
+
+        Parameters
+        ----------
+        shelfcode : Shelfcode (optional)
+           Limit this to books of a specific shelfcode
+        title_ids : list(int) (optional)
+           Limit this to these titles
+
+        Yields
+        ------
+        Title
+            each title with its authors, titles, series and codes already
+            loaded.
+
+        '''
+        return (
+            self.make_title(title_id, line)
+            for (_, title_id, line) in self.iter_book_lines(
+                shelfcode, title_ids))
+
+    def iter_book_lines(self, shelfcode=None, title_ids=None):
+        '''
+        iter_book_titles() without the Title objects, for keeping a lot of
+        titles around (see CatalogSnapshot) and making Titles out of them
+        with make_title() only when they're wanted.
+
+        Parameters
+        ----------
+        shelfcode : Shelfcode (optional)
+           Limit this to books of a specific shelfcode
+        title_ids : list(int) (optional)
+           Limit this to these titles
+
+        Yields
+        ------
+        (tuple(str), int, tuple)
+            the dex order sort key, the title_id and the arguments to
+            Title.preload(), in dex order.
+
+        '''
+        restriction = ('title_id in (select title_id from book'
+                       '  where not withdrawn')
+        args = []
         if shelfcode:
-            return [Title(self.db, i) for i in c.fetchlist(
-                'select distinct title_id'
-                ' from title natural join book'
-                ' where not withdrawn and shelfcode_id = %s', (shelfcode.id,))]
-        else:
-            return [Title(self.db, i) for i in c.fetchlist(
-                'select distinct title_id'
-                ' from title natural join book'
-                ' where not withdrawn')]
+            restriction += ' and shelfcode_id = %s'
+            args.append(shelfcode.id)
+        restriction += ')'
+        if title_ids is not None:
+            restriction += ' and title_id = any(%s)'
+            args.append(list(title_ids))
+        return self._stream_lines(restriction, args or None)
+
+    def make_title(self, title_id, line):
+        '''
+        A Title from one of the lines iter_book_lines() gives, with its
+        caches seeded from it.
+        '''
+        title = Title(self.db, title_id)
+        title.preload(*line)
+        return title
+
+    def count_book_titles(self, shelfcode=None):
+        '''
+        How many titles book_titles() (or iter_shelf_titles()) would give.
+
+        Parameters
+        ----------
+        shelfcode : Shelfcode (optional)
+           Only count titles with a book in this shelfcode
+
+        Returns
+        -------
+        int
+            the number of titles.
+
+        '''
+        sql = 'select count(distinct title_id) from book where not withdrawn'
+        args = ()
+        if shelfcode:
+            sql += ' and shelfcode_id = %s'
+            args = (shelfcode.id,)
+        return self.db.getcursor().selectvalue(sql, args)
+
+    def iter_shelf_titles(self, shelfcode):
+        '''
+        The titles with a book in a shelfcode, streamed from the server in
+        shelf order (DexLine.shelfkey()), so they can be written out as they
+        come in.
+
+        Parameters
+        ----------
+        shelfcode : Shelfcode
+           the shelfcode.
+
+        Yields
+        ------
+        Title
+            each title with its authors, titles, series and codes already
+            loaded.
+
+        '''
+        return self._stream(
+            'true', ordering=SHELF_ORDER, ordering_args=(shelfcode.id,))
+
+    def load(self, title_ids):
+        '''
+        Bulk load a set of titles.
+
+        Parameters
+        ----------
+        title_ids : list(int)
+            The titles to load.
+
+        Returns
+        -------
+        list(Title)
+            Title objects, in dex order, with their authors, titles, series,
+            codes and sort keys already loaded.
+
+        '''
+        if not title_ids:
+            return []
+        return self._load('title_id = any(%s)', (list(title_ids),))
+
+    def _load(self, restriction, args=None):
+        '''
+        Fetch everything a dexline needs for the titles matching restriction
+        in five queries (rather than several per title), and seed the caches
+        of the Title objects with it. This is the same trick the old exdex()
+        used.
+
+        Parameters
+        ----------
+        restriction : str
+            a where clause on title_id, e.g. 'title_id = any(%s)'
+        args : tuple, optional
+            values for the restriction.
+
+        Returns
+        -------
+        list(Title)
+            the hydrated titles.
+
+        '''
+        return list(self._stream(restriction, args))
+
+    def _stream(self, restriction, args=None, ordering=DEX_ORDER,
+                ordering_args=()):
+        '''
+        The guts of _load(): _stream_lines() made into Titles.
+
+        Yields
+        ------
+        Title
+            the hydrated titles, in order.
+
+        '''
+        for (_, title_id, line) in self._stream_lines(
+                restriction, args, ordering, ordering_args):
+            yield self.make_title(title_id, line)
+
+    def _stream_lines(self, restriction, args=None, ordering=DEX_ORDER,
+                      ordering_args=()):
+        '''
+        The queries are run on streaming cursors, all The queries are run on streaming cursors, all
+        in the same order (dex order by the precomputed keys in
+        title_sortkey unless told otherwise, with title_id to break ties),
+        and walked in step so that only one title's worth of rows is in
+        memory at a time.
+
+        A title that has no title_sortkey row yet isn't dropped: it sorts
+        as if its keys were empty, so it comes out first, and its keys are
+        worked out by DexLine instead.
+
+        Parameters
+        ----------
+        restriction : str
+            a where clause on title_id, e.g. 'title_id = any(%s)'
+        args : tuple, optional
+            values for the restriction.
+        ordering : str, optional
+            a query for (title_id, sortkey) giving the order, where sortkey
+            is a text array that sorts the same way in python. Only the
+            titles it has are loaded. The default is DEX_ORDER.
+        ordering_args : tuple, optional
+            values for the ordering query.
+
+        Yields
+        ------
+        (tuple(str), int, tuple)
+            the sort key from the ordering, the title_id, and the
+            authors, titles, series, codes and sort keys to hand to
+            Title.preload(), as plain tuples and strings, in order.
+
+        '''
+        with_ordering = f"with ordering as ({ordering}) select"
+        order = ' order by ordering.sortkey, title_id'
+        queries = [
+            with_ordering +
+            "  ordering.sortkey, title_id,"
+            "  coalesce(sortkey_author, ''), coalesce(sortkey_title, ''),"
+            "  sortkey_series, sortkey_series_number,"
+            "  title_sortkey.title_id is not null"
+            " from"
+            "  title"
+            "  left join title_sortkey using (title_id)"
+            "  join ordering using (title_id)"
+            f" where {restriction}" + order,
+
+            with_ordering +
+            "  ordering.sortkey, title_id,"
+            "  concat_ws('=', entity_name, alternate_entity_name),"
+            "  title_responsibility_type.description"
+            " from"
+            "  title_responsibility"
+            "  natural join entity"
+            "  join title_responsibility_type"
+            "  on title_responsibility.responsibility_type = "
+            "     title_responsibility_type.responsibility_type"
+            "  join ordering using (title_id)"
+            f" where {restriction}" + order + ", order_responsibility_by",
+
+            with_ordering +
+            "  ordering.sortkey, title_id,"
+            "  concat_ws('=', title_name, alternate_name)"
+            " from title_title join ordering using (title_id)"
+            f" where {restriction}" + order + ", order_title_by",
+
+            with_ordering +
+            "  ordering.sortkey, title_id,"
+            "  series_name, series_index, series_visible, number_visible"
+            " from"
+            "  title_series"
+            "  natural join series"
+            "  join ordering using (title_id)"
+            f" where {restriction}" + order + ", order_series_by",
+
+            # deprecated shelfcodes aren't in the shelfcode regex, so leave
+            # them out the same way Title.codes does
+            with_ordering +
+            "  ordering.sortkey, title_id,"
+            "  shelfcode, doublecrap, book_series_visible, count(book_id)"
+            " from"
+            "  book"
+            "  natural join shelfcode"
+            "  join ordering using (title_id)"
+            " where not withdrawn and shelfcode_type != 'D'"
+            f" and {restriction}"
+            " group by ordering.sortkey, title_id,"
+            "  shelfcode, doublecrap, book_series_visible" + order,
+            ]
+
+        args = tuple(ordering_args) + tuple(args or ())
+        streams = [
+            itertools.groupby(
+                self.db.getstreamcursor().stream(sql, args or None),
+                key=lambda row: (row[0], row[1]))
+            for sql in queries]
+        heads = [next(stream, None) for stream in streams]
+
+        while any(heads):
+            key = min(head[0] for head in heads if head)
+            rows = []
+            for i, head in enumerate(heads):
+                if head and head[0] == key:
+                    rows.append([row[2:] for row in head[1]])
+                    heads[i] = next(streams[i], None)
+                else:
+                    rows.append([])
+            sortkeys, authors, titles, series, codes = rows
+
+            # a title with only series information isn't one we'd have
+            # loaded before
+            if not (authors or titles or codes):
+                continue
+
+            yield tuple(key[0]), key[1], (
+                tuple(
+                    author if responsibility == 'AUTHOR'
+                    else f'{author} ({responsibility})'
+                    for (author, responsibility) in authors),
+                tuple(title_name for (title_name,) in titles),
+                tuple(
+                    ('@' if series_visible else '') + series_name +
+                    (' ' + ('#' if number_visible else '') + series_index
+                     if series_index else '')
+                    for (series_name, series_index,
+                         series_visible, number_visible) in series),
+                ','.join(
+                    ('@' if visible else '') + code + (doublecrap or '')
+                    + f':{count}'
+                    for (code, doublecrap, visible, count) in codes),
+                (tuple(sortkeys[0][:4]) if sortkeys and sortkeys[0][4]
+                 else None))
 
     def grep(self, s):
         '''
@@ -283,11 +631,69 @@ class Title(dexline.DexLine, db.Entry):
         db.Entry.__init__(self, 'title', 'title_id', database, title_id)
         self.title_id = title_id
 
-    # neither of these two is doing anything interesting. Can probably drop
-    # them
-    comment = db.Field('title_comment')
+    # not doing anything interesting. Can probably drop it. (title_comment
+    # went away, since the title table has no such column and loading the
+    # row would fail on it)
     lost = db.Field('title_lost')
 
+    def preload(self, authors=None, titles=None, series=None, codes=None,
+                sortkeys=None):
+        '''
+        Seed the caches with values that have already been fetched (usually
+        by Titles.load), so the properties don't go back to the db.
+
+        Parameters
+        ----------
+        authors, titles, series : list(str), optional
+            dexline strings, in order.
+        codes : str, optional
+            dex shelfcode string (e.g. 'L:2,S')
+        sortkeys : tuple, optional
+            placeauthor, placetitle, placeseries and placeseriesnumber, from
+            the title_sortkey table
+
+        Returns
+        -------
+        None.
+
+        '''
+        if authors is not None:
+            self.cache['authors'] = utils.FieldTuple(authors)
+        if titles is not None:
+            self.cache['titles'] = utils.FieldTuple(titles)
+        if series is not None:
+            self.cache['series'] = utils.FieldTuple(series)
+        if codes is not None:
+            self.cache['codes'] = Editions(codes)
+        if sortkeys is not None:
+            self.cache['sortkeys'] = tuple(sortkeys)
+
+    # the sort keys come from the db if they were preloaded, otherwise
+    # DexLine works them out
+    @property
+    def placeauthor(self):
+        if 'sortkeys' in self.cache:
+            return self.cache['sortkeys'][0]
+        return super().placeauthor
+
+    @property
+    def placetitle(self):
+        if 'sortkeys' in self.cache:
+            return self.cache['sortkeys'][1]
+        return super().placetitle
+
+    @property
+    def placeseries(self):
+        if 'sortkeys' in self.cache:
+            return self.cache['sortkeys'][2]
+        return super().placeseries
+
+    @property
+    def placeseriesnumber(self):
+        if 'sortkeys' in self.cache:
+            return self.cache['sortkeys'][3]
+        return super().placeseriesnumber
+
     def _cache_query(self, key, sql):
         name = 'Q_' + key
         if name in self.cache:
@@ -591,6 +997,8 @@ class Title(dexline.DexLine, db.Entry):
             (other_book.id,))
 
         self.db.commit()
+        self.cache_reset()
+        other_book.cache_reset()
 
     @property
     @db.cached
@@ -696,15 +1104,48 @@ class Title(dexline.DexLine, db.Entry):
         list(Book)
             List of the books we own in the library associated with this title
         '''
-        cursor = self.cursor
-        # This is a subselect so we can sort by shelcode_Id
-        book_list = cursor.fetchlist(
-            "select book_id"
-            " from book"
-            " where title_id=%s and not withdrawn"
-            " order by shelfcode_id",
-            (self.id, ))
-        return [Book(self.db, book_id) for book_id in book_list]
+        return self.books_with_borrowers()
+
+    def books_with_borrowers(self):
+        '''
+        The books we own for this title, with their fields and whoever has
+        them out fetched in one query, so looking at book.shelfcode,
+        book.out and book.outto for each doesn't go back to the db.
+
+        Returns
+        -------
+        list(Book)
+            the books, ordered by shelfcode_id.
+
+        '''
+        fields = Book._all_fields()
+        rows = self.cursor.execute(
+            'select book.book_id, checkout_id, first_name, last_name, ' +
+            ', '.join(f'book.{field.field}' for field in fields) +
+            ' from'
+            '  book'
+            '  left join checkout'
+            '  on checkout.book_id = book.book_id'
+            '   and checkin_stamp is null and checkout_lost is null'
+            '  left join member on member.member_id = checkout.member_id'
+            ' where book.title_id = %s and not book.withdrawn'
+            ' order by book.shelfcode_id, book.book_id, checkout_id',
+            (self.id,))
+
+        books = []
+        for book_id, group in itertools.groupby(rows, key=lambda x: x[0]):
+            group = list(group)
+            book = Book(self.db, book_id)
+            book._seed(fields, group[0][4:])
+            book.cache['title_id'] = self
+            borrowers = [
+                format_name(first_name, last_name)
+                for (_, checkout_id, first_name, last_name, *_) in group
+                if checkout_id is not None]
+            book.cache['out'] = bool(borrowers)
+            book.cache['outto'] = ' '.join(borrowers)
+            books.append(book)
+        return books
 
     @property
     def withdrawn_books(self):
@@ -729,6 +1170,10 @@ class Title(dexline.DexLine, db.Entry):
             Returns an Editions object with the information about the
             shelfcodes of books associated with this title
         '''
+        # only present if the title was bulk loaded; otherwise books can
+        # change underneath us so we always count them fresh
+        if 'codes' in self.cache:
+            return self.cache['codes']
         count = {}
         for book in self.books:
             if book.shelfcode is None:
@@ -6,6 +6,8 @@ from mitsfs.core import settings
 
 from mitsfs.dex.shelfcodes import Shelfcodes
 from mitsfs.dex.catalog import Catalog
+from mitsfs.dex.snapshot import CatalogSnapshot
+from mitsfs.dex.completion import CompletionIndex
 
 from mitsfs.circulation.membership_types import MembershipTypes
 from mitsfs.circulation.timewarps import Timewarps
@@ -52,6 +54,32 @@ class Library():
     def catalog(self):
         return Catalog(self.db)
 
+    _snapshot = None
+
+    @property
+    def snapshot(self):
+        '''
+        The dex in memory. Loaded the first time it's used; after that it's
+        up to the caller to refresh() it when it needs to be current.
+        '''
+        if self._snapshot is None:
+            self._snapshot = CatalogSnapshot(self.catalog)
+        return self._snapshot
+
+    _completion = None
+
+    @property
+    def completion(self):
+        '''
+        Names for tab completion, from memory, caught up with the log each
+        time you ask for it. Loaded the first time it's used.
+        '''
+        if self._completion is None:
+            self._completion = CompletionIndex(self.db)
+        else:
+            self._completion.refresh()
+        return self._completion
+
     @property
     def log(self):
         return logging.getLogger('mitsfs.error')
@@ -44,14 +44,12 @@ def coerce_shelfcode(field, db):
     Turn a shelfcode ID into a shelfcode object
     '''
     from mitsfs.dex.shelfcodes import Shelfcodes
-    if settings.shelfcodes_global:
-        shelfcodes = settings.shelfcodes_global
-    else:
-        shelfcodes = Shelfcodes(db)
-    for code in shelfcodes.values():
-        if code.id == field:
-            return code
-    return None
+    if not settings.shelfcodes_global:
+        # normally Library does this (and empty means it ran before any
+        # shelfcodes existed), but load them once here rather than once per
+        # book
+        settings.shelfcodes_global = Shelfcodes(db)
+    return settings.shelfcodes_global.get_by_id(field)
 
 
 def uncoerce_shelfcode(field, db=None):
@@ -154,7 +154,7 @@ def select_author(library, create=True, single=False):
         if authors:
             blank = ' (blank to finish)'
         author = ui.read(f'Enter an author{blank}: ',
-                         complete=library.catalog.authors.complete).upper()
+                         complete=library.completion.complete_author).upper()
         if not author:
             break
 
@@ -219,7 +219,7 @@ def select_series(library, create=True, single=False):
     while True:
         name = sanitize_series(
             ui.read('Enter a series (blank to finish): ',
-                    complete=library.catalog.series.complete)
+                    complete=library.completion.complete_series)
             ).upper()
         if not name:
             break
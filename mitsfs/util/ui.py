@@ -287,34 +287,59 @@ def color_due_date(stamp):
         else Color.warning)(stamp.date())
 
 
-def specify(library, preload=None, predicate=None):
+def specify(library, preload=None, predicate=None, book_filter=None):
+    '''
+    Ask for an author and title and pick a title from what matches.
+
+    Parameters
+    ----------
+    library : Library
+        where to look.
+    preload : Title, optional
+        a title to start the prompts off with.
+    predicate : callable, optional
+        only offer the titles this is true for. It's checked in Python
+        against every candidate, so prefer book_filter where you can.
+    book_filter : BookFilter, optional
+        only offer the titles with a book that passes this, from
+        mitsfs.dex.filters. It's done in the search query.
+
+    Returns
+    -------
+    Title or None
+        the title picked, or None if they gave up.
+
+    '''
     if preload is None:
         author_preload, title_preload = '', ''
     else:
         author_preload = preload.authortxt
         title_preload = preload.titletxt
     while True:
+        completion = library.completion
         if predicate is None:
-            itf = library.catalog.authors.keys
+            itf = None
         else:
             def itf():
                 return (
-                    i for i in library.catalog.authors.keys()
+                    i for i in library.catalog.authors.iterkeys()
                     if any((
                         predicate(j)
                         for j in library.catalog.authors[i])))
-        author = read('Author: ', itf, author_preload,
-                      'authors').upper().strip()
+        author = read('Author: ', itf, author_preload, 'authors',
+                      None if itf else completion.complete_author
+                      ).upper().strip()
         # if (len(author.split('<')) == 4
         #     and author in library.catalog.authors.keys()):
         #     return dex[author]
-        if author:
-            def itf():
-                return library.catalog.titles.search_by_author(author)
+        if predicate is None:
+            itf = None
         else:
-            itf = library.catalog.titles.keys
-        if predicate is not None:
-            xitf = itf
+            if author:
+                def xitf():
+                    return library.catalog.titles.search_by_author(author)
+            else:
+                xitf = library.catalog.titles.iterkeys
 
             def itf():
                 return (
@@ -323,26 +348,51 @@ def specify(library, preload=None, predicate=None):
                         predicate(j)
                         for j in library.catalog.titles[i])))
 
-        title = read('Title: ', itf, title_preload, 'titles').upper()
+        title = read(
+            'Title: ', itf, title_preload, 'titles',
+            None if itf else (
+                lambda text: completion.complete_title(text, author))
+            ).upper()
         title = re.sub(r'^(?:A|AN|THE) ', '', title)
         author_preload, title_preload = '', ''
 
         if not author and not title:
             return None
 
-        possibles = library.catalog.grep(f'{author}<{title}')
-        if predicate is not None:
+        # without a predicate there's no point fetching more than we could
+        # show
+        if predicate is None:
+            limit = maxresults()
+            possibles = library.catalog.grep(
+                f'{author}<{title}', limit, book_filter)
+        else:
+            limit = None
+            possibles = library.catalog.grep(
+                f'{author}<{title}', book_filter=book_filter)
             possibles = [book for book in possibles if predicate(book)]
 
+        # nothing matched exactly, so see if it's a typo
+        close = False
+        if not possibles:
+            possibles = library.catalog.fuzzy(
+                f'{author}<{title}', maxresults() - 1, book_filter)
+            if predicate is not None:
+                possibles = [book for book in possibles if predicate(book)]
+            if possibles:
+                print('Nothing found. Close matches:')
+                close = True
+
         n = None
         if len(possibles) == 0:
             print("Nothing found, try again")
-        elif len(possibles) == 1:
+        elif len(possibles) == 1 and not close:
             n = 1
         elif len(possibles) < maxresults():
             for i, name in zip(range(1, len(possibles) + 1), possibles):
                 print(Color.select(str(i) + '.'), name)
             n = readnumber('? ', 0, len(possibles) + 1, 'select')
+        elif limit is not None:
+            print("Too many options (%d or more), try again" % limit)
         else:
             print("Too many options (%d), try again" % len(possibles))
         if n == 0:
@@ -356,8 +406,37 @@ def specify(library, preload=None, predicate=None):
 
 def specify_book(
         library, preload=None, authorcomplete=None, titlecomplete=None,
-        title_predicate=None, book_predicate=lambda book: True
+        title_predicate=None, book_predicate=None, book_filter=None
         ):
+    '''
+    Ask for an author and title, pick a title from what matches and then
+    one of its books.
+
+    Parameters
+    ----------
+    library : Library
+        where to look.
+    preload : Title, optional
+        a title to start the prompts off with.
+    authorcomplete, titlecomplete : callable, optional
+        tab completion for the prompts, in place of library.completion's.
+    title_predicate : callable, optional
+        only offer the titles this is true for, checked in Python.
+    book_predicate : callable, optional
+        only offer the books this is true for. Defaults to book_filter.
+    book_filter : BookFilter, optional
+        only offer the titles with a book that passes this, from
+        mitsfs.dex.filters, done in the search query. Unless there's a
+        book_predicate, it picks the books to offer as well.
+
+    Returns
+    -------
+    Book or None
+        the book picked, or None if they gave up.
+
+    '''
+    if book_predicate is None:
+        book_predicate = book_filter or (lambda book: True)
     if preload is None:
         author_preload, title_preload = '', ''
     else:
@@ -365,8 +444,9 @@ def specify_book(
         title_preload = preload.titletxt
 
     while True:
+        completion = library.completion
         if authorcomplete is None:
-            complete = library.catalog.authors.complete
+            complete = completion.complete_author
         else:
             complete = authorcomplete
         print('To return, type Control-C or leave author and title blank')
@@ -385,7 +465,7 @@ def specify_book(
                 return titlecomplete(text, author=author)
         else:
             def complete(text):
-                return library.catalog.titles.complete(text, author=author)
+                return completion.complete_title(text, author=author)
         title = read(
             'Title: ',
             preload=title_preload,
@@ -398,20 +478,41 @@ def specify_book(
         if not author and not title:
             return None
 
-        possibles = list(library.catalog.grep('<'.join([author, title])))
-        if title_predicate is not None:
+        if title_predicate is None:
+            limit = maxresults()
+            possibles = library.catalog.grep(
+                '<'.join([author, title]), limit, book_filter)
+        else:
+            limit = None
             possibles = [
-                book for book in possibles if title_predicate(book)]
+                book
+                for book in library.catalog.grep(
+                    '<'.join([author, title]), book_filter=book_filter)
+                if title_predicate(book)]
+
+        # nothing matched exactly, so see if it's a typo
+        close = False
+        if not possibles:
+            possibles = library.catalog.fuzzy(
+                '<'.join([author, title]), maxresults() - 1, book_filter)
+            if title_predicate is not None:
+                possibles = [
+                    book for book in possibles if title_predicate(book)]
+            if possibles:
+                print('Nothing found. Close matches:')
+                close = True
 
         n = None
         if len(possibles) == 0:
             print("Nothing found, try again")
-        elif len(possibles) == 1:
+        elif len(possibles) == 1 and not close:
             n = 1
         elif len(possibles) < maxresults():
             for i, name in enumerate(possibles):
                 print(Color.select(str(i + 1) + '.'), name)
             n = readnumber('? ', 0, len(possibles) + 1, 'select')
+        elif limit is not None:
+            print("Too many options (%d or more), try again" % limit)
         else:
             print("Too many options (%d), try again" % len(possibles))
         if n == 0:
@@ -451,7 +552,9 @@ def specify_book(
             continue
         return books[n - 1][1][0]
      
-def specify_member(member_list, line=''):
+def specify_member(member_list, line='', complete=None):
+    if complete is None:
+        complete = member_list.complete_name
     preload = ''
     while True:
         if line:
@@ -479,7 +582,7 @@ def specify_member(member_list, line=''):
             'Member: ',
             preload=preload,
             history='members',
-            complete=lambda x: member_list.complete_name(x),
+            complete=complete,
             ).strip().upper()
 
         if not line:
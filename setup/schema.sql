@@ -3,6 +3,8 @@
 set role "speaker-to-postgres";
 
 create language plpython3u;
+-- trigram indexes for searching, see the *_trgm_idx indexes below
+create extension if not exists pg_trgm;
 
 
 drop function if exists current_client() cascade;
@@ -82,6 +84,29 @@ create function collateral_update() returns trigger as $$
 $$ language plpython3u;
 
 
+drop function if exists sanitize_sort_key(text) cascade;
+create function sanitize_sort_key(key text) returns text as $$
+    # keep this in step with sanitize_sort_key in mitsfs/core/dexline.py
+    import re
+    if 'sort_key_res' not in SD:
+        SD['sort_key_res'] = [re.compile(i) for i in (
+            r'(\d+)', ', (?:A|AN|THE)$', '[-/,: ]+', r'[^A-Z0-9\(\) ]',
+            r'^\(', r'^(\d\S+) ?(.*)')]
+    (number, trailing_article, punctuation_whitespace, remove_other,
+     start_paren, start_number) = SD['sort_key_res']
+
+    s = key.strip().upper()
+    s = trailing_article.sub('', s)
+    s = punctuation_whitespace.sub(' ', s)
+    s = remove_other.sub('', s)
+    s = start_paren.sub('', s)
+    s = start_number.sub(r'\2 \1', s)
+    s = ''.join(
+        '%06d' % int(i) if i.isdigit() else i for i in number.split(s))
+    return s.replace('(', '<').replace(')', '>')
+$$ language plpython3u immutable strict;
+
+
 drop function if exists log_row() cascade;
 create function log_row() returns trigger as $$
     GD['TD'] = dict(TD)
@@ -205,6 +230,10 @@ create table entity (
        );
 
 create index entity_name_idx on entity(entity_name);
+-- these serve the unanchored regexes in grep, the ilike prefix matches in
+-- search and complete, and the fuzzy matching in Catalog.fuzzy
+create index entity_name_trgm_idx on entity using gin (entity_name gin_trgm_ops);
+create index entity_alternate_name_trgm_idx on entity using gin (alternate_entity_name gin_trgm_ops);
 
 create trigger entity_insert
        before insert on entity for each row execute procedure insert_row_created_with();
@@ -269,6 +298,9 @@ create trigger title_title_log
 grant select on title_title to public;
 grant insert, update, delete on title_title to panthercomm;
 
+create index title_title_name_trgm_idx on title_title using gin (title_name gin_trgm_ops);
+create index title_title_alternate_name_trgm_idx on title_title using gin (alternate_name gin_trgm_ops);
+
 
 create table series (
        series_id integer default nextval('id_seq') not null primary key,
@@ -291,6 +323,8 @@ create trigger series_log
 grant select on series to public;
 grant insert, update, delete on series to panthercomm;
 
+create index series_name_trgm_idx on series using gin (series_name gin_trgm_ops);
+
 
 create table title_series (
        title_id integer not null references title,
@@ -313,6 +347,106 @@ grant insert, update, delete on title_series to panthercomm;
 
 create index title_series_series_idx on title_series(series_id);
 
+-- sort keys for the dex, as DexLine computes them, so the server can put
+-- titles in order. Maintained by the triggers below.  This section can be
+-- run again on its own to add the table to an existing db; the last
+-- statement fills it in.
+create table if not exists title_sortkey (
+       title_id integer not null primary key references title on delete cascade,
+       sortkey_author text collate "C" not null default '',
+       sortkey_title text collate "C" not null default '',
+       sortkey_series text collate "C" not null default '',
+       sortkey_series_number text collate "C");
+
+create index if not exists title_sortkey_idx on title_sortkey(sortkey_author, sortkey_title, title_id);
+
+grant select on title_sortkey to public;
+grant insert, update, delete on title_sortkey to panthercomm;
+
+drop function if exists title_sortkey_refresh(integer) cascade;
+create function title_sortkey_refresh(integer) returns void as $$
+    insert into title_sortkey
+     (title_id, sortkey_author, sortkey_title,
+      sortkey_series, sortkey_series_number)
+    select
+     $1,
+     sanitize_sort_key(coalesce(
+      (select concat_ws('=', entity_name, alternate_entity_name) ||
+              case when description = 'AUTHOR' then ''
+                   else ' (' || description || ')' end
+        from title_responsibility
+         natural join entity
+         natural join title_responsibility_type
+        where title_id = $1
+        order by order_responsibility_by
+        limit 1), '')),
+     sanitize_sort_key(coalesce(
+      (select coalesce(alternate_name, title_name)
+        from title_title
+        where title_id = $1
+        order by order_title_by
+        limit 1), '')),
+     sanitize_sort_key(regexp_replace(coalesce(series_string, ''), ' [0-9,]+$', '')),
+     sanitize_sort_key(substring(first_series from ' #[-.,0-9]+B?$'))
+    from
+     (select
+        string_agg(name, '|' order by order_series_by) as series_string,
+        (array_agg(name order by order_series_by))[1] as first_series
+       from
+        (select
+           order_series_by,
+           (case when series_visible then '@' else '' end) || series_name ||
+           (case when coalesce(series_index, '') = '' then ''
+                 else ' ' || (case when number_visible then '#' else '' end)
+                      || series_index end) as name
+          from title_series natural join series
+          where title_id = $1) as names) as title_series_names
+    where exists (select 1 from title where title_id = $1)
+    on conflict (title_id) do update set
+     sortkey_author = excluded.sortkey_author,
+     sortkey_title = excluded.sortkey_title,
+     sortkey_series = excluded.sortkey_series,
+     sortkey_series_number = excluded.sortkey_series_number;
+$$ language sql;
+
+-- args are the column in the changed row to find the titles by, and if it
+-- isn't title_id, the table to look them up in
+drop function if exists update_title_sortkey() cascade;
+create function update_title_sortkey() returns trigger as $$
+    column = TD['args'][0]
+    if column == 'title_id':
+        sql = 'select title_sortkey_refresh($1)'
+    else:
+        sql = ('select title_sortkey_refresh(title_id) from %s where %s = $1'
+               % (TD['args'][1], column))
+    if sql not in SD:
+        SD[sql] = plpy.prepare(sql, ['int4'])
+    for row_id in set(row[column] for row in (TD['old'], TD['new']) if row):
+        plpy.execute(SD[sql], [row_id])
+$$ language plpython3u;
+
+create trigger title_sortkey_title
+       after insert on title
+       for each row execute procedure update_title_sortkey('title_id');
+create trigger title_sortkey_title_responsibility
+       after insert or update or delete on title_responsibility
+       for each row execute procedure update_title_sortkey('title_id');
+create trigger title_sortkey_title_title
+       after insert or update or delete on title_title
+       for each row execute procedure update_title_sortkey('title_id');
+create trigger title_sortkey_title_series
+       after insert or update or delete on title_series
+       for each row execute procedure update_title_sortkey('title_id');
+create trigger title_sortkey_entity
+       after update on entity
+       for each row execute procedure update_title_sortkey('entity_id', 'title_responsibility');
+create trigger title_sortkey_series
+       after update on series
+       for each row execute procedure update_title_sortkey('series_id', 'title_series');
+
+select title_sortkey_refresh(title_id) from title
+ where title_id not in (select title_id from title_sortkey);
+
 create table format (
        format_id integer default nextval('id_seq') not null primary key,
        format text unique not null,
@@ -371,6 +505,9 @@ create table shelfcode (
 
 create index shelfcode_shelfcode_type on shelfcode(shelfcode_type);
 
+create trigger shelfcode_log
+       before insert or update or delete on shelfcode for each row execute procedure log_row();
+
 grant select on shelfcode to public;
 grant insert, update, delete on shelfcode to libcomm;
 
@@ -415,31 +552,32 @@ grant select on book to public;
 grant insert, update, delete on book to panthercomm;
 
 
--- create table barcode (
---        book_id integer not null references book,
---        barcode text unique primary key not null,
---        barcode_created timestamp with time zone default current_timestamp not null,
---        barcode_created_by varchar(64) default current_user not null,
--- --        barcode_created_with varchar(64) default 'SQL' not null,
---        barcode_modified timestamp with time zone default current_timestamp not null,
---        barcode_modified_by varchar(64) default current_user not null,
---        barcode_modified_with varchar(64) default 'SQL' not null);
-
--- create index barcode_book_id_idx on barcode(book_id);
-
--- create trigger barcode_insert
---        before insert on barcode
---        for each row execute procedure insert_row_created_with();
--- create trigger barcode_update
---        before update on barcode
---        for each row execute procedure update_row_modified();
--- create trigger barcode_log
---        before insert or update or delete on barcode
---        for each row execute procedure log_row('book_id');
-
--- grant select on barcode to public;
--- grant insert on barcode to keyholders;
--- grant update, delete on barcode to panthercomm;
+-- barcodes stuck on books, for scanning them during an inventory
+create table barcode (
+       book_id integer not null references book,
+       barcode text unique primary key not null,
+       barcode_created timestamp with time zone default current_timestamp not null,
+       barcode_created_by varchar(64) default current_user not null,
+       barcode_created_with varchar(64) default 'SQL' not null,
+       barcode_modified timestamp with time zone default current_timestamp not null,
+       barcode_modified_by varchar(64) default current_user not null,
+       barcode_modified_with varchar(64) default 'SQL' not null);
+
+create index barcode_book_id_idx on barcode(book_id);
+
+create trigger barcode_insert
+       before insert on barcode
+       for each row execute procedure insert_row_created_with();
+create trigger barcode_update
+       before update on barcode
+       for each row execute procedure update_row_modified();
+create trigger barcode_log
+       before insert or update or delete on barcode
+       for each row execute procedure log_row('book_id');
+
+grant select on barcode to public;
+grant insert on barcode to keyholders;
+grant update, delete on barcode to panthercomm;
 
 create or replace view shelf_count as
  select title_id, shelfcode, count(shelfcode) as bookcount
@@ -550,7 +688,9 @@ create table transaction (
 
        transaction_created timestamp with time zone default current_timestamp not null,
        transaction_created_by varchar(64) default current_user not null,
-       transaction_created_with varchar(64) default current_client());
+       transaction_created_with varchar(64) default current_client(),
+       -- a void, or voided by one; maintained by transaction_link_void below
+       transaction_voided boolean not null default false);
 
 create trigger transaction_log
        before update or delete on transaction for each row execute procedure log_row();
@@ -561,6 +701,39 @@ create index transaction_transaction_created_idx on transaction(transaction_crea
 
 grant insert, select on transaction to keyholders;
 
+-- each member's running balance, the sum of their transactions, kept up to
+-- date by the trigger below so reading it doesn't add up their whole
+-- history.  For an existing db:
+-- insert into member_balance
+--  select member_id, sum(transaction_amount) from transaction group by member_id;
+create table member_balance (
+       member_id integer not null primary key references member on delete cascade,
+       balance numeric not null default 0);
+
+grant insert, update, select on member_balance to keyholders;
+
+drop function if exists update_member_balance() cascade;
+create function update_member_balance() returns trigger as $$
+    if 'add' not in SD:
+        SD['add'] = plpy.prepare(
+            'insert into member_balance (member_id, balance)'
+            ' values ($1, $2)'
+            ' on conflict (member_id) do update'
+            '  set balance = member_balance.balance + excluded.balance',
+            ['int4', 'numeric'])
+    if TD['old']:
+        plpy.execute(SD['add'], [TD['old']['member_id'],
+                                 -TD['old']['transaction_amount']])
+    if TD['new']:
+        plpy.execute(SD['add'], [TD['new']['member_id'],
+                                 TD['new']['transaction_amount']])
+$$ language plpython3u;
+
+create trigger transaction_member_balance
+       after insert or update of member_id, transaction_amount or delete
+       on transaction
+       for each row execute procedure update_member_balance();
+
 
 create table checkout (
        checkout_id integer default nextval('id_seq') not null primary key,
@@ -858,6 +1031,42 @@ create trigger transaction_link_log
 
 grant insert, select on transaction_link to keyholders;
 
+create index transaction_link_transaction_id1_idx on transaction_link(transaction_id1);
+create index transaction_link_transaction_id2_idx on transaction_link(transaction_id2);
+
+-- linking a void to a transaction marks them both voided, so the history
+-- can leave them out without looking at the links.  For an existing db:
+-- alter table transaction
+--  add column transaction_voided boolean not null default false;
+-- update transaction set transaction_voided = true
+--  where transaction_type = 'V' or exists (
+--   select 1
+--    from transaction_link
+--     join transaction v on v.transaction_id in (transaction_id1, transaction_id2)
+--    where transaction.transaction_id in (transaction_id1, transaction_id2)
+--     and v.transaction_type = 'V');
+-- keyholders can't update transactions, so this runs as its owner
+-- (speaker-to-postgres, who runs this file); otherwise anyone who can
+-- insert a link could set the flag by hand and hide a charge.
+-- For an existing db:
+-- revoke update (transaction_voided) on transaction from keyholders;
+drop function if exists transaction_link_void() cascade;
+create function transaction_link_void() returns trigger as $$
+    if 'void' not in SD:
+        SD['void'] = plpy.prepare(
+            'update transaction set transaction_voided = true'
+            ' where transaction_id in ($1, $2) and not transaction_voided'
+            '  and exists (select 1 from transaction'
+            "   where transaction_id in ($1, $2) and transaction_type = 'V')",
+            ['int4', 'int4'])
+    plpy.execute(SD['void'],
+                 [TD['new']['transaction_id1'], TD['new']['transaction_id2']])
+$$ language plpython3u security definer set search_path = public;
+
+create trigger transaction_link_void
+       after insert on transaction_link
+       for each row execute procedure transaction_link_void();
+
 
 create table timewarp (
        timewarp_id integer default nextval('id_seq') primary key,
@@ -895,6 +1104,8 @@ create table inventory_missing (
         shelfcode varchar(10) not null,
         located boolean default false);
 
+create index inventory_missing_inventory_id_idx on inventory_missing(inventory_id, book_id);
+
 grant select on inventory_missing to public;
 grant insert, update, delete on inventory_missing to libcomm;
 
@@ -903,9 +1114,30 @@ create table inventory_sections (
         shelfcode varchar(10) not null,
         section integer not null,
         member_id integer default null,
-        complete boolean default false);
+        complete boolean default false,
+        -- the dexlines of the titles the section starts and ends with
+        first_title text,
+        last_title text);
 
 grant select on inventory_sections to public;
 grant insert, update, delete on inventory_sections to libcomm;
 
+-- which section each book was in when the inventory was opened, and where
+-- on the shelf (shelf_order counts titles from the start of the shelfcode).
+-- For an existing db:
+-- alter table inventory_sections add column first_title text;
+-- alter table inventory_sections add column last_title text;
+create table inventory_section_books (
+        inventory_id integer not null,
+        book_id integer not null,
+        shelfcode varchar(10) not null,
+        section integer not null,
+        shelf_order integer not null,
+        primary key (inventory_id, book_id));
+
+create index inventory_section_books_section_idx on inventory_section_books(inventory_id, shelfcode, section, shelf_order);
+
+grant select on inventory_section_books to public;
+grant insert, update, delete on inventory_section_books to libcomm;
+
 reset role;
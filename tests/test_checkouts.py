@@ -2,6 +2,8 @@ import unittest
 import os
 import sys
 import datetime
+import mailbox
+import tempfile
 
 testdir = os.path.dirname(__file__)
 srcdir = '../'
@@ -14,8 +16,11 @@ from mitsfs.core.dexline import DexLine
 from mitsfs.dex.shelfcodes import Shelfcodes
 
 from mitsfs.circulation.members import Member
-from mitsfs.circulation.checkouts import Checkout, Checkouts
+from mitsfs.circulation.checkouts import Checkout, Checkouts, \
+    overdue_fines
 from mitsfs.circulation.transactions import get_transactions, Transaction
+from mitsfs.circulation.vgg import VGGReport
+from mitsfs.util import exceptions
 
 
 def create_test_member(d):
@@ -78,6 +83,29 @@ class DexDBTest(Case):
 
             self.assertEqual(thor.id, checkouts[0].member_id)
 
+            # the books come back knowing who has them out
+            title1 = books[1].title
+            loaded = title1.books_with_borrowers()
+            self.assertEqual([books[1].id], [book.id for book in loaded])
+            self.assertTrue(loaded[0].out)
+            self.assertEqual(thor.full_name, loaded[0].outto)
+            self.assertEqual('P', loaded[0].shelfcode.code)
+            self.assertIs(title1, loaded[0].title)
+            self.assertFalse(books[4].title.books[0].out)
+            self.assertEqual('', books[4].title.books[0].outto)
+            self.assertRaises(
+                exceptions.CirculationException, loaded[0].checkout, thor)
+
+            # the summary for the member header
+            summary = thor.summary()
+            self.assertEqual(0, summary.balance)
+            self.assertIsNone(summary.membership)
+            self.assertIsNone(summary.membership_description)
+            self.assertEqual([c1.id], [c.id for c in summary.out])
+            self.assertEqual(0, len(summary.overdue))
+            # nothing has changed, so it's kept
+            self.assertIs(summary, thor.summary())
+
             # now add an overdue book
             checkout_timestamp = today - datetime.timedelta(weeks=5)
             c2 = Checkout(library.db, None, member_id=thor.id,
@@ -92,6 +120,46 @@ class DexDBTest(Case):
             self.assertEqual(2, len(checkouts.out))
             self.assertEqual(1, len(checkouts.overdue))
 
+            # writing anything means it's loaded again
+            summary = thor.summary()
+            self.assertEqual(2, len(summary.out))
+            self.assertEqual([c2.id], [c.id for c in summary.overdue])
+            self.assertFalse(thor.can_checkout()[0])
+
+            # the same numbers for all of them at once
+            fines = overdue_fines(library.db, member_id=thor.id)
+            self.assertEqual([c2.id, c1.id], [row[0] for row in fines])
+            self.assertEqual([13, 0], [row[4] for row in fines])
+            self.assertEqual([-1.3, 0], [round(row[5], 2) for row in fines])
+            self.assertEqual(c1.due_stamp, fines[1][3])
+            self.assertEqual([c2.id, c1.id],
+                             [row[0] for row in overdue_fines(library.db)])
+
+            # the VGG
+            report = VGGReport(library.db)
+            self.assertEqual(1, len(report))
+            (email, name, overdue) = report.rows[0]
+            self.assertEqual('thor@asgard.com', email)
+            self.assertEqual(thor.full_name, name)
+            self.assertEqual(
+                [(checkout_timestamp, 13, 'P', 'AUTHOR<TITLE2<SERIES<P')],
+                overdue)
+            self.assertEqual(
+                ['Finding overdue', 'Fetching', 'Loading titles',
+                 'Rendering'],
+                [stage for (stage, _) in report.timings])
+            self.assertEqual(
+                [(email, name, [(checkout_timestamp, 'P',
+                                 'AUTHOR<TITLE2<SERIES<P')])],
+                Checkouts(library.db).vgg())
+            with tempfile.TemporaryDirectory() as path:
+                self.assertEqual(1, report.write_mbox(f'{path}/vgg'))
+                messages = list(mailbox.mbox(f'{path}/vgg'))
+                self.assertEqual(1, len(messages))
+                self.assertIn('thor@asgard.com', messages[0]['To'])
+                self.assertIn('AUTHOR<TITLE2<SERIES<P',
+                              messages[0].get_payload())
+
             # check in book 1
 
             # the book_ids are all tuples. I will make that go away someday
@@ -159,6 +227,15 @@ class DexDBTest(Case):
             self.assertTrue(lost_tx.is_void())
             self.assertEqual(1, len(lost_tx.linked_transaction))
 
+            # a book loaded with its borrower notices being checked in
+            book = library.catalog.grep('^AUTHOR$<^TITLE5$')[0].books[0]
+            book.checkout(thor)
+            book = library.catalog.grep('^AUTHOR$<^TITLE5$')[0].books[0]
+            self.assertTrue(book.out)
+            book.checkout_history.out[0].checkin()
+            self.assertFalse(book.out)
+            self.assertEqual('', book.outto)
+
         finally:
             library.db.db.close()
 
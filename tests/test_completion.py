@@ -0,0 +1,103 @@
+import unittest
+import os
+import sys
+
+testdir = os.path.dirname(__file__)
+srcdir = '../'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from tests.test_setup import Case
+
+from mitsfs.library import Library
+from mitsfs.dex.completion import PrefixIndex
+
+
+class PrefixIndexTest(unittest.TestCase):
+    def test_prefix_index(self):
+        index = PrefixIndex()
+        index.set(1, [('ODINSON, THOR', 'ODINSON, THOR'),
+                      ('THUNDERER', 'ODINSON, THOR')])
+        index.set(2, [('ODINSON, LOKI', 'ODINSON, LOKI'), (None, 'NOBODY')])
+        index.set(3, [('ASGARD, HEIMDALL', 'ASGARD, HEIMDALL')])
+
+        self.assertEqual(['ODINSON, LOKI', 'ODINSON, THOR'],
+                         index.complete('odin'))
+        self.assertEqual(['ODINSON, THOR'], index.complete('THUN'))
+        self.assertEqual([], index.complete('ODINSONS'))
+        self.assertEqual(3, len(index.complete('')))
+
+        # replacing and removing
+        index.set(2, [('LAUFEYSON, LOKI', 'LAUFEYSON, LOKI')])
+        self.assertEqual(['ODINSON, THOR'], index.complete('ODIN'))
+        self.assertEqual([('LAUFEYSON, LOKI', 2)],
+                         list(index.matches('LAU')))
+        index.discard(1)
+        index.discard(1)
+        self.assertEqual([], index.complete('ODIN'))
+        self.assertEqual(2, len(index.entries))
+
+
+class CompletionTest(Case):
+    def test_completion(self):
+        library = Library(dsn=self.dsn)
+        try:
+            library.db.getcursor().execute(
+                "insert into"
+                " shelfcode(shelfcode, shelfcode_description, shelfcode_type)"
+                " values('S', 'Small Books', 'C')")
+            library.shelfcodes.load_from_db()
+
+            library.catalog.add_from_dexline('ODINSON, THOR<HAMMER<THUNDER<S')
+            library.catalog.add_from_dexline('ODINSON, LOKI<MISCHIEF<TRICKS<S')
+            library.catalog.add_from_dexline(
+                'ASGARD, HEIMDALL<HORN<BIFROST<S')
+
+            completion = library.completion
+            for text in ('O', 'ODINSON, T', 'Q'):
+                self.assertEqual(library.catalog.authors.complete(text),
+                                 completion.complete_author(text))
+            for text in ('H', 'MIS', ''):
+                self.assertEqual(library.catalog.titles.complete(text),
+                                 completion.complete_title(text))
+            self.assertEqual(['HAMMER'],
+                             completion.complete_title('H', 'ODINSON'))
+            self.assertEqual(['HAMMER', 'HORN'],
+                             completion.complete_title('H'))
+            self.assertEqual(library.catalog.series.complete('t'),
+                             completion.complete_series('t'))
+
+            # changes turn up the next time we ask for it
+            library.catalog.add_from_dexline(
+                'ODINSON, BALDER<HORSE<SHINING<S')
+            library.db.getcursor().execute(
+                "update entity set entity_name = 'LAUFEYSON, LOKI'"
+                " where entity_name = 'ODINSON, LOKI'")
+            library.db.commit()
+            completion = library.completion
+            self.assertEqual(['ODINSON, BALDER', 'ODINSON, THOR'],
+                             completion.complete_author('ODIN'))
+            self.assertEqual(['LAUFEYSON, LOKI'],
+                             completion.complete_author('LAU'))
+            self.assertEqual(['HAMMER', 'HORSE'],
+                             completion.complete_title('H', 'ODINSON'))
+            self.assertEqual(['MISCHIEF'],
+                             completion.complete_title('', 'LAUFEYSON'))
+            self.assertEqual(['SHINING'], completion.complete_series('SH'))
+
+            # members
+            library.db.getcursor().execute(
+                "insert into member(first_name, last_name, email)"
+                " values ('Sif', 'Asgard', 'sif@example.com')")
+            library.db.commit()
+            completion = library.completion
+            self.assertEqual(library.members.complete_name('sif asg'),
+                             completion.complete_name('sif asg'))
+            self.assertEqual(1, len(completion.complete_name('example')))
+            self.assertEqual([], completion.complete_name('odin'))
+
+        finally:
+            library.db.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
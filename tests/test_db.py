@@ -0,0 +1,113 @@
+import logging
+import unittest
+import os
+import sys
+
+testdir = os.path.dirname(__file__)
+srcdir = '../'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from tests.test_setup import Case
+
+from mitsfs.core import settings
+from mitsfs.core.db import Database
+
+
+class DatabaseTest(Case):
+    def test_executemany(self):
+        try:
+            db = Database(dsn=self.dsn)
+            c = db.getcursor()
+
+            # more rows than fit in a page, and not a multiple of it
+            rows = [(f'CODE{i}', f'Code number {i}') for i in range(7)]
+            c.executemany(
+                'insert into shelfcode(shelfcode, shelfcode_description)'
+                ' values (%s, %s)',
+                rows, page_size=3)
+            db.commit()
+
+            self.assertEqual(7, c.selectvalue(
+                'select count(*) from shelfcode where shelfcode like %s',
+                ('CODE%',)))
+            self.assertEqual('Code number 6', c.selectvalue(
+                'select shelfcode_description from shelfcode'
+                " where shelfcode = 'CODE6'"))
+
+            # writes are counted, reads aren't
+            writes = db.writes
+            c.execute('select count(*) from shelfcode')
+            self.assertEqual(writes, db.writes)
+            c.execute("update shelfcode set shelfcode_description = 'Code'"
+                      " where shelfcode = 'CODE0'")
+            self.assertEqual(writes + 1, db.writes)
+
+            # nothing to do is fine
+            c.executemany('insert into shelfcode(shelfcode) values (%s)', [])
+
+            # a failure rolls back the whole page and leaves the connection
+            # usable
+            self.assertRaises(
+                Exception, c.executemany,
+                'insert into shelfcode(shelfcode, shelfcode_description)'
+                ' values (%s, %s)',
+                [('NEW', 'New'), ('CODE1', 'Duplicate')])
+            self.assertEqual(0, c.selectvalue(
+                "select count(*) from shelfcode where shelfcode = 'NEW'"))
+
+        finally:
+            db.db.close()
+
+    def test_stream(self):
+        try:
+            db = Database(dsn=self.dsn)
+
+            # more rows than one fetch from the server
+            c = db.getstreamcursor(itersize=3)
+            self.assertEqual(
+                list(range(10)),
+                [i for (i,) in c.stream(
+                    'select generate_series(0, %s)', (9,))])
+            self.assertTrue(c.closed)
+
+            # two at once on the same connection
+            evens = db.getstreamcursor().stream(
+                'select generate_series(0, 8, 2)')
+            odds = db.getstreamcursor().stream(
+                'select generate_series(1, 9, 2)')
+            self.assertEqual(
+                [(0, 1), (2, 3), (4, 5), (6, 7), (8, 9)],
+                [(e, o) for ((e,), (o,)) in zip(evens, odds)])
+
+            # abandoned after the transaction it was in has ended
+            rows = db.getstreamcursor().stream(
+                'select generate_series(0, 9)')
+            self.assertEqual((0,), next(rows))
+            db.commit()
+            rows.close()
+
+        finally:
+            db.db.close()
+
+    def test_slow_query(self):
+        saved = settings.SLOW_QUERY_SECONDS
+        try:
+            db = Database(dsn=self.dsn)
+            c = db.getcursor()
+
+            settings.SLOW_QUERY_SECONDS = 0
+            with self.assertLogs('mitsfs.sql', logging.WARNING) as logs:
+                c.execute('select pg_sleep(0.01)')
+            self.assertIn('slow query', logs.output[0])
+            self.assertIn('pg_sleep', logs.output[0])
+
+            settings.SLOW_QUERY_SECONDS = None
+            self.assertEqual(1, c.selectvalue('select 1'))
+
+        finally:
+            settings.SLOW_QUERY_SECONDS = saved
+            db.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+import os
+import sys
+import tempfile
+
+testdir = os.path.dirname(__file__)
+srcdir = '../'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from tests.test_setup import Case
+
+from mitsfs.library import Library
+from mitsfs.dex import export
+
+
+class ExportTest(Case):
+    def test_export(self):
+        library = Library(dsn=self.dsn)
+        try:
+            library.db.getcursor().execute(
+                "insert into"
+                " shelfcode(shelfcode, shelfcode_description, shelfcode_type)"
+                " values('S', 'Small Books', 'C'), ('L', 'Large Books', 'C')")
+            library.shelfcodes.load_from_db()
+
+            for line in (
+                    'ODINSON, THOR<HAMMER<THUNDER<S,L:2',
+                    'ODINSON, LOKI<MISCHIEF<TRICKS<S',
+                    'ASGARD, HEIMDALL<BRIDGE<BIFROST<L'):
+                library.catalog.add_from_dexline(line)
+
+            with tempfile.TemporaryDirectory() as path:
+                messages = []
+                problems = library.catalog.export([
+                    export.TextWriter(f'{path}/dex.txt'),
+                    export.TexWriter(f'{path}/pinkdex.tex'),
+                    export.ShelfWriter(
+                        f'{path}/pinkdex_L.tex', library.shelfcodes['L']),
+                    export.InventoryWriter(
+                        path, library.shelfcodes['S'], 2),
+                    ], progress=messages.append)
+                self.assertEqual([], problems)
+
+                # dex order
+                with open(f'{path}/dex.txt') as fp:
+                    self.assertEqual([
+                        'ASGARD, HEIMDALL<BRIDGE<BIFROST<L',
+                        'ODINSON, LOKI<MISCHIEF<TRICKS<S',
+                        'ODINSON, THOR<HAMMER<THUNDER<L:2,S',
+                        ], fp.read().splitlines())
+
+                with open(f'{path}/pinkdex.tex') as fp:
+                    tex = fp.read()
+                self.assertEqual(3, tex.count(r'\Book{'))
+                self.assertEqual(1, tex.count(r'\NextLetter'))
+                self.assertIn(r'{L\:2,S}', tex)
+                self.assertIn('A', messages)
+                self.assertIn('O', messages)
+
+                # only the L books, in shelf order
+                with open(f'{path}/pinkdex_L.tex') as fp:
+                    books = [line for line in fp if line.startswith(r'\Book')]
+                self.assertEqual(2, len(books))
+                self.assertTrue(books[0].startswith(
+                    r'\Book{ASGARD, HEIMDALL}{BRIDGE [BIFROST]}{1}'))
+                self.assertTrue(books[1].startswith(
+                    r'\Book{ODINSON, THOR}{HAMMER [THUNDER]}{2}'))
+
+                # the two S books split across two sections
+                for section in (1, 2):
+                    with open(f'{path}/S_{section}.tex') as fp:
+                        self.assertEqual(1, fp.read().count(r'\Book{'))
+                self.assertFalse(os.path.exists(f'{path}/S_3.tex'))
+
+        finally:
+            library.db.db.close()
+
+    def test_shelf_order(self):
+        library = Library(dsn=self.dsn)
+        try:
+            library.db.getcursor().execute(
+                "insert into"
+                " shelfcode(shelfcode, shelfcode_description, shelfcode_type)"
+                " values('S', 'Small Books', 'C')")
+            library.shelfcodes.load_from_db()
+
+            # a series shown on the spine goes ahead of the title
+            for line in (
+                    'ODINSON, LOKI<AARDVARK<@ZEBRA<S',
+                    'ODINSON, LOKI<MISCHIEF<TRICKS<S'):
+                library.catalog.add_from_dexline(line)
+
+            shelfcode = library.shelfcodes['S']
+            titles = library.catalog.titles
+            self.assertEqual(
+                ['AARDVARK', 'MISCHIEF'],
+                [title.titletxt for title in titles.iter_book_titles()])
+            shelved = list(titles.iter_shelf_titles(shelfcode))
+            self.assertEqual(
+                ['MISCHIEF', 'AARDVARK'],
+                [title.titletxt for title in shelved])
+            self.assertEqual(
+                sorted(shelved, key=lambda x: x.shelfkey('S')), shelved)
+            self.assertEqual(2, titles.count_book_titles(shelfcode))
+
+        finally:
+            library.db.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
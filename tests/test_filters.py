@@ -0,0 +1,89 @@
+import unittest
+import os
+import sys
+
+testdir = os.path.dirname(__file__)
+srcdir = '../'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from tests.test_setup import Case
+
+from mitsfs.library import Library
+from mitsfs.dex import filters
+from mitsfs.dex.inventory import Inventories
+
+
+class FiltersTest(Case):
+    def test_filters(self):
+        library = Library(dsn=self.dsn)
+        try:
+            library.db.getcursor().execute(
+                "insert into"
+                " shelfcode(shelfcode, shelfcode_description, shelfcode_type)"
+                " values('S', 'Small Books', 'C'), ('R', 'Reference', 'R')")
+            library.db.getcursor().execute(
+                "insert into member(first_name, last_name, email)"
+                " values ('Thor', 'Odinson', 'thor@asgard.com')")
+            library.db.commit()
+            library.shelfcodes.load_from_db()
+            thor = library.members.find('Thor')[0]
+
+            library.catalog.add_from_dexline('ODINSON, THOR<HAMMER<THUNDER<S')
+            library.catalog.add_from_dexline('ODINSON, LOKI<MISCHIEF<TRICKS<S')
+            library.catalog.add_from_dexline(
+                'ODINSON, BALDER<BRIGHTNESS<SHINING<R')
+
+            hammer = library.catalog.grep('<HAMMER')[0].books[0]
+            hammer.checkout(thor)
+            library.db.commit()
+
+            def grep(book_filter, candidate='ODINSON'):
+                return [title.titletxt for title in library.catalog.grep(
+                    candidate, book_filter=book_filter)]
+
+            self.assertEqual(['HAMMER'], grep(filters.OUT))
+            self.assertEqual(['BRIGHTNESS', 'MISCHIEF'], grep(filters.IN))
+            self.assertEqual(['MISCHIEF', 'HAMMER'],
+                             grep(filters.CIRCULATING))
+            self.assertEqual(['MISCHIEF'],
+                             grep(filters.IN & filters.CIRCULATING))
+            self.assertEqual(
+                ['BRIGHTNESS'],
+                grep(filters.in_shelfcode(library.shelfcodes['R'])))
+            self.assertEqual(['MISCHIEF'], grep(
+                filters.IN & filters.CIRCULATING, 'ODINSON<<<S'))
+            self.assertEqual(
+                ['HAMMER'],
+                [title.titletxt for title in library.catalog.fuzzy(
+                    'ODINSON THOR', book_filter=filters.OUT)])
+            self.assertNotIn(
+                'HAMMER',
+                [title.titletxt for title in library.catalog.fuzzy(
+                    'ODINSON THOR', book_filter=filters.IN)])
+
+            # the same filters work on books in hand
+            self.assertTrue(filters.OUT(hammer))
+            self.assertFalse(filters.IN(hammer))
+            self.assertTrue((filters.OUT & filters.CIRCULATING)(hammer))
+            self.assertFalse(
+                filters.in_shelfcode(library.shelfcodes['R'])(hammer))
+
+            # missing in an inventory
+            inventories = Inventories(library.db)
+            inventories.create('test inventory', library.shelfcodes)
+            library.reset_inventory()
+            library.inventory.report_missing_book(hammer)
+            missing = filters.missing(library.inventory)
+            self.assertEqual(['HAMMER'], grep(missing))
+            self.assertTrue(missing(hammer))
+            self.assertEqual([], grep(filters.missing(
+                library.inventory, library.shelfcodes['R'])))
+            library.inventory.find_book(hammer)
+            self.assertEqual([], grep(missing))
+
+        finally:
+            library.db.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,6 +9,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
 from tests.test_setup import Case
 
 from mitsfs.library import Library
+from mitsfs.dex import catalog
 
 
 class IndexesTest(Case):
@@ -165,6 +166,8 @@ class IndexesTest(Case):
                                 loki_name)))
 
             self.assertEqual(2, len(library.catalog.authors.keys()))
+            self.assertEqual(library.catalog.authors.keys(),
+                             list(library.catalog.authors.iterkeys()))
 
             # test the title index
 
@@ -289,6 +292,66 @@ class IndexesTest(Case):
                              len(library.catalog.grep('<<<')))
             self.assertEqual(10,
                              len(library.catalog.grep('<<<S')))
+            self.assertEqual(0,
+                             len(library.catalog.grep('<<<NOSUCHCODE')))
+            self.assertEqual(2,
+                             len(library.catalog.grep('ODIN<<<S,L', 2)))
+            self.assertEqual(
+                [t.id for t in library.catalog.grep('ODINSON')][:3],
+                [t.id for t in library.catalog.grep('ODINSON', limit=3)])
+            self.assertEqual(
+                [t.id for t in library.catalog.grep('ODINSON')][:3],
+                [t.id for t in library.catalog.search('odinson', limit=3)])
+
+            # fuzzy searching
+            self.assertEqual(
+                10, len(library.catalog.fuzzy('<<MIDGARD CHRONICLS')))
+            self.assertEqual(
+                3, len(library.catalog.fuzzy('MIDGARD CHRONICLS', limit=3)))
+            self.assertEqual(
+                1, len(library.catalog.fuzzy('<<MIDGARD CHRONICLS<L')))
+            self.assertEqual(
+                titleids[5],
+                library.catalog.fuzzy('ODINSON, LOKY<BOOK5')[0].id)
+            self.assertEqual(
+                [t.id for t in library.catalog.grep('OF MIS')],
+                [t.id for t in library.catalog.search('OF MIS')])
+            self.assertEqual(
+                [titleids[8]],
+                [t.id for t in library.catalog.search(
+                    'BOOK EIGTH', catalog.FUZZY, 1)])
+
+            # bulk loading should match the lazily loaded titles
+            from mitsfs.dex.titles import Title
+            loaded = library.catalog.titles.book_titles()
+            self.assertEqual(10, len(loaded))
+            for title in loaded:
+                lazy = Title(library.db, title.id)
+                self.assertEqual(str(lazy), str(title))
+                self.assertEqual(str(lazy.codes), str(title.codes))
+                # the server's sort keys should match the ones DexLine makes
+                self.assertEqual(lazy.sortkey()[0], title.sortkey()[0])
+                self.assertEqual(lazy.shelfkey('S'), title.shelfkey('S'))
+            self.assertEqual(
+                'L,S', str(library.catalog.titles.load([titleids[3]])[0].codes))
+            self.assertEqual(
+                1, len(library.catalog.titles.book_titles(
+                    library.shelfcodes['L'])))
+            self.assertEqual([], library.catalog.titles.load([]))
+
+            # renaming an author updates the sort keys of their books
+            library.db.getcursor().execute(
+                "update entity set entity_name = 'AAA, THOR'"
+                " where entity_id = %s", (thor,))
+            self.assertEqual('AAA THOR', library.db.getcursor().selectvalue(
+                'select sortkey_author from title_sortkey where title_id = %s',
+                (titleids[1],)))
+            self.assertEqual(
+                [t.id for t in loaded],
+                [t.id for t in library.catalog.titles.iter_book_titles()])
+            self.assertEqual(
+                sorted(library.catalog.titles.keys()),
+                sorted(library.catalog.titles.iterkeys()))
         finally:
             library.db.db.close()
 
@@ -1,6 +1,7 @@
 import unittest
 import os
 import sys
+import tempfile
 
 testdir = os.path.dirname(__file__)
 srcdir = '../'
@@ -9,6 +10,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
 from tests.test_setup import Case
 
 from mitsfs.library import Library
+from mitsfs.dex import export
 from mitsfs.circulation.members import Member
 from mitsfs.dex.series import Series
 from mitsfs.dex.authors import Author
@@ -18,7 +20,7 @@ from mitsfs.dex.titles import Title, sanitize_title
 from mitsfs.util import exceptions
 
 from mitsfs.dex.inventory import Inventories, Inventory, InventorySection, \
-    InventorySections, INVENTORY_SIZE
+    InventorySections, SectionScan, INVENTORY_SIZE
 
 # Titles are tested in test_indexes.py
 class InventoryTest(Case):
@@ -80,6 +82,45 @@ class InventoryTest(Case):
             self.assertEqual(10, open_inv.stats(shelf_s))
             self.assertEqual(10, open_inv.stats(shelf_l))
 
+            # the sections were worked out when it was opened
+            self.assertEqual(550, len(open_inv.sections.books(shelf_s)))
+            self.assertEqual(
+                [275, 275],
+                [len(open_inv.sections.books(shelf_s, i)) for i in (1, 2)])
+            section = open_inv.sections.get(shelf_s, 2)[0]
+            self.assertTrue(section.first_title.startswith('AUTHOR<SMALL'))
+            self.assertTrue(section.last_title.startswith('AUTHOR<SMALL'))
+            book = library.catalog.grep('AUTHOR<LARGE1<')[0].books[0]
+            self.assertEqual(('L', 1), open_inv.sections.section_of(book))
+            self.assertEqual({('L', 1): (50, 10)},
+                             open_inv.sections.missing_counts(shelf_l))
+            self.assertEqual(
+                20, sum(missing for (_, missing)
+                        in open_inv.sections.missing_counts().values()))
+
+            with tempfile.TemporaryDirectory() as path:
+                self.assertEqual(
+                    2, export.inventory_files(open_inv, shelf_s, path))
+                for i in (1, 2):
+                    with open(f'{path}/S_{i}.tex') as fp:
+                        self.assertEqual(275, fp.read().count(r'\Book{'))
+                with open(f'{path}/S_2.tex') as fp:
+                    serial = fp.read()
+                self.assertIn(section.first_title, serial)
+
+            # the same files from worker processes
+            with tempfile.TemporaryDirectory() as path:
+                messages = []
+                self.assertEqual(
+                    {'S': 2, 'L': 1},
+                    export.parallel_inventory_files(
+                        open_inv, [shelf_s, shelf_l], path, processes=2,
+                        progress=messages.append))
+                with open(f'{path}/S_2.tex') as fp:
+                    self.assertEqual(serial, fp.read())
+                self.assertEqual(2, len([m for m in messages
+                                         if ' done (' in m]))
+
             for i in range(1, 6):
                 book = library.catalog.grep(
                     f'AUTHOR<SMALL{i}')[0].books[0]
@@ -116,13 +157,70 @@ class InventoryTest(Case):
             
             open_inv.sections.complete_section(shelf_s, 1)
             self.assertTrue(open_inv.sections.get(shelf_s, 1)[0].complete)
+
+            # the whole picture in one go
+            progress = open_inv.progress()
+            self.assertEqual(
+                {'L': (0, 1, 10), 'S': (1, 2, 5), 'SA': (0, 2, 0)},
+                progress.shelfcodes)
+            self.assertEqual((1, 5, 15),
+                             (progress.done, progress.total, progress.missing))
+            s1 = progress.get(shelf_s)[0]
+            self.assertEqual('Odinson, Thor', s1.member_name)
+            self.assertEqual(275, s1.books)
+            self.assertEqual(
+                5, sum(section.missing for section in progress.get(shelf_s)))
+            self.assertIsNone(progress.get(shelf_l)[0].member_name)
+            # kept until something changes
+            self.assertIs(progress, open_inv.progress())
+            open_inv.sections.complete_section(shelf_l, 1)
+            self.assertEqual((1, 1, 10), open_inv.progress().shelfcodes['L'])
             
             
+            # scanning a section
+            l_books = [book_id for (_, _, book_id, _)
+                       in open_inv.sections.books(shelf_l)]
+            missing_ids = {
+                book.id for book in open_inv.get_missing_books(shelf_l)}
+            large11 = library.catalog.grep('^AUTHOR$<^LARGE11$')[0].books[0]
+            open_inv.report_missing_book(large11)
+            small20 = library.catalog.grep('^AUTHOR$<^SMALL20$')[0].books[0]
+            library.db.getcursor().execute(
+                'insert into barcode(book_id, barcode)'
+                " values (%s, '0000000011'), (%s, '0000000020')",
+                (large11.id, small20.id))
+            library.db.commit()
+
+            scan = SectionScan(open_inv, shelf_l, 1)
+            self.assertEqual(set(l_books), scan.expected)
+            for book_id in l_books:
+                if book_id not in missing_ids and book_id != large11.id:
+                    self.assertTrue(scan.scan(f' {book_id}\n'))
+            self.assertTrue(scan.scan('0000000011'))
+            self.assertFalse(scan.scan('0000000020'))
+            self.assertFalse(scan.scan('nonsense'))
+            self.assertEqual(missing_ids, scan.missing)
+
+            strays = scan.complete()
+            self.assertEqual(
+                [('0000000020', open_inv.sections.section_of(small20)),
+                 ('nonsense', None)],
+                strays)
+            self.assertEqual(10, open_inv.stats(shelf_l))
+            self.assertNotIn(large11, open_inv.get_missing_books(shelf_l))
+            self.assertTrue(open_inv.sections.get(shelf_l, 1)[0].complete)
+
             old_counts = library.shelfcodes.stats()
             self.assertEqual(550, old_counts['S'])
             self.assertEqual(50, old_counts['L'])
             
-            open_inv.close()
+            withdrawn = open_inv.close()
+            self.assertEqual(['L'] * 10 + ['S'] * 5,
+                             [code for (code, _) in withdrawn])
+            self.assertIn(('S', 'AUTHOR<SMALL10<SERIES<S'), withdrawn)
+            self.assertIn(('L', 'AUTHOR<LARGE1<SERIES<L'), withdrawn)
+            self.assertIsNotNone(Inventory(library.db, open_inv.id).close_date)
+            self.assertEqual(None, inv.get_open())
 
             new_counts = library.shelfcodes.stats()
             self.assertEqual(545, new_counts['S'])
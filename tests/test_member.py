@@ -106,6 +106,27 @@ class DexDBTest(Case):
             self.assertEqual('hela@asgard.com', hela.email)
             self.assertEqual('Hela', hela.first_name)
 
+            # reading one field loads the whole row
+            hela = Member(db, hela_id)
+            self.assertEqual('Hela', hela.first_name)
+            self.assertEqual('Nifelheim', hela.cache['address'])
+
+            # until the cache is reset, changes made behind its back
+            # aren't seen
+            db.getcursor().execute(
+                "update member set address = 'Hel' where member_id = %s",
+                (hela_id,))
+            self.assertEqual('Nifelheim', hela.address)
+            hela.cache_reset()
+            self.assertEqual('Hel', hela.address)
+
+            # bulk loading keeps the order of the ids passed in
+            loaded = Member.load_many(db, [loki_id, hela_id, 999999])
+            self.assertEqual(['Loki', 'Hela', None],
+                             [m.cache['first_name'] for m in loaded])
+            self.assertEqual('Asgard', loaded[0].address)
+            self.assertEqual([], Member.load_many(db, []))
+
         finally:
             db.db.close()
 
@@ -10,6 +10,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
 from mitsfs.library import Library
 
 from mitsfs.circulation.membership import Membership
+from mitsfs.circulation.members import Member
 
 from tests.test_setup import Case
 
@@ -100,6 +101,14 @@ class DexDBTest(Case):
             self.assertEqual(-100, new.cost)
             self.assertIn("Expires: Never", str(new))
 
+            # the member summary picks up the latest one
+            summary = Member(library.db, member_id).summary()
+            self.assertEqual(membership_id, summary.membership.id)
+            self.assertEqual('Life', summary.membership_description)
+            self.assertFalse(summary.membership.expired)
+            self.assertEqual(110, summary.balance)
+            self.assertEqual(0, len(summary.out))
+
             # TODO: test a voided transaction
 
         finally:
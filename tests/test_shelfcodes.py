@@ -84,6 +84,19 @@ class TestShelfcodes(Case):
             # test coerce_shelfcode
             self.assertEqual('S', coerce_shelfcode(s_id, db).code)
             self.assertEqual('L', coerce_shelfcode(l_id, db).code)
+            # deprecated shelfcodes aren't in the index
+            self.assertEqual(None, coerce_shelfcode(sfwa_id, db))
+
+            # the id index follows the shelfcode dict
+            self.assertEqual('S', s.get_by_id(s_id).code)
+            self.assertEqual(None, s.get_by_id(sfwa_id))
+            db.getcursor().execute(
+                "update shelfcode set shelfcode_type = 'D'"
+                " where shelfcode_id = %s", (s_id,))
+            s.load_from_db()
+            self.assertEqual(None, s.get_by_id(s_id))
+            self.assertNotIn('S', s)
+            self.assertEqual('L', s.get_by_id(l_id).code)
 
             # test uncoerce_shelfcode
             x = s['L']
@@ -0,0 +1,117 @@
+import unittest
+import os
+import sys
+
+testdir = os.path.dirname(__file__)
+srcdir = '../'
+sys.path.insert(0, os.path.abspath(os.path.join(testdir, srcdir)))
+
+from tests.test_setup import Case
+
+from mitsfs.library import Library
+from mitsfs.dex.snapshot import parse_change
+
+
+class ParseChangeTest(unittest.TestCase):
+    def test_parse_change(self):
+        event, table, values = parse_change(
+            'UPDATE book\n'
+            'title_id 1\n12\n'
+            'title_id 1\n34\n'
+            'comment 2\nline one\nline two\n'
+            'empty 1\n\n')
+        self.assertEqual('UPDATE', event)
+        self.assertEqual('book', table)
+        self.assertEqual(['12', '34'], values['title_id'])
+        self.assertEqual(['line one\nline two'], values['comment'])
+        self.assertEqual([''], values['empty'])
+
+        self.assertEqual(('DELETE', 'title', {}),
+                         parse_change('DELETE title\n'))
+
+
+class SnapshotTest(Case):
+    def test_snapshot(self):
+        library = Library(dsn=self.dsn)
+        try:
+            library.db.getcursor().execute(
+                "insert into"
+                " shelfcode(shelfcode, shelfcode_description, shelfcode_type)"
+                " values('S', 'Small Books', 'C'), ('L', 'Large Books', 'C')")
+            library.shelfcodes.load_from_db()
+
+            library.catalog.add_from_dexline('ODINSON, THOR<HAMMER<THUNDER<S')
+            library.catalog.add_from_dexline('ODINSON, LOKI<MISCHIEF<TRICKS<L')
+
+            snapshot = library.snapshot
+            self.assertEqual(2, len(snapshot))
+            self.assertEqual(
+                ['ODINSON, LOKI<MISCHIEF<TRICKS<L',
+                 'ODINSON, THOR<HAMMER<THUNDER<S'],
+                [str(title) for title in snapshot])
+
+            # nothing has changed
+            self.assertEqual(0, snapshot.refresh())
+
+            # a new title shows up
+            library.catalog.add_from_dexline(
+                'ASGARD, HEIMDALL<BRIDGE<BIFROST<S')
+            # not until we ask for it
+            self.assertIs(snapshot, library.snapshot)
+            self.assertEqual(2, len(snapshot))
+            self.assertEqual(1, snapshot.refresh())
+            self.assertEqual(3, len(snapshot))
+            self.assertEqual('ASGARD, HEIMDALL<BRIDGE<BIFROST<S',
+                             str(list(snapshot)[0]))
+
+            # renaming an author changes their titles
+            library.db.getcursor().execute(
+                "update entity set entity_name = 'LAUFEYSON, LOKI'"
+                " where entity_name = 'ODINSON, LOKI'")
+            library.db.commit()
+            self.assertEqual(1, snapshot.refresh())
+            self.assertEqual(
+                ['ASGARD, HEIMDALL', 'LAUFEYSON, LOKI', 'ODINSON, THOR'],
+                [title.authortxt for title in snapshot])
+
+            # withdrawing the last book takes the title out
+            library.db.getcursor().execute(
+                "update book set withdrawn = true"
+                " where title_id in (select title_id from title_title"
+                "  where title_name = 'HAMMER')")
+            library.db.commit()
+            snapshot.refresh()
+            self.assertEqual(2, len(snapshot))
+
+            # the titles are only made when they're handed out
+            loki = snapshot.grep('LOKI')[0]
+            self.assertIn(loki.id, snapshot)
+            self.assertIsNot(loki, snapshot[loki.id])
+            self.assertEqual(str(loki), str(snapshot[loki.id]))
+            self.assertEqual('MISCHIEF', loki.titletxt)
+
+            # searching
+            self.assertEqual(1, len(snapshot.grep('LOKI')))
+            self.assertEqual(1, len(snapshot.grep('BIFR')))
+            self.assertEqual(1, len(snapshot.grep('<<<S')))
+            self.assertEqual(0, len(snapshot.grep('<<<')))
+            self.assertEqual(1, len(snapshot.grep('ASG<BRI<BIF<S')))
+            self.assertEqual(0, len(snapshot.grep('ASG<BRI<BIF<L')))
+            self.assertEqual(
+                1, len(list(snapshot.iter_book_titles(
+                    library.shelfcodes['L']))))
+
+            # deprecating a shelfcode reloads everything
+            library.db.getcursor().execute(
+                "update shelfcode set shelfcode_type = 'D'"
+                " where shelfcode = 'L'")
+            library.db.commit()
+            self.assertEqual(len(snapshot), snapshot.refresh())
+            self.assertEqual(0, len(snapshot.grep('<<<L')))
+
+        finally:
+            library.db.db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -50,6 +50,15 @@ class DexDBTest(Case):
             self.assertEqual(today,
                              tw.warp_date(three_weeks_ago))
 
+            # the overlapping pair is one interval
+            self.assertEqual([five_weeks_ago, three_weeks_ago], tw.starts)
+            self.assertEqual([four_weeks_ago, today], tw.ends)
+            self.assertEqual(
+                [today, six_weeks_ago, four_weeks_ago, today, today],
+                tw.warp_dates([three_weeks_ago, six_weeks_ago,
+                               five_weeks_ago, one_week_ago,
+                               three_weeks_ago]))
+
             expected_regex = r'Timewarp\([-0-9: \.]+ - [-0-9: \.]+\)'
             self.assertRegex(str(tw[0]), expected_regex)
 
@@ -87,6 +87,16 @@ class TransactionsTest(Case):
             transactions = get_transactions(library.db, thor.id,
                                             include_voided=False)
             self.assertEqual(1, len(transactions))
+            self.assertEqual(tx2.id, transactions[0].id)
+            self.assertFalse(transactions[0].voided)
+
+            # the history comes back with the links and the voided flag
+            transactions = get_transactions(library.db, thor.id)
+            self.assertEqual([True, False, True],
+                             [tx.voided for tx in transactions])
+            self.assertEqual([[transactions[2].id], [], [tx1.id]],
+                             [[i.id for i in tx.linked_transaction]
+                              for tx in transactions])
 
             tx3 = CashTransaction(library.db, thor.id, thor.normal_str,
                                   amount=100, transaction_type='M',
@@ -151,6 +161,23 @@ class TransactionsTest(Case):
             result = r.fetchall()
             self.assertEqual(3, len(result))
 
+            # the running balance keeps up with all of that
+            self.assertEqual(
+                sum(tx.amount for tx in get_transactions(library.db, thor.id)),
+                thor.balance)
+            self.assertEqual([], library.members.verify_balances())
+
+            library.db.getcursor().execute(
+                'update member_balance set balance = 0 where member_id = %s',
+                (thor.id,))
+            library.db.commit()
+            self.assertEqual(0, thor.balance)
+            wrong = library.members.verify_balances(repair=True)
+            self.assertEqual([thor.id], [member_id for (member_id, _, _)
+                                         in wrong])
+            self.assertEqual([], library.members.verify_balances())
+            self.assertEqual(wrong[0][2], thor.balance)
+
         finally:
             library.db.db.close()
 